@@ -3,4 +3,8 @@ DROP TABLE dim_users;
 DROP TABLE dim_card_details;
 DROP TABLE dim_store_details;
 DROP TABLE dim_products;
-DROP TABLE dim_date_times;
\ No newline at end of file
+DROP TABLE dim_date_times;
+DROP TABLE IF EXISTS agg_sales_daily;
+DROP TABLE IF EXISTS agg_sales_monthly;
+DROP TABLE IF EXISTS agg_sales_store_type;
+DROP TABLE IF EXISTS agg_sales_state;
\ No newline at end of file
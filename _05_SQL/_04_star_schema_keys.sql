@@ -0,0 +1,25 @@
+-- Milestone 3: Complete the star-schema of tables uploaded with their final data types (typed_upload in main.py)
+-- The columns are already cast and the dim_products and dim_store_details columns matched, so Tasks 1 to 7 of
+-- _01_star_schema_sales_data.sql are not needed; only the keys are added.
+
+-- Task 8
+-- Create primary key in the dimensions tables
+ALTER TABLE dim_date_times
+    ADD PRIMARY KEY (date_uuid); 
+ALTER TABLE dim_users
+    ADD PRIMARY KEY (user_uuid);
+ALTER TABLE dim_store_details
+    ADD PRIMARY KEY (store_code);
+ALTER TABLE dim_products
+    ADD PRIMARY KEY (product_code);
+ALTER TABLE dim_card_details
+    ADD PRIMARY KEY (card_number);
+
+-- Task 9
+-- Create foreign key constraints to finalise the star-schema
+ALTER TABLE orders_table
+    ADD CONSTRAINT fk_orders_date FOREIGN KEY (date_uuid) REFERENCES dim_date_times(date_uuid),
+    ADD CONSTRAINT fk_orders_user FOREIGN KEY (user_uuid)  REFERENCES dim_users(user_uuid),
+    ADD CONSTRAINT fk_orders_store FOREIGN KEY (store_code) REFERENCES dim_store_details(store_code),
+    ADD CONSTRAINT fk_orders_product FOREIGN KEY (product_code) REFERENCES dim_products(product_code),
+    ADD CONSTRAINT fk_orders_card FOREIGN KEY (card_number) REFERENCES dim_card_details(card_number);
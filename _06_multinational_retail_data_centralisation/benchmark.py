@@ -0,0 +1,67 @@
+from _06_multinational_retail_data_centralisation.synthetic_data import SyntheticDataGenerator
+
+import json # to save and compare the results
+import os # to check for earlier results
+import time # to date the results
+
+
+class Benchmark:
+    """
+    A base class for the benchmarks of the pipeline, see cleaning_benchmark, extraction_benchmark, load_benchmark, query_benchmark, staging_benchmark and startup_benchmark.
+    Every benchmark saves its results to the same JSON file, keyed by what was measured, and prints each result next to the result
+    of the previous run, so that regressions show up.
+    """
+    def __init__(self, generator: SyntheticDataGenerator = None, repeats: int = 3, results_path: str = 'benchmark_results.json'):
+        """
+        Args:
+            generator (SyntheticDataGenerator): Generates the raw tables. Defaults to one seeded from '_01_raw_tables_csv'.
+            repeats (int): Number of timed runs of each measurement; the fastest is kept.
+            results_path (str): Path of the JSON file the results are saved to.
+        """
+        self.generator = generator or SyntheticDataGenerator()
+        self.repeats = repeats
+        self.results_path = results_path
+
+    @staticmethod
+    def describe_result(result_key: str, result: dict, previous_result: dict = None):
+        """
+        The describe_result function formats a result for printing, flagging runs more than 20% slower than the previous run.
+
+        Args:
+            result_key (str): What was measured, e.g. '<cleaner>@<rows>'.
+            result (dict): Wall time in seconds and peak memory allocated in bytes, and optionally the memory used by the input in bytes.
+            previous_result (dict): Result of the previous run, if any.
+
+        Returns:
+            str: Line describing the result.
+        """
+        description = f"{result_key:<48} {result['wall_time']:>10.4f}s {result['peak_memory_bytes'] / 1024 ** 2:>10.1f} MiB"
+        if result.get('input_bytes'):
+            description += f" ({result['peak_memory_bytes'] / result['input_bytes']:.2f}x input)"
+        if previous_result:
+            ratio = result['wall_time'] / previous_result['wall_time'] if previous_result['wall_time'] else float('inf')
+            description += f"  ({ratio:.2f}x previous{', REGRESSION' if ratio > 1.2 else ''})"
+        return description
+
+    def load_results(self):
+        """
+        The load_results function reads the results of the previous run.
+
+        Returns:
+            dict: Results of the previous run, or an empty dict if there are none.
+        """
+        if not os.path.exists(self.results_path):
+            return {}
+        with open(self.results_path, 'r') as results_file:
+            return json.load(results_file)['results']
+
+    def save_results(self, results: dict):
+        """
+        The save_results function writes the results to the results file.
+
+        Args:
+            results (dict): What was measured -> result.
+        """
+        with open(self.results_path, 'w') as results_file:
+            json.dump({'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, results_file, indent=2)
+        print(f"Saved the benchmark results as '{self.results_path}'.")
@@ -0,0 +1,178 @@
+from _06_multinational_retail_data_centralisation.benchmark import Benchmark
+from _06_multinational_retail_data_centralisation.data_cleaning import DataCleaning as dcl
+from _06_multinational_retail_data_centralisation.synthetic_data import SyntheticDataGenerator
+
+import argparse # command line entry point
+import time # to time each cleaner
+import tracemalloc # to measure the memory allocated by each cleaner
+
+
+class CleaningBenchmark(Benchmark):
+    """
+    A utility class for measuring how the DataCleaning functions scale with the number of rows.
+    Each cleaner is run on synthetic raw tables of increasing size, recording its best wall time and the peak memory it allocated,
+    also as a multiple of the memory used by its input.
+    The results are saved as JSON and compared with those of the previous run, so that regressions show up.
+    """
+    # Cleaner name -> SyntheticDataGenerator method giving its raw table
+    cleaners = {'clean_user_data': 'legacy_users',
+                'clean_card_data': 'card_details',
+                'called_clean_store_data': 'store_details',
+                'clean_products_data': 'products_details',
+                'convert_product_weights': 'products_details',
+                'clean_orders_data': 'orders_table',
+                'clean_date_data': 'date_details'}
+    # Cleaners that parse date columns with DataCleaning.normalise_dates, and can report on it
+    date_cleaners = ('clean_user_data', 'clean_card_data', 'clean_products_data')
+
+    def __init__(self, generator: SyntheticDataGenerator = None, repeats: int = 3, results_path: str = 'benchmark_results.json', inplace: bool = False,
+                 report_dates: bool = False):
+        """
+        Args:
+            generator (SyntheticDataGenerator): Generates the raw tables. Defaults to one seeded from '_01_raw_tables_csv'.
+            repeats (int): Number of timed runs of each cleaner; the fastest is kept.
+            results_path (str): Path of the JSON file the results are saved to.
+            inplace (bool): Whether to run the cleaners in place, as the pipeline does.
+            report_dates (bool): Whether to run the date cleaners once more with report_dates, printing the rows of each date column
+                parsed by format and by fallback and the time taken. The report is not part of the timed runs.
+        """
+        super().__init__(generator, repeats, results_path)
+        self.inplace = inplace
+        self.report_dates = report_dates
+
+    def measure(self, cleaner_name: str, raw_df):
+        """
+        The measure function times a cleaner on a raw table, then runs it once more under tracemalloc for its peak memory.
+        Each run is given its own copy of the table, as some cleaners change the DataFrame they are given.
+        With report_dates, a date cleaner is then run a last time to print how each of its date columns was parsed.
+
+        Args:
+            cleaner_name (str): Name of the DataCleaning function.
+            raw_df (pd.DataFrame): Raw table to clean.
+
+        Returns:
+            dict: Best wall time in seconds, peak memory allocated in bytes, memory used by the input in bytes and number of rows out.
+        """
+        clean_data = getattr(dcl, cleaner_name)
+        wall_times = []
+        for _ in range(self.repeats):
+            table_copy = raw_df.copy()
+            start_time = time.perf_counter()
+            cleaned_df = clean_data(table_copy, inplace=self.inplace)
+            wall_times.append(time.perf_counter() - start_time)
+
+        table_copy = raw_df.copy()
+        tracemalloc.start()
+        clean_data(table_copy, inplace=self.inplace)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if self.report_dates and cleaner_name in self.date_cleaners:
+            clean_data(raw_df.copy(), inplace=self.inplace, report_dates=True)
+
+        return {'wall_time': round(min(wall_times), 6), 'peak_memory_bytes': peak_memory,
+                'input_bytes': int(raw_df.memory_usage(deep=True).sum()), 'rows_out': len(cleaned_df)}
+
+    def run(self, sizes: list = None, cleaner_names: list = None):
+        """
+        The run function benchmarks the cleaners at each table size, prints the results next to those of the previous run,
+        and saves them.
+
+        Args:
+            sizes (list): Numbers of rows to benchmark, defaults to 10,000, 100,000 and 1,000,000.
+            cleaner_names (list): Cleaners to benchmark, defaults to all of them.
+
+        Returns:
+            dict: '<cleaner>@<rows>' -> result of measure.
+        """
+        sizes = sizes or [10_000, 100_000, 1_000_000]
+        cleaner_names = cleaner_names or list(self.cleaners)
+        previous_results = self.load_results()
+        results = {}
+
+        for number_of_rows in sizes:
+            raw_tables = {}  # Generated once per size and shared by the cleaners of the same table
+            for cleaner_name in cleaner_names:
+                table_name = self.cleaners[cleaner_name]
+                if table_name not in raw_tables:
+                    raw_tables[table_name] = getattr(self.generator, table_name)(number_of_rows)
+                result_key = f"{cleaner_name}@{number_of_rows}{'/inplace' if self.inplace else ''}"
+                results[result_key] = self.measure(cleaner_name, raw_tables[table_name])
+                print(self.describe_result(result_key, results[result_key], previous_results.get(result_key)))
+
+        self.save_results({**previous_results, **results})  # Keep the results of sizes and cleaners not run this time
+        return results
+
+    def run_reject_mask(self, sizes: list = None):
+        """
+        The run_reject_mask function times the mask of the rejected users found three ways: with the reject pattern run on every row
+        of 'first_name', 'last_name' and 'country', as the original clean_user_data did; once per distinct value of each column;
+        and with DataCleaning.rejected_rows, once per distinct value of the three columns stacked.
+        It checks that they give the same mask, prints the speed-ups over the first and saves the results.
+
+        Args:
+            sizes (list): Numbers of rows of the generated legacy_users tables, defaults to 100,000 and 1,000,000.
+
+        Returns:
+            dict: 'reject_mask@<rows>/<per_row, per_column or stacked>' -> best wall time in seconds and number of rejected rows.
+        """
+        column_names = ['first_name', 'last_name', 'country']
+
+        def per_row_mask(raw_df):
+            rejected = raw_df[column_names[0]].astype(str).str.contains(r'\d|NULL')
+            for column_name in column_names[1:]:
+                rejected = rejected | raw_df[column_name].astype(str).str.contains(r'\d|NULL')
+            return rejected
+
+        def per_column_mask(raw_df):
+            def is_rejected(values):
+                return values.astype(str).str.contains(dcl.user_reject_pattern)
+            rejected = dcl.map_distinct_values(raw_df[column_names[0]], is_rejected)
+            for column_name in column_names[1:]:
+                rejected = rejected | dcl.map_distinct_values(raw_df[column_name], is_rejected)
+            return rejected
+
+        def stacked_mask(raw_df):
+            return dcl.rejected_rows(raw_df, column_names, dcl.user_reject_pattern)
+
+        previous_results = self.load_results()
+        results = {}
+
+        for number_of_rows in sizes or [100_000, 1_000_000]:
+            raw_df = self.generator.legacy_users(number_of_rows)
+            masks = {}
+            for method_name, make_mask in [('per_row', per_row_mask), ('per_column', per_column_mask), ('stacked', stacked_mask)]:
+                wall_times = []
+                for _ in range(self.repeats):
+                    start_time = time.perf_counter()
+                    masks[method_name] = make_mask(raw_df)
+                    wall_times.append(time.perf_counter() - start_time)
+
+                result_key = f"reject_mask@{number_of_rows}/{method_name}"
+                results[result_key] = {'wall_time': round(min(wall_times), 6), 'peak_memory_bytes': 0, 'rows_out': int(masks[method_name].sum())}
+                print(self.describe_result(result_key, results[result_key], previous_results.get(result_key)))
+
+            assert masks['per_row'].equals(masks['per_column']) and masks['per_row'].equals(masks['stacked']), 'The masks reject different rows'
+            per_row_time = results[f"reject_mask@{number_of_rows}/per_row"]['wall_time']
+            print(f"reject_mask@{number_of_rows}: per column {per_row_time / results[f'reject_mask@{number_of_rows}/per_column']['wall_time']:.1f}x, "
+                  f"stacked {per_row_time / results[f'reject_mask@{number_of_rows}/stacked']['wall_time']:.1f}x as fast as per row")
+
+        self.save_results({**previous_results, **results})
+        return results
+
+
+if __name__ == "__main__":
+    # e.g. python -m _06_multinational_retail_data_centralisation.cleaning_benchmark 10000 100000 1000000 10000000
+    # or   python -m _06_multinational_retail_data_centralisation.cleaning_benchmark --inplace 10000 100000
+    # or   python -m _06_multinational_retail_data_centralisation.cleaning_benchmark --reject-mask 100000 1000000
+    # or   python -m _06_multinational_retail_data_centralisation.cleaning_benchmark --report-dates 100000
+    parser = argparse.ArgumentParser(description = 'Time the DataCleaning functions on generated tables of increasing size.')
+    parser.add_argument('sizes', type = int, nargs = '*', help = 'numbers of rows, 10,000, 100,000 and 1,000,000 by default')
+    parser.add_argument('--inplace', action = 'store_true', help = 'run the cleaners in place, as main.py does')
+    parser.add_argument('--reject-mask', action = 'store_true', help = 'only time the mask of rejected users, per row, per column and stacked')
+    parser.add_argument('--report-dates', action = 'store_true', help = 'also print the rows of each date column parsed by format and by fallback, and the time taken')
+    arguments = parser.parse_args()
+    if arguments.reject_mask:
+        CleaningBenchmark().run_reject_mask(sizes = arguments.sizes or None)
+    else:
+        CleaningBenchmark(inplace = arguments.inplace, report_dates = arguments.report_dates).run(sizes = arguments.sizes or None)
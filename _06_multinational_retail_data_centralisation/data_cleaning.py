@@ -1,10 +1,10 @@
 from dateutil.parser import parse # to help with datatime edits
-from IPython.display import display
 # from _06_multinational_retail_data_centralisation.database_utils import DatabaseConnector as dc
 
 import numpy as np
 import pandas as pd
 import re
+import time # to time date parsing
 # import nbformat
 # import plotly.express as px
 # import missingno as msno
@@ -15,44 +15,183 @@ class DataCleaning:
     """
     A class containing static methods to clean different types of data.
     """
+    # Date formats found in the raw tables, most common first
+    date_formats = ['%Y-%m-%d', '%Y/%m/%d', '%Y %B %d', '%B %Y %d']
+    # Time periods of the valid date events
+    time_period_pattern = re.compile('Evening|Morning|Midday|Late_Hours')
+
+    @staticmethod
+    def parse_date(date_string: str):
+        """
+        The parse_date function parses a date string of any format with dateutil.
+
+        Args:
+            date_string (str): The date string to parse.
+
+        Returns:
+            datetime.datetime: The parsed date, or NaT if the string is not a date.
+        """
+        try:
+            return parse(date_string)
+        except (ValueError, OverflowError, TypeError):
+            return pd.NaT
+
+    @staticmethod
+    def normalise_dates(dates, formats: list = None, verbose: bool = False):
+        """
+        The normalise_dates function converts a column of date strings to datetime.
+        Each of the known formats is tried in turn with a vectorised pd.to_datetime pass over the rows not yet parsed.
+        Only the rows that match none of the formats fall through to the slower parse_date, which parses each of their distinct strings once.
+
+        Args:
+            dates (pandas.Series): The column of date strings.
+            formats (list): Formats to try, in order. Defaults to date_formats.
+            verbose (bool): Whether to print the number of rows parsed each way and the time taken. The cleaners only ask for it
+                with report_dates, as they run once per chunk of a streamed table.
+
+        Returns:
+            pandas.Series: The dates as datetime64, with NaT where a value could not be parsed.
+        """
+        start_time = time.perf_counter()
+        formats = DataCleaning.date_formats if formats is None else formats
+
+        normalised_dates = pd.Series(pd.NaT, index=dates.index, dtype='datetime64[ns]', name=dates.name)
+        unparsed = dates.notna().to_numpy()
+        number_of_dates = int(unparsed.sum())
+        for date_format in formats:
+            if not unparsed.any():
+                break
+            parsed_dates = pd.to_datetime(dates[unparsed], format=date_format, errors='coerce')
+            normalised_dates[unparsed] = parsed_dates.to_numpy()
+            unparsed[unparsed] = parsed_dates.isna().to_numpy()  # Keep only the rows this format did not match
+
+        number_of_fallbacks = int(unparsed.sum())
+        if number_of_fallbacks:
+            parsed_dates = pd.to_datetime(DataCleaning.map_distinct_values(dates[unparsed], lambda distinct: distinct.map(DataCleaning.parse_date)), errors='coerce')
+            normalised_dates[unparsed] = parsed_dates.to_numpy()
+
+        if verbose:
+            elapsed_time = time.perf_counter() - start_time
+            print(f"Parsed '{dates.name}': {number_of_dates - number_of_fallbacks} rows by format, {number_of_fallbacks} by fallback in {elapsed_time:.3f}s")
+
+        return normalised_dates
+
+    @staticmethod
+    def map_distinct_values(values, transform):
+        """
+        The map_distinct_values function applies a vectorised transform to each distinct value of a column once, and maps the
+        results back onto the rows. Columns such as names, countries and phone numbers repeat their values many times,
+        so this is much faster than transforming every row.
+
+        Args:
+            values (pandas.Series): The column to transform. Missing values are transformed like any other value.
+            transform (function): Takes and returns a Series of the distinct values.
+
+        Returns:
+            pandas.Series: The transformed column, with the index of values.
+        """
+        codes, distinct_values = pd.factorize(values, use_na_sentinel=False)
+        transformed_values = transform(pd.Series(distinct_values, dtype=object)).to_numpy()
+        return pd.Series(transformed_values[codes], index=values.index, name=values.name)
+
+    @staticmethod
+    def time_period_mask(time_periods):
+        """
+        The time_period_mask function tells which date events have a valid time period: 'Evening', 'Morning', 'Midday' or 'Late_Hours'.
+        It is used by clean_date_data, and by the streaming JSON reader to drop invalid date events as they are read.
+
+        Args:
+            time_periods (pandas.Series): The 'time_period' column.
+
+        Returns:
+            pandas.Series: True for the rows to keep.
+        """
+        return DataCleaning.map_distinct_values(time_periods, lambda distinct: distinct.astype(str).str.contains(DataCleaning.time_period_pattern))
+
+    @staticmethod
+    def select_rows(df, keep, inplace: bool = False):
+        """
+        The select_rows function gives the kept rows of a DataFrame as a frame the cleaning functions own, so its columns can be
+        replaced without changing the input or raising SettingWithCopyWarning. At most one copy of the kept rows is made.
+        When every row is kept no copy is made: with inplace the input itself is returned, otherwise a shallow copy sharing its data.
+        Columns of the result must therefore be replaced whole (df[column] = ...), never written into.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame to select from.
+            keep (pandas.Series): Boolean mask of the rows to keep.
+            inplace (bool): Whether the input may be returned and changed when every row is kept.
+
+        Returns:
+            pandas.DataFrame: The kept rows.
+        """
+        keep = np.asarray(keep, dtype=bool)
+        if keep.all():
+            return df if inplace else df.copy(deep=False)
+        return df.take(np.flatnonzero(keep))
+
+    # Names or countries holding a digit or 'NULL' mark a row of invalid user data
+    user_reject_pattern = re.compile(r'\d|NULL')
+
+    # Characters removed from phone numbers: anything but digits, '(', ')' and '+'
+    phone_number_pattern = re.compile(r'[^0-9()+]+')
+
     @staticmethod
-    def clean_user_data(selected_table_df):
+    def rejected_rows(df, column_names: list, pattern):
+        """
+        The rejected_rows function tells which rows hold a value matching a pattern in any of the given columns.
+        The columns are stacked and factorized together, so the compiled pattern is run once over the distinct values
+        of all of them, rather than once per column; names and countries share many values.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame to scan.
+            column_names (list): Names of the columns to scan.
+            pattern (re.Pattern): Compiled pattern marking a rejected value. Missing values are matched as 'nan'.
+
+        Returns:
+            pandas.Series: True for the rows to reject, with the index of df.
+        """
+        stacked_values = pd.concat([df[column_name] for column_name in column_names], ignore_index=True)
+        codes, distinct_values = pd.factorize(stacked_values, use_na_sentinel=False)
+        distinct_rejected = pd.Series(distinct_values, dtype=object).astype(str).str.contains(pattern).to_numpy(dtype=bool)
+        rejected = distinct_rejected[codes].reshape(len(column_names), len(df)).any(axis=0)  # One row of the mask per column
+        return pd.Series(rejected, index=df.index)
+
+    @staticmethod
+    def clean_user_data(selected_table_df, inplace: bool = False, report_dates: bool = False):
         """
         The clean_user_data function takes in a DataFrame containing user data and returns a cleaned version of the same.
         The function first filters out rows that contain invalid values for 'first_name', 'last_name', or 'country'.
         It then replaces all instances of GGB with GB, converts both date columns to datetime, changes the data type 
         of 'phone_numbers', 'user_uuid' and 'email_address' to string. Also changes data type of 'country', 'country_code' 
         and 'company' to 'category'
+        The invalid rows are found and the phone numbers cleaned with vectorised regular expressions, run once per distinct value.
 
         Args:
             selected_table_df (pandas.DataFrame): The DataFrame containing user data.
+            inplace (bool): Whether the input may be changed and returned instead of copied, see select_rows.
+            report_dates (bool): Whether to print how each date column was parsed and the time taken, see normalise_dates.
 
         Returns:
             pandas.DataFrame: Cleaned user data.
         """
 
-        # filtering mask created
-        condition_to_exclude = (selected_table_df['first_name'].astype(str).str.contains('\d|NULL') |
-                                selected_table_df['last_name'].astype(str).str.contains('\d|NULL') |
-                                selected_table_df['country'].astype(str).str.contains('\d|NULL')
-                                )
-        
-        # Apply the filter and convert the specified columns to string datatype
-        legacy_users_df_filtered = selected_table_df[~condition_to_exclude].astype({'first_name': 'string', 'last_name': 'string', 'country': 'string'})
+        # filtering mask created, scanning each distinct name and country once
+        condition_to_exclude = DataCleaning.rejected_rows(selected_table_df, ['first_name', 'last_name', 'country'],
+                                                          DataCleaning.user_reject_pattern)
 
-        legacy_users_df_filtered['country'] = legacy_users_df_filtered['country'].astype('category')
-            
-        # Replace 'GGB' with 'GB'
-        legacy_users_df_filtered['country_code'] = legacy_users_df_filtered['country_code'].replace({'GGB': 'GB'})
-        legacy_users_df_filtered['country_code'] = legacy_users_df_filtered['country_code'].astype('category')
+        # Apply the filter
+        legacy_users_df_filtered = DataCleaning.select_rows(selected_table_df, ~condition_to_exclude, inplace)
+
+        legacy_users_df_filtered['first_name'] = legacy_users_df_filtered['first_name'].astype('string')
+        legacy_users_df_filtered['last_name'] = legacy_users_df_filtered['last_name'].astype('string')
+        legacy_users_df_filtered['country'] = legacy_users_df_filtered['country'].astype('string').astype('category')
 
-        # 'join_date' and 'date_of_birth'
-        legacy_users_df_filtered['date_of_birth'] = legacy_users_df_filtered['date_of_birth'].apply(parse)
-        legacy_users_df_filtered['join_date'] = legacy_users_df_filtered['join_date'].apply(parse)
+        # Replace 'GGB' with 'GB'
+        legacy_users_df_filtered['country_code'] = legacy_users_df_filtered['country_code'].replace({'GGB': 'GB'}).astype('category')
 
-        # Now, convert both columns to datetime
-        legacy_users_df_filtered['date_of_birth'] = pd.to_datetime(legacy_users_df_filtered['date_of_birth'], errors='coerce')
-        legacy_users_df_filtered['join_date'] = pd.to_datetime(legacy_users_df_filtered['join_date'], errors='coerce')
+        # Convert 'join_date' and 'date_of_birth' to datetime
+        legacy_users_df_filtered['date_of_birth'] = DataCleaning.normalise_dates(legacy_users_df_filtered['date_of_birth'], verbose=report_dates)
+        legacy_users_df_filtered['join_date'] = DataCleaning.normalise_dates(legacy_users_df_filtered['join_date'], verbose=report_dates)
 
         legacy_users_df_filtered['company'] = legacy_users_df_filtered['company'].astype('category')
 
@@ -61,28 +200,16 @@ class DataCleaning:
         # Change the data type of 'user_uuid' column to 'string'
         legacy_users_df_filtered['user_uuid'] = legacy_users_df_filtered['user_uuid'].astype('string')
 
-        # Define a function to clean phone numbers and convert to string
-        def clean_and_convert_to_string(phone_numbers):
-            """
-            The clean_and_convert_to_string function takes in a list of phone numbers and removes all non-numeric characters, except '(', ')', and '+'.
-            
-            Parameters:
-                phone_numbers (str): A string containing phone numbers.
-            
-            Returns:
-                str: The cleaned phone number string.
-            """
-            # Remove non-numeric characters, except '(', ')', and '+'
-            cleaned_number = re.sub(r'[^0-9()+]+', '', phone_numbers)
-            return cleaned_number
-
-        # Apply the cleaning function and convert to string
-        legacy_users_df_filtered['phone_number'] = legacy_users_df_filtered['phone_number'].apply(clean_and_convert_to_string).astype(str)
+        # Remove non-numeric characters from the phone numbers, except '(', ')', and '+'
+        legacy_users_df_filtered['phone_number'] = DataCleaning.map_distinct_values(
+            legacy_users_df_filtered['phone_number'],
+            lambda phone_numbers: phone_numbers.astype(str).str.replace(DataCleaning.phone_number_pattern, '', regex=True)
+            )
 
         return legacy_users_df_filtered
  
     @staticmethod
-    def clean_card_data(card_details_df):
+    def clean_card_data(card_details_df, inplace: bool = False, report_dates: bool = False):
         """
         The clean_card_data function takes a DataFrame containing card details as input and returns a cleaned version of the same.
         The cleaning process involves removing rows where all values are null in the DataFrame. Converting 'expiry_date' to datetime 
@@ -91,62 +218,58 @@ class DataCleaning:
         
         Args:
             card_details_df (pandas.DataFrame): The DataFrame containing card details.
+            inplace (bool): Whether the input may be changed and returned instead of copied, see select_rows.
+            report_dates (bool): Whether to print how 'date_payment_confirmed' was parsed and the time taken, see normalise_dates.
 
         Returns:
             pandas.DataFrame: Cleaned card details.
         """
-         
-        # Remove rows where all values are null in the DataFrame
-        card_details_df_filtered = card_details_df.dropna(how='all')
-
         # Convert 'expiry_date' to datetime format
-        card_details_df_filtered['expiry_date'] = pd.to_datetime(card_details_df_filtered['expiry_date'], format='%m/%y', errors='coerce')
+        expiry_dates = pd.to_datetime(card_details_df['expiry_date'], format='%m/%y', errors='coerce')
 
-        # Format 'expiry_date' for display (month/year)
-        card_details_df_filtered['expiry_date'] = card_details_df_filtered['expiry_date'].dt.strftime('%m/%y')
+        # Remove rows where all values are null, and rows where "expiry_date" is null
+        keep = card_details_df.notna().any(axis=1) & expiry_dates.notna()
+        card_details_df_filtered = DataCleaning.select_rows(card_details_df, keep, inplace)
 
-        # Remove rows where "expiry_date" is null
-        card_details_df_filtered = card_details_df_filtered.dropna(subset=['expiry_date'])
+        # Format 'expiry_date' for display (month/year)
+        card_details_df_filtered['expiry_date'] = expiry_dates[keep].dt.strftime('%m/%y')
 
         # Convert 'date_payment_confirmed' to datetime format
-        card_details_df_filtered['date_payment_confirmed'] = card_details_df_filtered['date_payment_confirmed'].apply(parse)
-        card_details_df_filtered['date_payment_confirmed'] = pd.to_datetime(card_details_df_filtered['date_payment_confirmed'], format='%y-%m-%d', errors='coerce')
+        card_details_df_filtered['date_payment_confirmed'] = DataCleaning.normalise_dates(card_details_df_filtered['date_payment_confirmed'], verbose=report_dates)
 
         # Convert 'card_provider' to datatype 'category'
         card_details_df_filtered['card_provider'] = card_details_df_filtered['card_provider'].astype('category')
 
         # Remove '?' from 'card_number' column
-        card_details_df_filtered['card_number'] = card_details_df_filtered['card_number'].astype('str').apply(lambda x: x.replace("?", ''))
-        card_details_df_filtered['card_number'] = card_details_df_filtered['card_number'].astype('string')
+        card_details_df_filtered['card_number'] = card_details_df_filtered['card_number'].astype(str).str.replace('?', '', regex=False).astype('string')
 
         return card_details_df_filtered
     
     @staticmethod
-    def called_clean_store_data(store_details_df):
+    def called_clean_store_data(store_details_df, inplace: bool = False):
         """
         The called_clean_store_data function cleans the store details data.
 
         Args:
             store_details_df (pandas.DataFrame): The DataFrame containing store details.
+            inplace (bool): Whether the input may be changed and returned instead of copied, see select_rows.
 
         Returns:
             pandas.DataFrame: Cleaned store details.
         """
-        # drop na from 'continent' column
-        store_details_df_filtered = store_details_df.dropna(subset=['continent'])
-
         # Replace 'eeEurope': 'Europe', 'eeAmerica': 'America'
-        store_details_df_filtered.loc[:, 'continent'] = store_details_df_filtered['continent'].replace({'eeEurope': 'Europe', 'eeAmerica': 'America'})
+        continents = store_details_df['continent'].replace({'eeEurope': 'Europe', 'eeAmerica': 'America'})
 
-        # Filtering mask created to islocate values containing numbers
-        condition_to_exclude = store_details_df_filtered['continent'].astype(str).str.contains('\d')
+        # Remove rows where 'continent' is missing or contains numbers, and rows where 'country_code' is NULL
+        keep = (continents.notna() &
+                ~continents.astype(str).str.contains(r'\d') &
+                (store_details_df['country_code'].astype(str) != 'NULL')
+                )
+        store_details_df_filtered = DataCleaning.select_rows(store_details_df, keep, inplace)
 
-        # Mask applied to exclude numbers from the 'continent' column
-        store_details_df_filtered = store_details_df_filtered[~condition_to_exclude]
+        store_details_df_filtered['continent'] = continents[keep].astype('category')
 
-        store_details_df_filtered['continent'] = store_details_df_filtered['continent'].astype('category')
-
-        store_details_df_filtered = store_details_df_filtered.drop('lat', axis=1)
+        del store_details_df_filtered['lat']
 
         # Change datatype to category
         store_details_df_filtered['store_type'] = store_details_df_filtered['store_type'].astype('category')
@@ -154,8 +277,8 @@ class DataCleaning:
         # Change datatype to string
         store_details_df_filtered['store_code'] = store_details_df_filtered['store_code'].astype('string')
 
-        # Change datatype to category
-        store_details_df_filtered['country_code'] = store_details_df_filtered['country_code'].astype('category')
+        # Convert 'country_code' to string
+        store_details_df_filtered['country_code'] = store_details_df_filtered['country_code'].astype(str)
 
         # Filter out letters from the 'staff_numbers'
         store_details_df_filtered['staff_numbers'] = store_details_df_filtered['staff_numbers'].str.replace(r'[^0-9]', '', regex=True)
@@ -168,151 +291,120 @@ class DataCleaning:
 
         store_details_df_filtered['opening_date'] = pd.to_datetime(store_details_df_filtered['opening_date'], format='mixed', errors='coerce')
 
-        # Convert 'country_code' to string
-        store_details_df_filtered['country_code'] = store_details_df_filtered['country_code'].astype('str')
-
-        # Remove rows where 'country_code' is NULL
-        store_details_df_filtered = store_details_df_filtered[store_details_df_filtered['country_code'] != 'NULL']
+        return store_details_df_filtered
 
-        # display(store_details_df_filtered.info())
-        # display(store_details_df_filtered)
+    # Matches '2 x 100g' style multipacks first, then a single '100g' style weight
+    weight_pattern = re.compile(r"^(?:([\d.]+)\s*([a-zA-Z]*)\s*x\s*([\d.]+)\s*([a-zA-Z]*)|([\d.]+)\s*([a-zA-Z]*))")
 
-        return store_details_df_filtered
+    # Units that are converted to kilograms, with the value they are divided and multiplied by
+    weight_unit_factors = pd.DataFrame({'unit': ['g', 'gram', 'grams', 'ml', 'milliliter', 'milliliters', 'kg', 'kilogram', 'kilograms', 'oz', 'ounce', 'ounces'],
+                                        'divisor': [1000, 1000, 1000, 1000, 1000, 1000, 1, 1, 1, 1, 1, 1],
+                                        'multiplier': [1, 1, 1, 1, 1, 1, 1, 1, 1, 0.0283495, 0.0283495, 0.0283495]
+                                        }).set_index('unit')
 
     @staticmethod
-    def convert_product_weights(products_df_filtered):
+    def convert_product_weights(products_df_filtered, inplace: bool = False):
         """
         The convert_product_weights function takes a DataFrame as input and returns the same DataFrame with weights converted to kilograms.
         The function can handle strings with or without units, and it can also handle multiplication of two weights.
         For example:
             - '100g' will be converted to 0.100 kg
             - '2 x 100g' will be converted to 0.200 kg (i.e., 2 * 100 g)
+        Weights that cannot be read, or that have unrecognised units, are set to NaN.
+        Each distinct weight is converted once, using a single regular expression and a lookup table of units,
+        and the results are mapped back onto the rows.
 
         Args:
             products_df_filtered (pandas.DataFrame): The DataFrame containing product details.
+            inplace (bool): Whether to convert the weights of the input rather than of a shallow copy sharing its other columns.
 
         Returns:
             pandas.DataFrame: Cleaned product details with weights converted to kilograms.
         """
-        def convert_weight(value):
-            """
-            The convert_weight function takes a string as input and returns the weight in kilograms.
-            The function can handle strings with or without units, and it can also handle multiplication of two weights.
-            
-            Args:
-                value (string): Pass the value to be converted.
-
-            Returns:
-                float: The converted weight.
-            """
-            try:
-                # Check if the value contains 'x' indicating a multiplication
-                if 'x' in value:
-                    # Extract numeric parts and units from both sides of 'x'
-                    numeric_part1, units1, numeric_part2, units2 = re.match(r"([\d.]+)\s*([a-zA-Z]*)\s*x\s*([\d.]+)\s*([a-zA-Z]*)", value).groups()
-
-                    # If units1 is empty, use units2
-                    if not units1:
-                        units1 = units2
-
-                    # Multiply numeric parts together
-                    result = float(numeric_part1) * float(numeric_part2)
-
-                    # Handle units conversion for both parts
-                    if units1.lower() in ['g', 'gram', 'grams']:
-                        result /= 1000
-                    elif units1.lower() in ['ml', 'milliliter', 'milliliters']:
-                        result /= 1000
-                    elif units1.lower() in ['kg', 'kilogram', 'kilograms']:
-                        pass  # No conversion needed for kg
-                    elif units1.lower() in ['oz', 'ounce', 'ounces']:
-                        result *= 0.0283495
-                    else:
-                        # If units are not recognized, return NaN
-                        return np.nan
-
-                else:
-                    # Extract numeric part and units from the value
-                    numeric_part, units = re.match(r"([\d.]+)\s*([a-zA-Z]*)", value).groups()
-
-                    # Multiply numeric part by the units
-                    result = float(numeric_part)
-
-                    # Handle units conversion
-                    if units.lower() in ['g', 'gram', 'grams']:
-                        result /= 1000
-                    elif units.lower() in ['ml', 'milliliter', 'milliliters']:
-                        result /= 1000
-                    elif units.lower() in ['kg', 'kilogram', 'kilograms']:
-                        pass  # No conversion needed for kg
-                    elif units.lower() in ['oz', 'ounce', 'ounces']:
-                        result *= 0.0283495
-                    else:
-                        # If units are not recognised, return NaN
-                        return np.nan
-
-                return round(result, 3)
-
-            except Exception as e:
-                # If any error occurs, return NaN
-                return np.nan
-
-        # Apply the conversion function to the 'weight' column
-        products_df_filtered['weight'] = products_df_filtered['weight'].apply(convert_weight)
-        cleaned_products_data = products_df_filtered.rename(columns={'weight': 'weight_(kg)'})
+        codes, weights = pd.factorize(products_df_filtered['weight'])  # Distinct weights; missing values get code -1
+        weights = pd.Series(weights, dtype=object)
+        parts = weights.str.extract(DataCleaning.weight_pattern)
+
+        # Values containing 'x' must be multipacks, other values a single weight
+        is_multipack = weights.str.contains('x', regex=False).fillna(False).to_numpy(dtype=bool)  # Non-string values give NaN
+        is_single = ~is_multipack & parts[4].notna().to_numpy()
+        is_multipack &= parts[2].notna().to_numpy()
+
+        # Multiply numeric parts together; a multipack without units after the first number uses the units of the second
+        quantity = pd.to_numeric(parts[0], errors='coerce').to_numpy(dtype=float)
+        number = np.where(is_multipack, 
+                          pd.to_numeric(parts[2], errors='coerce').to_numpy(dtype=float), 
+                          pd.to_numeric(parts[4], errors='coerce').to_numpy(dtype=float)
+                          )
+        number = np.where(is_multipack, quantity * number, number)
+        units = parts[1].where(parts[1] != '', parts[3]).where(is_multipack, parts[5]).str.lower()
+
+        # Handle units conversion; unrecognised units give NaN
+        factors = DataCleaning.weight_unit_factors.reindex(units)
+        result = number / factors['divisor'].to_numpy() * factors['multiplier'].to_numpy()
+        result = np.where(is_multipack | is_single, result, np.nan)
+
+        # Round to 3 decimal places with round(), as the per-value conversion did; np.round differs from it on some values close
+        # to a half. There is one value per distinct weight, so this loop is short
+        rounded = np.array([round(value, 3) for value in result.tolist()], dtype=float)
+
+        # Apply the conversion to the 'weight' column; code -1 picks the NaN appended at the end
+        rounded = np.append(rounded, np.nan)
+        cleaned_products_data = products_df_filtered if inplace else products_df_filtered.copy(deep=False)
+        cleaned_products_data['weight'] = pd.Series(rounded[codes], index=products_df_filtered.index)
+        cleaned_products_data.rename(columns={'weight': 'weight_(kg)'}, inplace=True)
 
         return cleaned_products_data
 
     @staticmethod
-    def clean_products_data(products_df):
+    def clean_products_data(products_df, inplace: bool = False, report_dates: bool = False):
         """
         The clean_products_data function cleans the products data.
 
         Args:
             products_df (pandas.DataFrame): The DataFrame containing product details.
+            inplace (bool): Whether the input may be changed and returned instead of copied, see select_rows.
+            report_dates (bool): Whether to print how 'date_added' was parsed and the time taken, see normalise_dates.
 
         Returns:
             pandas.DataFrame: Cleaned product details.
         """
-        # Show rows where 'product_price' values are notnull
-        products_df_filtered = products_df[products_df['product_price'].notnull()]
+        # Keep rows where 'product_price' values are notnull, filtering out rows where 'category' contains numbers
+        keep = products_df['product_price'].notnull() & ~products_df['category'].str.contains(r'\d', na=False)
+        products_df_filtered = DataCleaning.select_rows(products_df, keep, inplace)
 
-        # regular expression to filter out rows where 'category' contains numbers
-        products_df_filtered = products_df_filtered[~products_df_filtered['category'].str.contains('\d')]
         products_df_filtered['category'] = products_df_filtered['category'].astype('category')
 
         # Convert the 'date_added' column to datetime format
-        products_df_filtered['date_added'] = products_df_filtered['date_added'].apply(parse)
-        products_df_filtered['date_added'] = products_df_filtered['date_added'].combine_first(pd.to_datetime(products_df_filtered['date_added'], errors='coerce', format='%Y %B %d'))
+        products_df_filtered['date_added'] = DataCleaning.normalise_dates(products_df_filtered['date_added'], verbose=report_dates)
         
-        # Correct the spelling in the column 'removed'
-        products_df_filtered['removed'] = products_df_filtered['removed'].replace('Still_avaliable', 'Still_available')
-
-        # Convert 'removed' to datatype 'category'
-        products_df_filtered['removed'] = products_df_filtered['removed'].astype('category')
+        # Correct the spelling in the column 'removed' and convert it to datatype 'category'
+        products_df_filtered['removed'] = products_df_filtered['removed'].replace('Still_avaliable', 'Still_available').astype('category')
         
         return products_df_filtered
     
     @staticmethod
-    def clean_orders_data(selected_table_df):
+    def clean_orders_data(selected_table_df, inplace: bool = False):
         """
         The clean_orders_data function takes in a pandas DataFrame containing order details and returns a cleaned version of the same.
         The function drops specified columns from the original DataFrame, namely: first_name, last_name and 1.
 
         Args:
             selected_table_df (pandas.DataFrame): The DataFrame containing order details.
+            inplace (bool): Whether to drop the columns from the input rather than from a shallow copy.
 
         Returns:
             pandas.DataFrame: Cleaned order details.
         """
         # Drop specified columns
         columns_to_drop = ['first_name', 'last_name', '1']
-        orders_df_filtered = selected_table_df.drop(columns=columns_to_drop)
+        orders_df_filtered = selected_table_df if inplace else selected_table_df.copy(deep=False)
+        orders_df_filtered.drop(columns=columns_to_drop, inplace=True)
         
         return orders_df_filtered
         
     @staticmethod
-    def clean_date_data(date_details_df):
+    def clean_date_data(date_details_df, inplace: bool = False):
         """
         The clean_date_data function takes in a dataframe of date details and filters out the rows that do not contain
         the time periods 'Evening', 'Morning', 'Midday' or 'Late_Hours'. It then converts the column containing these values
@@ -320,15 +412,44 @@ class DataCleaning:
 
         Args:
             date_details_df (pandas.DataFrame): The DataFrame containing date details.
+            inplace (bool): Whether the input may be changed and returned instead of copied, see select_rows.
 
         Returns:
             pandas.DataFrame: Cleaned date details.
         """
         # filtering mask created
-        condition_to_include = date_details_df['time_period'].astype(str).str.contains('Evening|Morning|Midday|Late_Hours')
-        date_details_df_filtered = date_details_df[condition_to_include]
+        condition_to_include = DataCleaning.time_period_mask(date_details_df['time_period'])
+        date_details_df_filtered = DataCleaning.select_rows(date_details_df, condition_to_include, inplace)
 
         # Convert 'time_period' to datatype 'category'
-        date_details_df_filtered.loc[:, 'time_period'] = date_details_df_filtered['time_period'].astype('category')
+        date_details_df_filtered['time_period'] = date_details_df_filtered['time_period'].astype('category')
 
         return date_details_df_filtered
+
+    @staticmethod
+    def match_star_schema(cleaned_df, uploaded_table_name: str):
+        """
+        The match_star_schema function applies to a cleaned DataFrame the changes _05_SQL/_01_star_schema_sales_data.sql makes to its table,
+        so its rows can be merged into a table that already has the star-schema, see DatabaseConnector.upsert_to_db.
+        'N/A' store details become missing values, and the product price, availability and weight class take their star-schema form.
+        Other tables are returned unchanged.
+
+        Args:
+            cleaned_df (pandas.DataFrame): The cleaned DataFrame.
+            uploaded_table_name (str): Name of the database table the DataFrame is merged into.
+
+        Returns:
+            pandas.DataFrame: DataFrame with the columns and values of the star-schema table.
+        """
+        if uploaded_table_name == 'dim_store_details':
+            return cleaned_df.replace({column: {'N/A': None} for column in ['address', 'longitude', 'locality']})
+
+        if uploaded_table_name == 'dim_products':
+            star_schema_df = cleaned_df.rename(columns={'product_price': 'product_price_(gbp)', 'removed': 'still_available'})
+            star_schema_df['product_price_(gbp)'] = star_schema_df['product_price_(gbp)'].astype(str).str.replace('£', '', regex=False).astype(float)
+            star_schema_df['still_available'] = star_schema_df['still_available'].astype(str).str.lower() == 'still_available'
+            star_schema_df['weight_class'] = pd.cut(star_schema_df['weight_(kg)'], bins=[0, 5, 10, 20], right=False,
+                                                    labels=['Light', 'Medium', 'Heavy']).astype(object).fillna('Very Heavy')
+            return star_schema_df
+
+        return cleaned_df
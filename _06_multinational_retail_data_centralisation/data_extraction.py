@@ -1,34 +1,201 @@
 from _06_multinational_retail_data_centralisation.database_utils import DatabaseConnector
-from sqlalchemy import inspect
+from _06_multinational_retail_data_centralisation.json_streaming import JsonStreamReader
+from _06_multinational_retail_data_centralisation.notebook_generation import NotebookGenerator
+from _06_multinational_retail_data_centralisation.s3_range_reader import S3RangeReader
+from _06_multinational_retail_data_centralisation.table_staging import TableStaging
+from concurrent.futures import ThreadPoolExecutor # fetch stores concurrently
+from contextlib import closing # close the S3 object body once parsed
+from sqlalchemy import MetaData, Table, inspect, select
 # from urllib.parse import urlparse
 
 import pandas as pd
-import tabula # read tables in a PDF
-import nbformat # save as .ipynb
-import requests
 import json
-import boto3
+import hashlib # to checksum local files
+import io # to buffer the S3 object body
 import os # to create directories
+import tempfile # to download a PDF once before splitting it into pages
+import threading # the S3 client is shared by the stages
 
 
 class DataExtractor:
     """
     A utility class for extracting data from various sources.
+    tabula-py, requests and boto3 are slow to import, so each is only imported by the functions that use it;
+    a run that only reads from the RDS database never loads them.
     """
+    s3_client_instance = None  # Created on first use by s3_client and shared by every S3 read
+    s3_client_lock = threading.Lock()
+
     @staticmethod
-    def read_rds_table(table_name: str, engine):
+    def url_fingerprint(url: str):
+        """
+        The url_fingerprint function identifies the current version of a file without downloading it.
+        A local file is identified by a checksum of its contents, a remote file by the ETag, Last-Modified
+        and Content-Length headers returned for a HEAD request.
+
+        Args:
+            url (str): URL or local path of the file.
+
+        Returns:
+            dict: Values identifying the version of the file, or None if it cannot be identified.
+        """
+        if os.path.exists(url):
+            checksum = hashlib.sha256()
+            with open(url, 'rb') as file:
+                for block in iter(lambda: file.read(1024 * 1024), b''):  # Read the file 1 MB at a time
+                    checksum.update(block)
+            return {'sha256': checksum.hexdigest()}
+
+        import requests # only needed for remote files
+        try:
+            response = requests.head(url, allow_redirects=True)
+        except requests.RequestException as e:
+            print(f"An error occurred: {e}")
+            return None
+        fingerprint = {header: response.headers.get(header) for header in ['ETag', 'Last-Modified', 'Content-Length']}
+        if response.status_code != 200 or not (fingerprint['ETag'] or fingerprint['Last-Modified']):
+            return None  # Without a version the file cannot be cached safely
+        return fingerprint
+
+    @staticmethod
+    def rds_table_fingerprint(table_name: str, engine, watermark_column: str = None):
+        """
+        The rds_table_fingerprint function identifies the current version of an RDS table from the statistics PostgreSQL keeps for it,
+        without reading its rows: the numbers of rows inserted, updated and deleted so far, and the file holding the table, which changes
+        when it is truncated or rewritten. The highest value of a watermark column is added when one is given.
+        The statistics are flushed about once a second, so a change committed in the last second may not be seen yet.
+        Only PostgreSQL keeps these statistics; other databases give no version, so their tables are not cached.
+
+        Args:
+            table_name (str): Name of the table.
+            engine: Database engine object.
+            watermark_column (str): Column that increases with every new row, e.g. 'index'. None leaves it out.
+
+        Returns:
+            dict: Statistics of the table, or None if the database does not keep them.
+        """
+        if engine.dialect.name != 'postgresql':
+            return None
+        quote = engine.dialect.identifier_preparer.quote
+        with engine.connect() as connection:
+            table_stats = connection.exec_driver_sql(
+                "SELECT n_tup_ins, n_tup_upd, n_tup_del, pg_relation_filenode(relid) FROM pg_stat_user_tables "
+                "WHERE relid = to_regclass(%(table_name)s)", {'table_name': quote(table_name)}).one_or_none()
+            if table_stats is None:
+                return None
+            fingerprint = dict(zip(['rows_inserted', 'rows_updated', 'rows_deleted', 'filenode'], table_stats))
+            if watermark_column is not None:
+                fingerprint['high_water_mark'] = connection.exec_driver_sql(f"SELECT max({quote(watermark_column)}) FROM {quote(table_name)}").scalar()
+        return fingerprint
+
+    @staticmethod
+    def read_rds_table(table_name: str, engine, chunksize: int = None, cache = None, watermark_column: str = None):
         """
         The read_rds_table function reads data from an RDS table into a pandas DataFrame.
+        When a chunksize is given the table is streamed instead, see stream_rds_table.
+        When a cache is given and the table is unchanged since it was cached (see rds_table_fingerprint),
+        the cached data is returned instead of reading the table.
 
         Args:
             table_name (str): Name of the table to read.
             engine: Database engine object.
+            chunksize (int): Number of rows per chunk. None reads the whole table at once.
+            cache (ExtractionCache): Cache of extracted tables. None always reads the table.
+            watermark_column (str): Column that increases with every new row, whose highest value is part of the table's version.
 
         Returns:
-            pd.DataFrame: DataFrame containing the table data.
+            pd.DataFrame: DataFrame containing the table data, or a generator of DataFrames if chunksize is given.
         """
+        if cache is not None:
+            source = f"{engine.url.render_as_string(hide_password=True)}/{table_name}"
+            fingerprint = DataExtractor.rds_table_fingerprint(table_name, engine, watermark_column)
+            if fingerprint is None:
+                cache = None  # Without a version the table cannot be cached safely
+            else:
+                fingerprint['chunksize'] = chunksize
+
+        if chunksize is not None:
+            if cache is None:
+                return DataExtractor.stream_rds_table(table_name, engine, chunksize)
+            cached_chunks = cache.get_chunks(source, fingerprint)
+            if cached_chunks is not None:
+                print(f"Loaded '{source}' from the extraction cache.")
+                return cached_chunks
+            return cache.put_chunks(source, fingerprint, DataExtractor.stream_rds_table(table_name, engine, chunksize))
+
+        if cache is not None:
+            return cache.fetch(source, fingerprint, lambda: pd.read_sql_table(table_name, engine))
+
         df = pd.read_sql_table(table_name, engine)
         return df
+
+    @staticmethod
+    def stream_rds_table(table_name: str, engine, chunksize: int):
+        """
+        The stream_rds_table function reads an RDS table in fixed-size chunks through a server-side cursor,
+        so only one chunk is held in memory at a time. The index of each chunk continues on from the previous
+        chunk, matching the index the table would have if it was read in one go.
+
+        Args:
+            table_name (str): Name of the table to read.
+            engine: Database engine object.
+            chunksize (int): Number of rows per chunk.
+
+        Yields:
+            pd.DataFrame: The next chunk of the table.
+        """
+        rows_read = 0
+        with engine.connect().execution_options(stream_results=True) as connection:  # stream_results keeps the rows on the server until they are fetched
+            for chunk in pd.read_sql_table(table_name, connection, chunksize=chunksize):
+                chunk.index += rows_read
+                rows_read += len(chunk)
+                yield chunk
+    
+    @staticmethod
+    def read_new_rds_rows(table_name: str, engine, watermark_column: str, high_water_mark, chunksize: int = None):
+        """
+        The read_new_rds_rows function reads only the rows of an RDS table added since the last load,
+        i.e. those whose watermark column is above the high-water mark, in watermark order.
+
+        Args:
+            table_name (str): Name of the table to read.
+            engine: Database engine object.
+            watermark_column (str): Column that increases with every new row, e.g. 'level_0' or 'index'.
+            high_water_mark: Highest value of the watermark column already loaded.
+            chunksize (int): Number of rows per chunk. None reads all new rows at once.
+
+        Returns:
+            pd.DataFrame: DataFrame containing the new rows, or a generator of DataFrames if chunksize is given.
+        """
+        source_table = Table(table_name, MetaData(), autoload_with=engine)
+        watermark = source_table.c[watermark_column]
+        query = select(source_table).where(watermark > high_water_mark).order_by(watermark)
+
+        if chunksize is not None:
+            return DataExtractor.stream_rds_query(query, engine, chunksize)
+
+        df = pd.read_sql(query, engine)
+        return df
+
+    @staticmethod
+    def stream_rds_query(query, engine, chunksize: int):
+        """
+        The stream_rds_query function reads the result of a query in fixed-size chunks through a server-side cursor.
+
+        Args:
+            query (sqlalchemy.Select): Query to run.
+            engine: Database engine object.
+            chunksize (int): Number of rows per chunk.
+
+        Yields:
+            pd.DataFrame: The next chunk of the result.
+        """
+        rows_read = 0
+        with engine.connect().execution_options(stream_results=True) as connection:  # stream_results keeps the rows on the server until they are fetched
+            for chunk in pd.read_sql(query, connection, chunksize=chunksize):
+                chunk.index += rows_read
+                rows_read += len(chunk)
+                yield chunk
     
     @staticmethod
     def list_db_tables(engine):
@@ -44,49 +211,202 @@ class DataExtractor:
         inspector = inspect(engine)
         tables = inspector.get_table_names()
         return tables
+
+    @staticmethod
+    def list_table_columns(table_name: str, engine):
+        """
+        The list_table_columns function lists the columns of a table in the database and their types.
+
+        Args:
+            table_name (str): Name of the table.
+            engine: Database engine object.
+
+        Returns:
+            list: Column name and type of each column.
+        """
+        inspector = inspect(engine)
+        return [[column['name'], str(column['type'])] for column in inspector.get_columns(table_name)]
     
     @staticmethod
-    def retrieve_pdf_data(pdf_path: str, raw_csv_folder_path: str, raw_notebook_folder_path: str):
+    def pdf_page_count(pdf_path: str):
+        """
+        The pdf_page_count function counts the pages of a local PDF file by reading its page tree, so compressed object streams
+        and incrementally updated files are counted correctly. pypdf is used when it is installed; otherwise the PDFBox library
+        bundled with tabula-py is called through JPype, in the same JVM tabula-py then reuses for its reads.
+
+        Args:
+            pdf_path (str): Path to the PDF file.
+
+        Returns:
+            int: Number of pages, or 0 if they cannot be counted, i.e. without pypdf and without JPype or a Java runtime.
+        """
+        try:
+            import pypdf # read the page tree; optional
+        except ImportError:
+            pypdf = None
+        if pypdf is not None:
+            return len(pypdf.PdfReader(pdf_path).pages)
+
+        try:
+            import jpype # call PDFBox in the JVM used by tabula-py
+        except ImportError:
+            return 0
+        if not jpype.isJVMStarted():
+            from tabula.backend import jar_path # the tabula-java jar bundles PDFBox
+            jpype.addClassPath(jar_path())
+            try:
+                jpype.startJVM('-Djava.awt.headless=true', '-Dfile.encoding=UTF8', convertStrings=False)  # The options tabula-py starts it with
+            except (jpype.JVMNotFoundException, OSError):
+                return 0
+        pdf_document = jpype.JClass('org.apache.pdfbox.pdmodel.PDDocument').load(jpype.JClass('java.io.File')(pdf_path))
+        try:
+            return int(pdf_document.getNumberOfPages())
+        finally:
+            pdf_document.close()
+
+    @staticmethod
+    def stream_pdf_pages(pdf_path: str, max_workers: int = 4, pages_per_task: int = 10):
+        """
+        The stream_pdf_pages function extracts the tables of a PDF in page ranges read concurrently, yielding one DataFrame per range in page order.
+        A remote PDF is downloaded once rather than by every read. tabula-py reuses a single JVM for all the reads when JPype
+        is installed, and the JVM runs them on separate threads; otherwise each read runs in its own Java process.
+        If the pages cannot be counted, the whole PDF is read at once.
+
+        Args:
+            pdf_path (str): URL or local path of the PDF file.
+            max_workers (int): Number of page ranges read at the same time.
+            pages_per_task (int): Number of pages in each range.
+
+        Yields:
+            pd.DataFrame: The tables of the next page range.
+        """
+        import tabula # read tables in a PDF
+
+        local_pdf_path = pdf_path
+        if not os.path.exists(pdf_path):
+            import requests # download the remote PDF
+            response = requests.get(pdf_path)
+            response.raise_for_status()
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_file:
+                pdf_file.write(response.content)
+            local_pdf_path = pdf_file.name
+
+        try:
+            page_count = DataExtractor.pdf_page_count(local_pdf_path)
+            if page_count == 0:
+                yield pd.concat(tabula.read_pdf(local_pdf_path, pages='all'))
+                return
+
+            page_ranges = [list(range(first_page, min(first_page + pages_per_task, page_count + 1))) for first_page in range(1, page_count + 1, pages_per_task)]
+            print(f"Extracting {page_count} pages in {len(page_ranges)} ranges with {max_workers} workers.")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for page_range_tables in executor.map(lambda pages: tabula.read_pdf(local_pdf_path, pages=pages), page_ranges):  # map keeps the page order
+                    yield pd.concat(page_range_tables)
+        finally:
+            if local_pdf_path != pdf_path:
+                os.remove(local_pdf_path)
+
+    @staticmethod
+    def retrieve_pdf_data(pdf_path: str, 
+                          raw_csv_folder_path: str, 
+                          raw_notebook_folder_path: str, 
+                          cache = None, 
+                          staging_format: str = 'csv', 
+                          export_csv: bool = False,
+                          notebooks = None,
+                          max_workers: int = 1,
+                          pages_per_task: int = 10,
+                          stream: bool = False
+                          ):
         """
         The retrieve_pdf_data function retrieves data from a PDF file.
+        With stream the PDF is read one page range at a time instead (see stream_pdf_pages): a generator of DataFrames is returned,
+        and each range is appended to a raw CSV file as it is read, so the ranges can be cleaned and loaded without holding the whole table.
 
         Args:
             pdf_path (str): Path to the PDF file.
             raw_csv_folder_path (str): Path to the folder where CSV files will be saved.
             raw_notebook_folder_path (str): Path to the folder where notebook files will be saved.
+            cache (ExtractionCache): Cache of extracted tables, used while the PDF is unchanged. None always reads the PDF.
+            staging_format (str): Format the raw table is staged in: 'csv', 'parquet' or 'feather'.
+            export_csv (bool): Whether to also save the raw table as CSV when staging in another format.
+            notebooks (NotebookGenerator): Collects a notebook for inspecting the raw table. None generates no notebook.
+            max_workers (int): Number of page ranges extracted at the same time, see stream_pdf_pages. 1 reads the whole PDF in one pass
+                unless stream is set.
+            pages_per_task (int): Number of pages in each range extracted concurrently.
+            stream (bool): Whether to return the page ranges as they are read. Streamed tables are always staged as CSV.
 
         Returns:
-            tuple: DataFrame containing PDF data, table name and path to the CSV file.
+            tuple: DataFrame (or generator of DataFrames) containing PDF data, table name and path to the staged file.
         """
-        date_details_df = tabula.read_pdf(pdf_path, pages='all')  # Extract data from the PDF
-        date_details_df = pd.concat(date_details_df)
+        table_name = "card_details"
+        if stream:
+            os.makedirs(raw_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
+            raw_staged_filename = os.path.join(raw_csv_folder_path, f"{table_name}.csv")
+            page_ranges = DataExtractor.stream_pdf_pages(pdf_path, max_workers, pages_per_task)  # Nothing is read until the ranges are iterated
+            fingerprint = DataExtractor.url_fingerprint(pdf_path) if cache is not None else None
+            if fingerprint is not None:
+                fingerprint['pages_per_task'] = pages_per_task  # The ranges are cached as they were streamed
+                cached_ranges = cache.get_chunks(pdf_path, fingerprint)
+                if cached_ranges is not None:
+                    print(f"Loaded '{pdf_path}' from the extraction cache.")
+                    page_ranges = cached_ranges
+                else:
+                    page_ranges = cache.put_chunks(pdf_path, fingerprint, page_ranges)
+            return DataExtractor.stage_pdf_ranges(page_ranges, table_name, raw_staged_filename, raw_notebook_folder_path, notebooks), table_name, raw_staged_filename
+
+        def read_pdf():
+            import tabula # read tables in a PDF
+            if max_workers > 1:
+                return pd.concat(DataExtractor.stream_pdf_pages(pdf_path, max_workers, pages_per_task))  # Extract the page ranges concurrently
+            return pd.concat(tabula.read_pdf(pdf_path, pages='all'))  # Extract data from the PDF
+
+        if cache is not None:
+            date_details_df = cache.fetch(pdf_path, DataExtractor.url_fingerprint(pdf_path), read_pdf)
+        else:
+            date_details_df = read_pdf()
         print("Extracted PDF document from an AWS S3 bucket:\n")
 
-        os.makedirs(raw_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
+        raw_staged_filename = TableStaging.save_table(date_details_df, raw_csv_folder_path, table_name, staging_format, index=False, export_csv=export_csv)
+        print(f"Saved '{table_name}' as '{raw_staged_filename}'.\n")
 
-        table_name = "card_details"  # Save the DataFrame as a CSV file in the specified folder
-        raw_csv_filename = os.path.join(raw_csv_folder_path, f"{table_name}.csv")
-        date_details_df.to_csv(raw_csv_filename, index=False)
-        print(f"Saved '{table_name}' as '{raw_csv_filename}'.\n")
+        if notebooks is not None:  # Record a notebook for the table, written once the pipeline has run
+            read_statement = TableStaging.read_statement(os.path.join('..', raw_staged_filename))
+            notebooks.add_table_notebook(os.path.join(raw_notebook_folder_path, f"{table_name}.ipynb"),
+                                         NotebookGenerator.table_cell_code(table_name, read_statement, raw_staged_filename),
+                                         NotebookGenerator.dataframe_schema(date_details_df)
+                                         )
 
-        os.makedirs(raw_notebook_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
+        return date_details_df, table_name, raw_staged_filename
 
-        notebook = nbformat.v4.new_notebook()  # Create a new notebook
-        code_cell = nbformat.v4.new_code_cell(f"import pandas as pd\n\n"  # Add a code cell for the table to the notebook
-                                            f"# Import data from '{raw_csv_filename}' into DataFrame.\n"
-                                            f"table_name = '{table_name}'\n"
-                                            f"csv_file_path = '..\{raw_csv_filename}'\n"
-                                            f"{table_name}_df = pd.read_csv(csv_file_path)\n"
-                                            f"# Display the DataFrame\n"
-                                            f"display({table_name}_df)")
-        notebook.cells.append(code_cell)
+    @staticmethod
+    def stage_pdf_ranges(page_ranges, table_name: str, raw_csv_filename: str, raw_notebook_folder_path: str, notebooks = None):
+        """
+        The stage_pdf_ranges function appends each page range of a PDF to a raw CSV file as it passes through, writing the header with the
+        first range, and records the notebook of the table from the columns of the first range.
 
-        raw_notebook_filename = os.path.join(raw_notebook_folder_path, f"{table_name}.ipynb")  # Save the notebook to a .ipynb file with a name based on the fixed extracted table
-        with open(raw_notebook_filename, 'w') as nb_file:
-            nbformat.write(notebook, nb_file)
-            print(f"Saved '{table_name}' as '{raw_notebook_filename}'.\n")
+        Args:
+            page_ranges (iterable): DataFrames holding consecutive page ranges of the PDF.
+            table_name (str): Name of the table.
+            raw_csv_filename (str): Path of the raw CSV file to write.
+            raw_notebook_folder_path (str): Path to the folder where notebook files will be saved.
+            notebooks (NotebookGenerator): Collects a notebook for inspecting the raw table. None generates no notebook.
 
-        return date_details_df, table_name, raw_csv_filename
+        Yields:
+            pd.DataFrame: The next page range.
+        """
+        rows_saved = 0
+        for range_number, page_range_df in enumerate(page_ranges):
+            page_range_df.to_csv(raw_csv_filename, index=False, mode='w' if range_number == 0 else 'a', header=range_number == 0)
+            rows_saved += len(page_range_df)
+            print(f"Saved {rows_saved} rows as {raw_csv_filename}.")
+            if range_number == 0 and notebooks is not None:  # Record a notebook for the table, written once the pipeline has run
+                read_statement = TableStaging.read_statement(os.path.join('..', raw_csv_filename))
+                notebooks.add_table_notebook(os.path.join(raw_notebook_folder_path, f"{table_name}.ipynb"),
+                                             NotebookGenerator.table_cell_code(table_name, read_statement, raw_csv_filename),
+                                             NotebookGenerator.dataframe_schema(page_range_df)
+                                             )
+            yield page_range_df
     
     @staticmethod
     def list_number_of_stores(number_of_stores_endpoint: str, headers: dict):
@@ -100,6 +420,7 @@ class DataExtractor:
         Returns:
             int: Number of stores.
         """
+        import requests
         try:
             response = requests.get(number_of_stores_endpoint, headers=headers)  # Send GET request to the API
             if response.status_code == 200:  # Check if the request was successful (status code 200)
@@ -113,12 +434,75 @@ class DataExtractor:
             print(f"An error occurred: {e}")
             return None
     
+    @staticmethod
+    def create_session(max_workers: int = 1, max_retries: int = 3, backoff_factor: float = 0.5):
+        """
+        The create_session function creates a requests Session that keeps connections alive between calls to the API.
+        Requests answered with 429 or a 5xx status code are retried with an exponential backoff.
+
+        Args:
+            max_workers (int): Number of connections to keep open, one per concurrent worker.
+            max_retries (int): Number of times a failed request is retried.
+            backoff_factor (float): Base delay in seconds between retries, doubled after each attempt.
+
+        Returns:
+            requests.Session: Session with the retrying connection pool mounted.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry # retry with backoff on 429/5xx
+
+        retry = Retry(total=max_retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['GET'],
+                      raise_on_status=False  # Return the last response so its status code can be reported
+                      )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @staticmethod
+    def retrieve_a_store(session, retrieve_a_store_endpoint: str, headers: dict, store_number: int):
+        """
+        The retrieve_a_store function retrieves the data for a single store from the API endpoint.
+
+        Args:
+            session (requests.Session): Session used to send the request.
+            retrieve_a_store_endpoint (str): URL pattern for retrieving store data.
+            headers (dict): Headers to be included in the request.
+            store_number (int): Number of the store to retrieve.
+
+        Returns:
+            dict: Store data, or None if the request was not successful.
+        """
+        endpoint = retrieve_a_store_endpoint.format(store_number=store_number)  # Format the endpoint with the specified store number
+        response = session.get(endpoint, headers=headers)  # Send GET request to the API
+
+        if response.status_code == 200:  # Check if the request was successful (status code 200)
+            return response.json()  # Extract store data from the response JSON
+        else:
+            print(f"Request for store {store_number} failed with status code: {response.status_code}")  # If the request was not successful, print the status code and response text
+            print(f"Response Text: {response.text}")
+            return None
+
     @staticmethod
     def retrieve_stores_data(retrieve_a_store_endpoint: str, 
                              headers: dict, 
                              number_of_stores: int, 
                              raw_csv_folder_path: str,
-                             raw_notebook_folder_path: str
+                             raw_notebook_folder_path: str,
+                             max_workers: int = 1,
+                             max_retries: int = 3,
+                             backoff_factor: float = 0.5,
+                             cache = None,
+                             cache_max_age_seconds: float = 0,
+                             staging_format: str = 'csv',
+                             export_csv: bool = False,
+                             notebooks = None
                              ):
         """
         The retrieve_stores_data function retrieves data for multiple stores from an API endpoint.
@@ -129,107 +513,179 @@ class DataExtractor:
             number_of_stores (int): Number of stores to retrieve data for.
             raw_csv_folder_path (str): Path to the folder where CSV files will be saved.
             raw_notebook_folder_path (str): Path to the folder where notebook files will be saved.
+            max_workers (int): Number of stores requested concurrently. 1 retrieves the stores one after another.
+            max_retries (int): Number of times a request answered with 429 or 5xx is retried.
+            backoff_factor (float): Base delay in seconds between retries.
+            cache (ExtractionCache): Cache of extracted tables. None always calls the API.
+            cache_max_age_seconds (float): How long the cached stores are used while the number of stores is unchanged. The API gives
+                no version of the stores, so an edited store is only seen once the entry expires; 0 always calls the API.
+            staging_format (str): Format the raw table is staged in: 'csv', 'parquet' or 'feather'.
+            export_csv (bool): Whether to also save the raw table as CSV when staging in another format.
+            notebooks (NotebookGenerator): Collects a notebook for inspecting the raw table. None generates no notebook.
 
         Returns:
-            tuple: DataFrame containing store data, table name and path to the CSV file.
+            tuple: DataFrame containing store data, table name and path to the staged file.
         """
         if number_of_stores is None:
             print("Failed to retrieve the number of stores.")
             return None
 
+        import requests
         try:
-            all_stores_data = []  # Initialise an empty list to store data
+            def retrieve_all_stores():
+                with DataExtractor.create_session(max_workers, max_retries, backoff_factor) as session:  # Share one keep-alive session across all requests
+                    def retrieve(store_number):
+                        return DataExtractor.retrieve_a_store(session, retrieve_a_store_endpoint, headers, store_number)
+
+                    if max_workers > 1:
+                        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                            results = list(executor.map(retrieve, range(0, number_of_stores)))  # map() returns results in store number order
+                    else:
+                        results = [retrieve(store_number) for store_number in range(0, number_of_stores)]  # Iterate through store numbers and retrieve data for each store
+
+                all_stores_data = [store_data for store_data in results if store_data is not None]  # Keep the stores that were retrieved successfully
+                return pd.DataFrame(all_stores_data)  # Convert the list of store data into a Pandas DataFrame
+
+            if cache is not None and cache_max_age_seconds > 0:
+                stores_df = cache.fetch(retrieve_a_store_endpoint, {'number_of_stores': number_of_stores}, retrieve_all_stores, max_age_seconds=cache_max_age_seconds)
+            else:
+                stores_df = retrieve_all_stores()
             
-            for store_number in range(0, number_of_stores):  # Iterate through store numbers and retrieve data for each store
-                endpoint = retrieve_a_store_endpoint.format(store_number=store_number)   # Format the endpoint with the specified store number
-                response = requests.get(endpoint, headers=headers) # Send GET request to the API
+            table_name = "store_details"  # Save the DataFrame in the specified folder
+            raw_staged_filename = TableStaging.save_table(stores_df, raw_csv_folder_path, table_name, staging_format, index=False, export_csv=export_csv)
+            print(f"Saved '{table_name}' as '{raw_staged_filename}'.\n")
 
-                if response.status_code == 200:  # Check if the request was successful (status code 200)
-                    store_data = response.json()# Extract store data from the response JSON
-                    all_stores_data.append(store_data)
-                else:
-                    print(f"Request for store {store_number} failed with status code: {response.status_code}")  # If the request was not successful, print the status code and response text
-                    print(f"Response Text: {response.text}")
+            if notebooks is not None:  # Record a notebook for the table, written once the pipeline has run
+                read_statement = TableStaging.read_statement(os.path.join('..', raw_staged_filename))
+                notebooks.add_table_notebook(os.path.join(raw_notebook_folder_path, f"{table_name}.ipynb"),
+                                             NotebookGenerator.table_cell_code(table_name, read_statement, raw_staged_filename),
+                                             NotebookGenerator.dataframe_schema(stores_df)
+                                             )
 
-            stores_df = pd.DataFrame(all_stores_data)  # Convert the list of store data into a Pandas DataFrame
-            
-            os.makedirs(raw_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-            table_name = "store_details"  # Save the DataFrame as a CSV file in the specified folder
-            raw_csv_filename = os.path.join(raw_csv_folder_path, f"{table_name}.csv")
-            stores_df.to_csv(raw_csv_filename, index=False)
-            print(f"Saved '{table_name}' as '{raw_csv_filename}'.\n")
-
-            os.makedirs(raw_notebook_folder_path, exist_ok=True) # Ensure that the folder exists, create it if it doesn't
-            notebook = nbformat.v4.new_notebook()  # Create a new notebook
-            code_cell = nbformat.v4.new_code_cell(f"import pandas as pd\n"  # Add a code cell for the table to the notebook
-                                                f"# Import data from '{raw_csv_filename}' into DataFrame.\n"
-                                                f"table_name = '{table_name}'\n"
-                                                f"csv_file_path = '..\{raw_csv_filename}'\n"
-                                                f"{table_name}_df = pd.read_csv(csv_file_path)\n"
-                                                f"# Display the DataFrame\n"
-                                                f"display({table_name}_df)"
-                                                )
-            notebook.cells.append(code_cell)
-
-            raw_notebook_filename = os.path.join(raw_notebook_folder_path, f"{table_name}.ipynb")  # Save the notebook to a .ipynb file with a name based on the fixed extracted table
-            with open(raw_notebook_filename, 'w') as nb_file:
-                nbformat.write(notebook, nb_file)
-                print(f"Saved '{table_name}' as '{raw_notebook_filename}'.\n")
-
-            return stores_df, table_name, raw_csv_filename
+            return stores_df, table_name, raw_staged_filename
 
         except requests.RequestException as e:
             print(f"An error occurred: {e}")
             return None
 
+    @staticmethod
+    def s3_client():
+        """
+        The s3_client function gives the S3 client shared by every S3 read, creating it on first use.
+        boto3 clients are safe to share between threads, but slow to create.
+
+        Returns:
+            botocore.client.S3: S3 client.
+        """
+        with DataExtractor.s3_client_lock:
+            if DataExtractor.s3_client_instance is None:
+                import boto3 # AWS SDK
+                DataExtractor.s3_client_instance = boto3.client('s3')
+        return DataExtractor.s3_client_instance
+
+    @staticmethod
+    def read_s3_object(s3_address: str, chunksize: int = None, max_workers: int = 4, part_size: int = 8 * 1024 ** 2,
+                       compression: str = 'infer', s3_object: dict = None, **read_csv_kwargs):
+        """
+        The read_s3_object function parses a CSV object in an S3 bucket into a DataFrame as it is downloaded, without writing a local file.
+        Objects larger than one part are downloaded as byte ranges by concurrent GET requests (see S3RangeReader);
+        smaller ones are streamed from a single GET. Every GET must match the ETag returned by head_object, so an object
+        overwritten in the meantime raises a 'PreconditionFailed' ClientError rather than returning a mix of two versions.
+
+        Args:
+            s3_address (str): Address of the object, e.g. 's3://bucket/products.csv'.
+            chunksize (int): Number of rows per chunk. None reads the whole object at once.
+            max_workers (int): Number of byte ranges downloaded at the same time. 1 always uses a single GET.
+            part_size (int): Number of bytes in each range.
+            compression (str): 'gzip', 'zstd', 'bz2', 'xz' or None. 'infer' uses the extension of the object key, e.g. '.gz'.
+            s3_object (dict): Response of head_object for the object, if already requested.
+            **read_csv_kwargs: Arguments passed on to pd.read_csv, e.g. index_col.
+
+        Returns:
+            pd.DataFrame or generator: The table, or a generator of DataFrames when a chunksize is given.
+        """
+        s3 = DataExtractor.s3_client()
+        bucket_name, object_key = s3_address.replace('s3://', '').split('/', 1) # Extract bucket name and object key from S3 address
+        if s3_object is None:
+            s3_object = s3.head_object(Bucket=bucket_name, Key=object_key)
+        if compression == 'infer':
+            compression = {'.gz': 'gzip', '.zst': 'zstd', '.bz2': 'bz2', '.xz': 'xz'}.get(os.path.splitext(object_key)[1])
+
+        if max_workers > 1 and s3_object['ContentLength'] > part_size:
+            body = io.BufferedReader(S3RangeReader(s3, bucket_name, object_key, s3_object['ContentLength'], part_size, max_workers,
+                                                   etag=s3_object.get('ETag')), buffer_size=1024 ** 2)
+        else:
+            if_match = {'IfMatch': s3_object['ETag']} if s3_object.get('ETag') else {}
+            body = s3.get_object(Bucket=bucket_name, Key=object_key, **if_match)['Body']  # Streamed as it is read
+
+        if chunksize is None:
+            with closing(body):
+                return pd.read_csv(body, compression=compression, **read_csv_kwargs)
+
+        def read_chunks():
+            with closing(body):
+                yield from pd.read_csv(body, compression=compression, chunksize=chunksize, **read_csv_kwargs)
+        return read_chunks()
+
     @staticmethod
     def extract_from_s3(s3_address: str, 
                         csv_path: str, 
                         ipynb_path: str, 
-                        raw_notebook_folder_path: str
+                        raw_notebook_folder_path: str,
+                        cache = None,
+                        staging_format: str = 'csv',
+                        notebooks = None,
+                        export_csv: bool = False,
+                        max_workers: int = 4,
+                        part_size: int = 8 * 1024 ** 2
                         ):
         """
-        The extract_from_s3 function extracts data from an S3 bucket and saves it as CSV and IPython Notebook files.
+        The extract_from_s3 function extracts data from an S3 bucket and saves it as CSV and, optionally, IPython Notebook files.
+        The object is parsed as it is downloaded (see read_s3_object) rather than downloaded to a file and read back.
         
         Args:
             s3_address (str): Address of the file in the S3 bucket.
-            csv_path (str): Path where the CSV file will be saved.
+            csv_path (str): Path of the raw CSV file; the table is staged in its folder.
             ipynb_path (str): Path where the IPython Notebook file will be saved.
             raw_notebook_folder_path (str): Path where the IPython Notebook file will be saved.
+            cache (ExtractionCache): Cache of extracted tables, used while the object's ETag is unchanged. None always downloads the object.
+            staging_format (str): Format the raw table is staged in: 'csv', 'parquet' or 'feather'.
+            notebooks (NotebookGenerator): Collects a notebook for inspecting the raw table. None generates no notebook.
+            export_csv (bool): Whether to also save the raw table as CSV when staging in another format.
+            max_workers (int): Number of byte ranges of the object downloaded at the same time.
+            part_size (int): Number of bytes in each range.
 
         Returns:
-            tuple: DataFrame containing the extracted data, table name and path to the CSV file.
+            tuple: DataFrame containing the extracted data, table name and path to the staged file.
         """
         try:
-            s3 = boto3.client('s3')  # Create S3 client
+            s3 = DataExtractor.s3_client()  # Shared S3 client
             bucket_name, object_key = s3_address.replace('s3://', '').split('/', 1) # Extract bucket name and object key from S3 address
-            s3.download_file(bucket_name, object_key, csv_path)  # Download the file from S3 to the local machine as a .csv and .ipynb
             table_name = object_key.replace('products.csv', 'products_details')
-            raw_csv_filename = f"{table_name}.csv"
-            print(f"Saved '{table_name}' as '{raw_csv_filename}'.")
+            s3_object = s3.head_object(Bucket=bucket_name, Key=object_key)  # Identify the version and size of the object without downloading it
+
+            def download_products():
+                return DataExtractor.read_s3_object(s3_address, max_workers=max_workers, part_size=part_size, s3_object=s3_object, index_col=0)
 
-            products_df = pd.read_csv(csv_path, index_col=0)  # Read the .csv file into a Pandas DataFrame
+            if cache is not None:
+                fingerprint = {'ETag': s3_object['ETag'], 'LastModified': s3_object['LastModified'], 'ContentLength': s3_object['ContentLength']}
+                products_df = cache.fetch(s3_address, fingerprint, download_products)
+            else:
+                products_df = download_products()
             print(f"'{table_name}', shall be extracted: \n")
             print(products_df, "\n")
+
+            raw_staged_filename = TableStaging.save_table(products_df, os.path.dirname(csv_path), table_name, staging_format, index=True, export_csv=export_csv)
+            print(f"Saved '{table_name}' as '{raw_staged_filename}'.")
        
-            os.makedirs(raw_notebook_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-            notebook = nbformat.v4.new_notebook()  # Create a new notebook
-            code_cell = nbformat.v4.new_code_cell(f"import pandas as pd\n"  # Add a code cell for the table to the notebook
-                                                    f"# Import data from '{raw_csv_filename}' into DataFrame.\n\n"
-                                                    f"table_name = '{table_name}'\n"
-                                                    f"csv_file_path = '..\_01_raw_tables_csv\products_details.csv'\n"
-                                                    f"{table_name}_df = pd.read_csv(csv_file_path, index_col=0)\n"
-                                                    f"# Display the DataFrame\n"
-                                                    f"display({table_name}_df)"
-                                                    )
-            notebook.cells.append(code_cell)
-
-            raw_notebook_filename = os.path.join(raw_notebook_folder_path, f"{table_name}.ipynb")  # Save the notebook to a .ipynb file with a name based on the fixed extracted table
-            with open(raw_notebook_filename, 'w') as nb_file:
-                nbformat.write(notebook, nb_file)
-                print(f"Saved '{table_name}' as '{raw_notebook_filename}'.\n")
-
-            return products_df, table_name, raw_csv_filename
+            if notebooks is not None:  # Record a notebook for the table, written once the pipeline has run
+                read_statement = TableStaging.read_statement(os.path.join('..', raw_staged_filename), index_col=True)
+                notebooks.add_table_notebook(os.path.join(raw_notebook_folder_path, f"{table_name}.ipynb"),
+                                             NotebookGenerator.table_cell_code(table_name, read_statement, raw_staged_filename),
+                                             NotebookGenerator.dataframe_schema(products_df)
+                                             )
+
+            return products_df, table_name, raw_staged_filename
 
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -238,53 +694,60 @@ class DataExtractor:
     @staticmethod
     def retrieve_json_data(json_path: str,
                            raw_csv_folder_path: str,
-                           raw_notebook_folder_path: str
+                           raw_notebook_folder_path: str,
+                           cache = None,
+                           staging_format: str = 'csv',
+                           export_csv: bool = False,
+                           notebooks = None,
+                           stream: bool = False,
+                           row_filter: tuple = None
                            ):
         """
-        The retrieve_json_data function retrieves JSON data from a file and saves it as a CSV file and IPython Notebook.
+        The retrieve_json_data function retrieves JSON data from a file and saves it as a CSV file and, optionally, an IPython Notebook.
         
         Args:
             json_path (str): Path to the JSON file.
             raw_csv_folder_path (str): Path where the CSV file will be saved.
             raw_notebook_folder_path (str): Path where the IPython Notebook file will be saved.
+            cache (ExtractionCache): Cache of extracted tables, used while the JSON file is unchanged. None always reads the file.
+            staging_format (str): Format the raw table is staged in: 'csv', 'parquet' or 'feather'.
+            export_csv (bool): Whether to also save the raw table as CSV when staging in another format.
+            notebooks (NotebookGenerator): Collects a notebook for inspecting the raw table. None generates no notebook.
+            stream (bool): Whether to read the JSON file incrementally with JsonStreamReader rather than pd.read_json.
+            row_filter (tuple): When streaming, name of a column and a function giving the mask of the rows to keep,
+                e.g. ('time_period', DataCleaning.time_period_mask). The rejected rows are dropped as the file is read.
 
         Returns:
-            tuple: DataFrame containing the extracted data, table name and path to the CSV file.
+            tuple: DataFrame containing the extracted data, table name and path to the staged file.
         """
         try:
-            date_details_df = pd.read_json(json_path)
+            if stream:
+                read_table = lambda: JsonStreamReader.read_json_table(json_path, row_filter=row_filter)
+            else:
+                read_table = lambda: pd.read_json(json_path)
+            if cache is not None:
+                fingerprint = DataExtractor.url_fingerprint(json_path)
+                if fingerprint is not None and stream and row_filter is not None:
+                    fingerprint = {**fingerprint, 'row_filter': row_filter[0]}  # The cached table only holds the rows kept
+                date_details_df = cache.fetch(json_path, fingerprint, read_table)
+            else:
+                date_details_df = read_table()
             print("Extracted JSON document from an AWS S3 bucket:\n")
             
-            os.makedirs(raw_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-
-            
-            table_name = "date_details"  # Save the DataFrame as a CSV file in the specified folder
-            csv_filename = f"{table_name}.csv"
-            raw_csv_filename = os.path.join(raw_csv_folder_path, csv_filename)
-            date_details_df.to_csv(raw_csv_filename, index=True)
-            print(f"Saved '{table_name}' as '{raw_csv_filename}'.\n")
+            table_name = "date_details"  # Save the DataFrame in the specified folder
+            raw_staged_filename = TableStaging.save_table(date_details_df, raw_csv_folder_path, table_name, staging_format, index=True, export_csv=export_csv)
+            print(f"Saved '{table_name}' as '{raw_staged_filename}'.\n")
             print(f"'{table_name}', shall be extracted:\n")
             print(date_details_df, "\n")  # Display the DataFrame
 
-            notebook = nbformat.v4.new_notebook()  # Create a new notebook
-            code_cell = nbformat.v4.new_code_cell(f"import pandas as pd\n\n"  # Add a code cell for the table to the notebook
-                                                f"# Import data from '{raw_csv_filename}' into DataFrame.\n"
-                                                f"table_name = '{table_name}'\n"
-                                                f"csv_file_path = '..\{raw_csv_filename}'\n"
-                                                f"{table_name}_df = pd.read_csv(csv_file_path, index_col=0)\n"
-                                                f"# Display the DataFrame\n"
-                                                f"display({table_name}_df)")
-
-            notebook.cells.append(code_cell)
-
-            os.makedirs(raw_notebook_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-            notebook_file = f"{table_name}.ipynb"
-            raw_notebook_filename = os.path.join(raw_notebook_folder_path, notebook_file)
-            with open(raw_notebook_filename, 'w') as nb_file:
-                nbformat.write(notebook, nb_file)
-                print(f"Saved '{table_name}' as '{raw_notebook_filename}'.\n")
-
-            return date_details_df, table_name, raw_csv_filename
+            if notebooks is not None:  # Record a notebook for the table, written once the pipeline has run
+                read_statement = TableStaging.read_statement(os.path.join('..', raw_staged_filename), index_col=True)
+                notebooks.add_table_notebook(os.path.join(raw_notebook_folder_path, f"{table_name}.ipynb"),
+                                             NotebookGenerator.table_cell_code(table_name, read_statement, raw_staged_filename),
+                                             NotebookGenerator.dataframe_schema(date_details_df)
+                                             )
+
+            return date_details_df, table_name, raw_staged_filename
 
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -1,13 +1,88 @@
+import csv # to write rows for COPY
+import pandas as pd
+import threading # engines are shared by the stages of the pipeline
+import time # to report upload speed
 import yaml # to read .yaml. Help with read_db_creds
 
+from io import StringIO
+
 # from sklearn.datasets import load_iris
-from sqlalchemy import create_engine # this ORM will transform the python objects into SQL tables
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, ForeignKeyConstraint, MetaData, Table, Text, column, create_engine, event, false, func, inspect, or_, select, table, true # this ORM will transform the python objects into SQL tables
+from sqlalchemy.dialects import postgresql, sqlite # for INSERT ... ON CONFLICT
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.schema import AddConstraint # to add the foreign keys dropped when a dimension table is replaced
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    A QueuePool that also counts its checkouts and how long each one waited for a free connection, so that a pool too small
+    for the number of concurrent stages shows up as wait time rather than as slow stages.
+    Checkouts and checkins are counted with the pool's checkout and checkin events, and the wait is timed around connect,
+    the public method every engine.connect() goes through.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.max_checked_out = 0
+        self.timeouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        event.listen(self, 'checkout', self.on_checkout)
+        event.listen(self, 'checkin', self.on_checkin)
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self.stats_lock:
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, self.checkedout())
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self.stats_lock:
+            self.checkins += 1
+
+    def recreate(self):
+        event.remove(self, 'checkout', self.on_checkout)  # The new pool is given the listeners of this one, and counts for itself
+        event.remove(self, 'checkin', self.on_checkin)
+        return super().recreate()
+
+    def connect(self):
+        start_time = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        wait_time = time.perf_counter() - start_time  # Includes opening or pinging the connection
+        with self.stats_lock:
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+        return connection
+
+    def stats(self):
+        """
+        The stats function gives the state of the pool and its checkout statistics so far.
+
+        Returns:
+            dict: Pool size, connections checked in and out, overflow, checkouts, checkins, most connections checked out at once,
+                timeouts and total, mean and max wait time in seconds.
+        """
+        with self.stats_lock:
+            return {'pool_size': self.size(), 'checked_in': self.checkedin(), 'checked_out': self.checkedout(), 'overflow': self.overflow(),
+                    'checkouts': self.checkouts, 'checkins': self.checkins, 'max_checked_out': self.max_checked_out,
+                    'timeouts': self.timeouts, 'total_wait_time': round(self.total_wait_time, 6),
+                    'mean_wait_time': round(self.total_wait_time / self.checkouts, 6) if self.checkouts else 0.0,
+                    'max_wait_time': round(self.max_wait_time, 6)}
 
 
 class DatabaseConnector:
     """
     A utility class for handling database connections and operations.
     """
+    copy_null = '\\N'  # Written for missing values by copy_from_stdin, as empty fields are empty strings
+
     @staticmethod
     def read_db_creds(file_path: str):
         """
@@ -24,34 +99,363 @@ class DatabaseConnector:
         return credentials
     
     @staticmethod
-    def init_db_engine(credentials: dict):
+    def create_pooled_engine(url: str, pool_size: int = 5, max_overflow: int = 10, pool_timeout: float = 30, pool_recycle: int = 1800,
+                             pool_pre_ping: bool = True, statement_timeout_ms: int = None):
+        """
+        The create_pooled_engine function creates a database engine whose connections are pooled and shared safely by the threads
+        that use it, e.g. the concurrent stages of the pipeline.
+
+        Args:
+            url (str): Database URL.
+            pool_size (int): Number of connections kept open in the pool.
+            max_overflow (int): Number of extra connections opened when all pooled ones are in use, closed once returned.
+            pool_timeout (float): Seconds to wait for a free connection before raising an error.
+            pool_recycle (int): Seconds after which a connection is replaced, before the server or a firewall drops it.
+            pool_pre_ping (bool): Whether to test each connection when it is checked out, replacing it if the server closed it.
+            statement_timeout_ms (int): Milliseconds after which PostgreSQL cancels a statement. None sets no timeout.
+
+        Returns:
+            sqlalchemy.engine.Engine: Database engine.
+        """
+        connect_args = {}
+        if statement_timeout_ms is not None and url.startswith('postgresql'):
+            connect_args['options'] = f"-c statement_timeout={int(statement_timeout_ms)}"
+        return create_engine(url, poolclass=InstrumentedQueuePool, pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout,
+                             pool_recycle=pool_recycle, pool_pre_ping=pool_pre_ping, connect_args=connect_args)
+
+    @staticmethod
+    def init_db_engine(credentials: dict, **pool_options):
         """
         The init_db_engine function initializes the database engine based on the provided credentials.
+        Both engines pool their connections, see create_pooled_engine; dispose of them with dispose_engines once they are no longer needed.
 
         Args:
             credentials (dict): Dictionary containing database connection details.
+            **pool_options: Arguments passed on to create_pooled_engine, e.g. pool_size or statement_timeout_ms.
 
         Returns:
             tuple: A tuple containing database engine objects.
         """
-        engine = create_engine(f"{credentials['RDS_DATABASE_TYPE']}+{credentials['RDS_DBAPI']}://{credentials['RDS_USER']}:{credentials['RDS_PASSWORD']}@{credentials['RDS_HOST']}:{credentials['RDS_PORT']}/{credentials['RDS_DATABASE']}")
-        engine2 = create_engine(f"{credentials['DATABASE_TYPE']}+{credentials['DBAPI']}://{credentials['USER']}:{credentials['PASSWORD']}@{credentials['HOST']}:{credentials['PORT']}/{credentials['DATABASE']}")
+        engine = DatabaseConnector.create_pooled_engine(f"{credentials['RDS_DATABASE_TYPE']}+{credentials['RDS_DBAPI']}://{credentials['RDS_USER']}:{credentials['RDS_PASSWORD']}@{credentials['RDS_HOST']}:{credentials['RDS_PORT']}/{credentials['RDS_DATABASE']}", **pool_options)
+        engine2 = DatabaseConnector.create_pooled_engine(f"{credentials['DATABASE_TYPE']}+{credentials['DBAPI']}://{credentials['USER']}:{credentials['PASSWORD']}@{credentials['HOST']}:{credentials['PORT']}/{credentials['DATABASE']}", **pool_options)
 
         return engine, engine2
+
+    @staticmethod
+    def pool_stats(engine):
+        """
+        The pool_stats function gives the connection pool statistics of an engine.
+
+        Args:
+            engine: Database engine object.
+
+        Returns:
+            dict: Statistics of the pool (see InstrumentedQueuePool.stats), or its status for other pool classes.
+        """
+        if isinstance(engine.pool, InstrumentedQueuePool):
+            return engine.pool.stats()
+        return {'status': engine.pool.status()}
+
+    @staticmethod
+    def dispose_engines(engines: dict):
+        """
+        The dispose_engines function closes the pooled connections of engines once they are no longer needed,
+        printing the statistics of each pool first.
+
+        Args:
+            engines (dict): Name -> database engine object.
+
+        Returns:
+            dict: Name -> statistics of the engine's pool, taken before it was disposed.
+        """
+        engine_stats = {}
+        for engine_name, engine in engines.items():
+            engine_stats[engine_name] = DatabaseConnector.pool_stats(engine)
+            print(f"Connection pool of '{engine_name}': {engine_stats[engine_name]}")
+            engine.dispose()
+        return engine_stats
     
     @staticmethod
-    def upload_to_db(selected_table_df, selected_table: str, engine2):
+    def read_high_water_mark(table_name: str, watermark_column: str, engine2):
+        """
+        The read_high_water_mark function finds the highest value of a watermark column in a table already loaded to the database,
+        i.e. the point up to which the source table has been loaded.
+
+        Args:
+            table_name (str): Name of the database table.
+            watermark_column (str): Column that increases with every new row, e.g. 'level_0' or 'index'.
+            engine2: Database engine object.
+
+        Returns:
+            The highest value of the watermark column, or None if the table does not exist or is empty.
+        """
+        if not inspect(engine2).has_table(table_name):
+            return None
+        with engine2.connect() as connection:
+            return connection.execute(select(func.max(column(watermark_column))).select_from(table(table_name))).scalar()
+
+    @staticmethod
+    def has_primary_key(table_name: str, engine2):
+        """
+        The has_primary_key function checks whether a database table exists and has a primary key,
+        e.g. to tell whether the star-schema has already been built.
+
+        Args:
+            table_name (str): Name of the database table.
+            engine2: Database engine object.
+
+        Returns:
+            bool: True if the table has a primary key.
+        """
+        inspector = inspect(engine2)
+        return inspector.has_table(table_name) and bool(inspector.get_pk_constraint(table_name)['constrained_columns'])
+
+    @staticmethod
+    def run_sql_file(sql_path: str, engine2):
+        """
+        The run_sql_file function runs the SQL statements in a file against the database in a single transaction,
+        e.g. _05_SQL/_01_star_schema_sales_data.sql to complete the star-schema once all tables have been uploaded.
+
+        Args:
+            sql_path (str): Path to the .sql file.
+            engine2: Database engine object.
+        """
+        with open(sql_path, 'r', encoding='utf-8') as file:
+            sql = file.read()
+        with engine2.begin() as connection:
+            connection.execution_options(no_parameters=True).exec_driver_sql(sql)  # no_parameters leaves '%' in the SQL untouched
+        print(f"Ran '{sql_path}'.\n")
+
+    @staticmethod
+    def copy_from_stdin(table, conn, keys, data_iter):
+        """
+        The copy_from_stdin function is passed to DataFrame.to_sql as its insertion method on PostgreSQL.
+        It writes the rows of each chunk to an in-memory CSV buffer and streams it into the table with COPY FROM STDIN,
+        which is much faster than inserting the rows one statement at a time. Missing values are written as \\N, the NULL string
+        of the COPY, so that empty strings are loaded as empty strings rather than NULL. A text value of exactly \\N is loaded as NULL.
+
+        Args:
+            table (pandas.io.sql.SQLTable): Table being written to.
+            conn (sqlalchemy.engine.Connection): Connection used by to_sql.
+            keys (list): Column names.
+            data_iter (iterable): Rows of the chunk being written.
+        """
+        dbapi_conn = conn.connection
+        with dbapi_conn.cursor() as cursor:
+            buffer = StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows([DatabaseConnector.copy_null if value is None else value for value in row] for row in data_iter)  # to_sql gives missing values as None
+            buffer.seek(0)
+
+            columns = ', '.join(f'"{key}"' for key in keys)
+            table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+            cursor.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{DatabaseConnector.copy_null}')", buffer)
+
+    @staticmethod
+    def column_sql_type(selected_column):
+        """
+        The column_sql_type function gives the column type pandas would create a DataFrame column with in DataFrame.to_sql.
+
+        Args:
+            selected_column (pd.Series): The DataFrame column.
+
+        Returns:
+            sqlalchemy.types.TypeEngine: Column type.
+        """
+        if pd.api.types.is_bool_dtype(selected_column.dtype):
+            return Boolean()
+        if pd.api.types.is_integer_dtype(selected_column.dtype):
+            return BigInteger()
+        if pd.api.types.is_float_dtype(selected_column.dtype):
+            return Float(precision=53)
+        if pd.api.types.is_datetime64_any_dtype(selected_column.dtype):
+            return DateTime()
+        return Text()
+
+    @staticmethod
+    def create_table(selected_table_df, selected_table: str, engine2, dtype: dict = None, primary_key: str = None,
+                     foreign_keys: dict = None, if_exists: str = 'replace'):
+        """
+        The create_table function creates an empty database table for a DataFrame with its final column types, primary key and
+        foreign keys, so the rows can then be appended with upload_to_db and the table needs no ALTER TABLE afterwards.
+        Tables referenced by the foreign keys must already exist. When a table is replaced, the foreign keys of other tables
+        referencing it are dropped first, as PostgreSQL will not drop a referenced table; add them back with add_foreign_keys
+        once the rows of the new table are loaded.
+
+        Args:
+            selected_table_df (DataFrame): DataFrame holding the columns of the table, e.g. its first chunk.
+            selected_table (str): Name of the database table.
+            engine2: Database engine object.
+            dtype (dict): Column -> SQLAlchemy type. Other columns get the type pandas would give them.
+            primary_key (str): Column of the primary key, if any.
+            foreign_keys (dict): Constraint name -> (column, referenced table). The column references the column of the same name.
+            if_exists (str): 'replace' to drop and recreate an existing table, 'append' to keep it.
+        """
+        if if_exists == 'append' and inspect(engine2).has_table(selected_table):
+            return
+
+        metadata = MetaData()
+        foreign_keys = foreign_keys or {}
+        if foreign_keys:
+            metadata.reflect(engine2, only=sorted({referenced_table for _, referenced_table in foreign_keys.values()}))  # Resolve the referenced keys
+        columns = [Column(column_name, (dtype or {}).get(column_name) or DatabaseConnector.column_sql_type(selected_table_df[column_name]),
+                          primary_key=column_name == primary_key) for column_name in selected_table_df.columns]
+        constraints = [ForeignKeyConstraint([column_name], [f"{referenced_table}.{column_name}"], name=constraint_name)
+                       for constraint_name, (column_name, referenced_table) in foreign_keys.items()]
+        new_table = Table(selected_table, metadata, *columns, *constraints)
+
+        DatabaseConnector.drop_referencing_foreign_keys(selected_table, engine2)
+        new_table.drop(engine2, checkfirst=True)
+        new_table.create(engine2)
+        print(f"Created table '{selected_table}' with {len(columns)} columns{f', primary key {primary_key}' if primary_key else ''}"
+              f"{f' and {len(constraints)} foreign keys' if constraints else ''}.")
+
+    @staticmethod
+    def drop_referencing_foreign_keys(selected_table: str, engine2):
+        """
+        The drop_referencing_foreign_keys function drops the foreign keys of other tables that reference a table, e.g. the foreign keys
+        of 'orders_table' before a dimension table is replaced. SQLite drops a referenced table anyway and keeps the foreign keys
+        of the tables referencing it, so nothing is dropped there.
+
+        Args:
+            selected_table (str): Name of the referenced database table.
+            engine2: Database engine object.
+
+        Returns:
+            list: (table, constraint name) of each dropped foreign key.
+        """
+        inspector = inspect(engine2)
+        if engine2.dialect.name == 'sqlite' or not inspector.has_table(selected_table):
+            return []
+        referencing_keys = [(table_name, foreign_key['name']) for table_name in inspector.get_table_names() if table_name != selected_table
+                            for foreign_key in inspector.get_foreign_keys(table_name) if foreign_key['referred_table'] == selected_table]
+        quote = engine2.dialect.identifier_preparer.quote
+        with engine2.begin() as connection:
+            for table_name, constraint_name in referencing_keys:
+                connection.exec_driver_sql(f"ALTER TABLE {quote(table_name)} DROP CONSTRAINT {quote(constraint_name)}")
+        if referencing_keys:
+            print(f"Dropped foreign keys {[constraint_name for _, constraint_name in referencing_keys]} referencing '{selected_table}'.")
+        return referencing_keys
+
+    @staticmethod
+    def add_foreign_keys(selected_table: str, foreign_keys: dict, engine2):
+        """
+        The add_foreign_keys function adds the foreign keys a table is missing, e.g. those of 'orders_table' dropped when a dimension
+        table was replaced (see drop_referencing_foreign_keys). Existing rows are checked against the referenced tables as the keys are added.
+        Nothing is added when the table or a referenced table does not exist, or on SQLite, which cannot add constraints to a table.
+
+        Args:
+            selected_table (str): Name of the database table, e.g. 'orders_table'.
+            foreign_keys (dict): Constraint name -> (column, referenced table). The column references the column of the same name.
+            engine2: Database engine object.
+
+        Returns:
+            list: Names of the foreign keys added.
+        """
+        inspector = inspect(engine2)
+        table_names = {selected_table} | {referenced_table for _, referenced_table in foreign_keys.values()}
+        if not all(inspector.has_table(table_name) for table_name in table_names):
+            return []
+        existing_keys = {foreign_key['name'] for foreign_key in inspector.get_foreign_keys(selected_table)}
+        missing_keys = {constraint_name: foreign_key for constraint_name, foreign_key in foreign_keys.items() if constraint_name not in existing_keys}
+        if not missing_keys:
+            return []
+        if engine2.dialect.name == 'sqlite':
+            print(f"Warning: foreign keys {list(missing_keys)} of '{selected_table}' cannot be added on SQLite.")
+            return []
+
+        metadata = MetaData()
+        metadata.reflect(engine2, only=sorted(table_names))
+        with engine2.begin() as connection:
+            for constraint_name, (column_name, referenced_table) in missing_keys.items():
+                constraint = ForeignKeyConstraint([column_name], [f"{referenced_table}.{column_name}"], name=constraint_name)
+                metadata.tables[selected_table].append_constraint(constraint)
+                connection.execute(AddConstraint(constraint))
+        print(f"Added foreign keys {list(missing_keys)} to '{selected_table}'.")
+        return list(missing_keys)
+
+    @staticmethod
+    def upload_to_db(selected_table_df, selected_table: str, engine2, if_exists: str = 'replace', bulk: bool = True, chunksize: int = 50000, dtype: dict = None):
         """
         The upload_to_db function takes a DataFrame, the name of a database table, and an engine object as arguments.
         It then uploads the data in the DataFrame to the database table in pgAdmin 4 using SQLAlchemy.
+        On PostgreSQL the rows are bulk loaded with COPY FROM STDIN; other databases fall back to executemany batches.
 
         Args:
             selected_table_df (DataFrame): DataFrame containing the data to be uploaded.
             selected_table (str): Name of the database table.
             engine2: Database engine object.
+            if_exists (str): 'replace' to recreate the table, 'append' to add the rows to it (e.g. for later chunks of a table).
+            bulk (bool): Whether to use COPY on PostgreSQL. False uses the default INSERT path.
+            chunksize (int): Number of rows sent to the database per batch.
+            dtype (dict): Column -> SQLAlchemy type to create the table with (see DtypePlanner.plan_table). None lets pandas infer the types.
+        """
+        method = DatabaseConnector.copy_from_stdin if bulk and engine2.dialect.name == 'postgresql' else None  # None uses executemany batches
+
+        start_time = time.perf_counter()
+        selected_table_df.to_sql(selected_table, engine2, if_exists=if_exists, index=False, method=method, chunksize=chunksize, dtype=dtype)
+        elapsed_time = time.perf_counter() - start_time
+
+        rows_per_second = len(selected_table_df) / elapsed_time if elapsed_time > 0 else float('inf')
+        print(f"Data uploaded to table '{selected_table}': {len(selected_table_df)} rows in {elapsed_time:.2f}s ({rows_per_second:,.0f} rows/sec).\n")
+
+    @staticmethod
+    def upsert_to_db(selected_table_df, selected_table: str, key_column: str, engine2, chunksize: int = 50000, dtype: dict = None):
         """
-        selected_table_df.to_sql(selected_table, engine2, if_exists='replace', index=False)
-        print(f"Data uploaded to table '{selected_table}'.\n")
+        The upsert_to_db function merges a DataFrame into an existing database table instead of recreating it, so the table keeps
+        its primary key, the foreign keys referencing it, its indexes and its planner statistics.
+        The rows are loaded into a temporary staging table, then merged in one INSERT ... ON CONFLICT statement on the key column:
+        new keys are inserted and existing rows are only updated when one of their values has changed.
+        If the table does not exist yet it is created with upload_to_db instead.
+
+        Args:
+            selected_table_df (DataFrame): DataFrame containing the data to be merged.
+            selected_table (str): Name of the database table.
+            key_column (str): Natural key of the table, e.g. 'user_uuid'. It must have a primary key or unique constraint.
+            engine2: Database engine object (PostgreSQL or SQLite).
+            chunksize (int): Number of rows sent to the staging table per batch.
+            dtype (dict): Column -> SQLAlchemy type to create the table with, if it does not exist yet, and to write the staged values as.
+                Other columns are written as the type of the table's column, which on SQLite loses e.g. a UUID type.
+
+        Returns:
+            int: Number of rows inserted or updated, e.g. 0 when the table already held the same rows.
+        """
+        if not inspect(engine2).has_table(selected_table):
+            print(f"Table '{selected_table}' does not exist yet; creating it.")
+            DatabaseConnector.upload_to_db(selected_table_df, selected_table, engine2, chunksize=chunksize, dtype=dtype)
+            return len(selected_table_df)
+
+        start_time = time.perf_counter()
+        target_table = Table(selected_table, MetaData(), autoload_with=engine2)
+        columns = [column_name for column_name in selected_table_df.columns if column_name in target_table.c]
+        skipped_columns = [column_name for column_name in selected_table_df.columns if column_name not in target_table.c]
+        if skipped_columns:
+            print(f"Columns {skipped_columns} are not in table '{selected_table}' and are not merged.")
+        merged_df = selected_table_df[columns].drop_duplicates(subset=key_column, keep='last')  # A key can only be merged once per statement
+
+        dialect_insert = postgresql.insert if engine2.dialect.name == 'postgresql' else sqlite.insert
+        staging_name = f"{selected_table}_staging"
+        quote = engine2.dialect.identifier_preparer.quote
+        empty_copy = select(*[target_table.c[column_name] for column_name in columns]).where(false())  # Same column types as the target table
+        method = DatabaseConnector.copy_from_stdin if engine2.dialect.name == 'postgresql' else None
 
+        with engine2.begin() as connection:
+            connection.exec_driver_sql(f"CREATE TEMPORARY TABLE {quote(staging_name)} AS "
+                                       f"{empty_copy.compile(dialect=engine2.dialect, compile_kwargs={'literal_binds': True})}")
+            merged_df.to_sql(staging_name, connection, if_exists='append', index=False, method=method, chunksize=chunksize,
+                             dtype={column_name: (dtype or {}).get(column_name) or target_table.c[column_name].type for column_name in columns})  # Bind the values as the target table stores them
 
+            staging_table = table(staging_name, *[column(column_name) for column_name in columns])
+            statement = dialect_insert(target_table).from_select(columns, select(staging_table).where(true()))  # WHERE true lets SQLite parse ON CONFLICT after a SELECT
+            update_columns = [column_name for column_name in columns if column_name != key_column]
+            statement = statement.on_conflict_do_update(
+                index_elements=[key_column],
+                set_={column_name: statement.excluded[column_name] for column_name in update_columns},
+                where=or_(*[target_table.c[column_name].is_distinct_from(statement.excluded[column_name]) for column_name in update_columns])  # Only touch changed rows
+            )
+            changed_rows = connection.execute(statement).rowcount
+            connection.exec_driver_sql(f"DROP TABLE {quote(staging_name)}")
 
+        elapsed_time = time.perf_counter() - start_time
+        print(f"Data merged into table '{selected_table}': {changed_rows} of {len(merged_df)} rows inserted or updated in {elapsed_time:.2f}s.\n")
+        return changed_rows
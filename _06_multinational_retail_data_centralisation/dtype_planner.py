@@ -0,0 +1,96 @@
+from sqlalchemy.types import Boolean, Date, Float, SmallInteger, String, Uuid # column types of the star-schema
+
+import numpy as np # range of a smallint
+import pandas as pd
+
+
+class DtypePlanner:
+    """
+    A utility class for converting the cleaned tables to compact dtypes before they are uploaded, following the column types
+    of the star-schema in _05_SQL/_01_star_schema_sales_data.sql. The tables are then created with those column types directly,
+    so the ALTER TABLE ... USING casts that rewrite each table after it is loaded are not needed.
+    Text columns with few distinct values become categoricals and the others Arrow-backed strings, which hold UUIDs and card numbers
+    in one contiguous buffer rather than as Python objects. Dates become datetime64 and small counts 16-bit integers.
+    Columns that are not part of the star-schema keep their dtypes.
+    """
+    # Uploaded table name -> column -> star-schema type
+    table_schemas = {
+        'orders_table': {'date_uuid': 'uuid', 'user_uuid': 'uuid', 'card_number': 'varchar', 'store_code': 'varchar',
+                         'product_code': 'varchar', 'product_quantity': 'smallint'},
+        'dim_users': {'first_name': 'varchar', 'last_name': 'varchar', 'date_of_birth': 'date', 'country_code': 'varchar',
+                      'user_uuid': 'uuid', 'join_date': 'date'},
+        'dim_store_details': {'longitude': 'float', 'locality': 'varchar', 'store_code': 'varchar', 'staff_numbers': 'smallint',
+                              'opening_date': 'date', 'store_type': 'varchar', 'latitude': 'float', 'country_code': 'varchar',
+                              'continent': 'varchar'},
+        'dim_products': {'product_price_(gbp)': 'float', 'weight_(kg)': 'float', 'EAN': 'varchar', 'product_code': 'varchar',
+                         'date_added': 'date', 'uuid': 'uuid', 'still_available': 'boolean', 'weight_class': 'varchar'},
+        'dim_date_times': {'month': 'varchar', 'year': 'varchar', 'day': 'varchar', 'time_period': 'varchar', 'date_uuid': 'uuid'},
+        'dim_card_details': {'card_number': 'varchar', 'expiry_date': 'varchar', 'date_payment_confirmed': 'date'},
+    }
+
+    # Star-schema type -> SQLAlchemy column type the table is created with
+    sql_types = {'uuid': Uuid(as_uuid=False), 'varchar': String(255), 'smallint': SmallInteger(), 'float': Float(),
+                 'date': Date(), 'boolean': Boolean()}
+
+    @staticmethod
+    def plan_column(column, column_type: str, category_threshold: float = 0.5):
+        """
+        The plan_column function converts a column to the compact dtype for its star-schema type.
+        Values that cannot be converted, e.g. 'N/A' in a numeric column, become missing values.
+        A number outside the range of a smallint, or with a fraction, raises a ValueError, as the database would reject it.
+
+        Args:
+            column (pd.Series): The column to convert.
+            column_type (str): Star-schema type, one of the keys of sql_types.
+            category_threshold (float): Text columns whose share of distinct values is below this become categoricals.
+
+        Returns:
+            pd.Series: The converted column.
+        """
+        if column_type == 'uuid':
+            return column.astype('string[pyarrow]')
+        if column_type == 'varchar':
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                return column
+            text = column.astype('string[pyarrow]')  # Also turns numbers, e.g. card numbers, into text
+            if len(text) and text.nunique() / len(text) < category_threshold:
+                return text.astype('category')
+            return text
+        if column_type == 'smallint':
+            numbers = pd.to_numeric(column, errors='coerce')
+            not_smallint = numbers.notna() & ((numbers < np.iinfo(np.int16).min) | (numbers > np.iinfo(np.int16).max) | (numbers % 1 != 0))
+            if not_smallint.any():  # Would be rejected by the database, so report the column rather than pandas' cast error
+                raise ValueError(f"Column '{column.name}' holds values that are not smallint, e.g. {numbers[not_smallint].iloc[0]}.")
+            return numbers.astype('Int16')
+        if column_type == 'float':
+            return pd.to_numeric(column, errors='coerce').astype('float64')
+        if column_type == 'date':
+            return pd.to_datetime(column, errors='coerce')
+        if column_type == 'boolean':
+            return column.astype('boolean')
+        raise ValueError(f"Unknown column type '{column_type}'. Expected one of {list(DtypePlanner.sql_types)}.")
+
+    @staticmethod
+    def plan_table(cleaned_df, uploaded_table_name: str):
+        """
+        The plan_table function converts the columns of a cleaned table to compact dtypes and gives the column types to create it with.
+        The columns are replaced on a shallow copy, so the cleaned DataFrame is not changed.
+
+        Args:
+            cleaned_df (pd.DataFrame): The cleaned table, with the columns of the star-schema (see DataCleaning.match_star_schema).
+            uploaded_table_name (str): Name of the database table, e.g. 'dim_users'.
+
+        Returns:
+            tuple: The converted DataFrame, and a dict of column -> SQLAlchemy type to pass to DataFrame.to_sql.
+        """
+        table_schema = DtypePlanner.table_schemas.get(uploaded_table_name, {})
+        planned_df = cleaned_df.copy(deep=False)
+        column_types = {}
+        for column_name, column_type in table_schema.items():
+            if column_name in planned_df.columns:
+                planned_df[column_name] = DtypePlanner.plan_column(planned_df[column_name], column_type)
+                column_types[column_name] = DtypePlanner.sql_types[column_type]
+
+        memory_before, memory_after = cleaned_df.memory_usage(deep=True).sum(), planned_df.memory_usage(deep=True).sum()
+        print(f"Planned dtypes of '{uploaded_table_name}': {memory_before / 1024 ** 2:.1f} MiB -> {memory_after / 1024 ** 2:.1f} MiB.")
+        return planned_df, column_types
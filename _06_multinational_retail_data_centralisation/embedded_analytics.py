@@ -0,0 +1,199 @@
+from _06_multinational_retail_data_centralisation.data_cleaning import DataCleaning
+from _06_multinational_retail_data_centralisation.dtype_planner import DtypePlanner
+from _06_multinational_retail_data_centralisation.index_advisor import IndexAdvisor
+from _06_multinational_retail_data_centralisation.table_staging import TableStaging
+
+import glob # to find the staged incremental loads
+import os # to find the staged tables and count the cores
+import pyarrow as pa # to hand the transformed tables to DuckDB
+import time # to time each query
+
+try:
+    import duckdb # embedded, vectorised SQL engine; optional
+except ImportError:
+    duckdb = None
+
+
+class EmbeddedAnalytics:
+    """
+    A utility class for answering the business questions of _05_SQL/_02_queries.sql straight from the cleaned tables staged in
+    _03_cleaned_tables_csv, with DuckDB in the Python process instead of the PostgreSQL database. No server is needed, and the
+    queries run on every core.
+    Each star-schema table becomes a DuckDB view with the star-schema column types (see DtypePlanner). The orders and date
+    events are scanned from their Parquet or CSV files by the queries themselves, so they are never loaded into pandas;
+    Feather files are memory-mapped as Arrow tables.
+    The small store and product tables are read into pandas first, to apply the changes the star-schema SQL makes to them
+    (see DataCleaning.match_star_schema).
+    """
+    # Star-schema table -> name of its cleaned staged table
+    staged_tables = {'dim_users': 'legacy_users_data_cleaned', 'dim_card_details': 'card_details_data_cleaned',
+                     'dim_store_details': 'store_details_data_cleaned', 'dim_products': 'products_details_data_cleaned',
+                     'dim_date_times': 'date_details_data_cleaned', 'orders_table': 'orders_table_data_cleaned'}
+    orders_delta_prefix, cleaned_suffix = 'orders_table_delta', '_data_cleaned'  # New orders staged by each incremental load, see main.py
+    transformed_tables = ['dim_store_details', 'dim_products']  # Tables DataCleaning.match_star_schema changes
+    duckdb_types = {'uuid': 'VARCHAR', 'varchar': 'VARCHAR', 'smallint': 'SMALLINT', 'float': 'DOUBLE', 'date': 'DATE', 'boolean': 'BOOLEAN'}
+
+    @staticmethod
+    def find_staged_file(folder_path: str, staged_name: str):
+        """
+        The find_staged_file function finds a staged table in any of the staging formats, preferring the columnar ones.
+
+        Args:
+            folder_path (str): Folder holding the staged tables.
+            staged_name (str): Name of the staged table, e.g. 'orders_table_data_cleaned'.
+
+        Returns:
+            str: Path of the staged file, or None if the table has not been staged.
+        """
+        for staging_format in ['parquet', 'feather', 'csv']:
+            staged_filename = TableStaging.table_path(folder_path, staged_name, staging_format)
+            if os.path.exists(staged_filename):
+                return staged_filename
+        return None
+
+    @staticmethod
+    def scan_sql(connection, staged_filename: str, table_name: str):
+        """
+        The scan_sql function builds the query reading a staged file with the star-schema column types of its table.
+        Values that cannot be converted become NULL, as with the casts of the star-schema SQL.
+        A Feather file, which DuckDB cannot read itself, is memory-mapped and registered with the connection as an Arrow table.
+
+        Args:
+            connection: DuckDB connection.
+            staged_filename (str): Path of a Parquet, Feather or CSV file.
+            table_name (str): Star-schema table the file holds.
+
+        Returns:
+            str: SELECT statement over the file.
+        """
+        quoted_filename = staged_filename.replace("'", "''")
+        if staged_filename.endswith('.parquet'):
+            scan = f"read_parquet('{quoted_filename}')"
+        elif staged_filename.endswith('.feather'):
+            import pyarrow.feather as feather
+            scan = f'"{os.path.basename(staged_filename)}"'
+            connection.register(os.path.basename(staged_filename), feather.read_table(staged_filename, memory_map=True))
+        else:
+            scan = f"read_csv('{quoted_filename}', all_varchar = true)"  # Typed below, so card numbers keep their digits
+        file_columns = [row[0] for row in connection.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()]
+        casts = [f'TRY_CAST("{column_name}" AS {EmbeddedAnalytics.duckdb_types[column_type]}) AS "{column_name}"'
+                 for column_name, column_type in DtypePlanner.table_schemas.get(table_name, {}).items() if column_name in file_columns]
+        replaced_columns = f"REPLACE ({', '.join(casts)}) " if casts else ''
+        return f"SELECT * {replaced_columns}FROM {scan}"
+
+    @staticmethod
+    def find_orders_deltas(folder_path: str):
+        """
+        The find_orders_deltas function finds the orders staged by each incremental load, named after the high-water mark
+        they were loaded above, e.g. 'orders_table_delta_120122_data_cleaned'.
+
+        Args:
+            folder_path (str): Folder holding the cleaned staged tables.
+
+        Returns:
+            list: (high-water mark, or None if the name does not give one, path of the staged file), in order of high-water mark.
+        """
+        prefix, suffix = EmbeddedAnalytics.orders_delta_prefix, EmbeddedAnalytics.cleaned_suffix
+        staged_names = {os.path.basename(path).rsplit('.', 1)[0] for path in glob.glob(os.path.join(folder_path, f"{prefix}*{suffix}.*"))}
+        deltas = []
+        for staged_name in staged_names:
+            staged_filename = EmbeddedAnalytics.find_staged_file(folder_path, staged_name)  # The columnar file, when also exported as CSV
+            if staged_filename is None:
+                continue
+            high_water_mark = staged_name[len(prefix):-len(suffix)].lstrip('_')
+            deltas.append((int(high_water_mark) if high_water_mark.lstrip('-').isdigit() else None, staged_filename))
+        return sorted(deltas, key=lambda delta: (delta[0] is not None, delta[0] or 0, delta[1]))
+
+    @staticmethod
+    def union_orders_deltas(connection, orders_sql: str, deltas: list, watermark_column: str = 'index'):
+        """
+        The union_orders_deltas function adds to the orders the ones staged by the incremental loads, see find_orders_deltas.
+        Only the orders above the highest watermark of the full table are taken from them, so a full load run after them is not
+        counted twice. A warning is printed when the deltas do not follow on from the full table or from each other, i.e. when
+        an incremental load is missing from the folder, as the orders it loaded are then missing from the answers.
+
+        Args:
+            connection: DuckDB connection.
+            orders_sql (str): SELECT statement over the full orders table, see scan_sql.
+            deltas (list): (high-water mark, path of the staged file) of each incremental load, in order of high-water mark.
+            watermark_column (str): Column of the orders that increases with every new order.
+
+        Returns:
+            str: SELECT statement over all the staged orders.
+        """
+        watermark = f'TRY_CAST("{watermark_column}" AS BIGINT)'
+        full_high_water_mark = connection.execute(f"SELECT max({watermark}) FROM ({orders_sql})").fetchone()[0]
+        loaded_high_water_mark = full_high_water_mark
+        union_sql = f"SELECT * FROM ({orders_sql})"
+        for high_water_mark, delta_filename in deltas:
+            delta_sql = EmbeddedAnalytics.scan_sql(connection, delta_filename, 'orders_table')
+            delta_high_water_mark = connection.execute(f"SELECT max({watermark}) FROM ({delta_sql})").fetchone()[0]
+            if high_water_mark is not None and loaded_high_water_mark is not None and high_water_mark > loaded_high_water_mark:
+                print(f"Warning: '{os.path.basename(delta_filename)}' holds the orders above {high_water_mark}, but the staged orders end at "
+                      f"{loaded_high_water_mark}. An incremental load is missing, so 'orders_table' lacks the orders in between.")
+            if delta_high_water_mark is not None:
+                loaded_high_water_mark = max(loaded_high_water_mark if loaded_high_water_mark is not None else delta_high_water_mark, delta_high_water_mark)
+            new_orders_filter = f" WHERE {watermark} > {full_high_water_mark}" if full_high_water_mark is not None else ''
+            union_sql += f" UNION ALL BY NAME SELECT * FROM ({delta_sql}){new_orders_filter}"
+        return union_sql
+
+    @staticmethod
+    def connect(folder_path: str = '_03_cleaned_tables_csv', threads: int = None, watermark_column: str = 'index'):
+        """
+        The connect function opens an in-memory DuckDB database holding a view of each star-schema table over the cleaned staged files.
+        The orders staged by the incremental loads are added to 'orders_table', see union_orders_deltas.
+
+        Args:
+            folder_path (str): Folder holding the cleaned staged tables.
+            threads (int): Number of threads the queries run on, defaults to the number of cores.
+            watermark_column (str): Column of the orders that increases with every new order.
+
+        Returns:
+            duckdb.DuckDBPyConnection: Connection to query the views with.
+        """
+        if duckdb is None:
+            raise ImportError("The embedded analytics need duckdb: pip install duckdb")
+        connection = duckdb.connect(config={'threads': threads or os.cpu_count()})
+
+        for table_name, staged_name in EmbeddedAnalytics.staged_tables.items():
+            staged_filename = EmbeddedAnalytics.find_staged_file(folder_path, staged_name)
+            if staged_filename is None:
+                print(f"'{staged_name}' has not been staged in '{folder_path}'; '{table_name}' is not available.")
+                continue
+
+            if table_name in EmbeddedAnalytics.transformed_tables:
+                staged_df = DataCleaning.match_star_schema(TableStaging.read_table(staged_filename), table_name)
+                planned_df, _ = DtypePlanner.plan_table(staged_df, table_name)
+                connection.register(table_name, pa.Table.from_pandas(planned_df, preserve_index=False))  # A view over the Arrow table
+                continue
+
+            table_sql = EmbeddedAnalytics.scan_sql(connection, staged_filename, table_name)
+            if table_name == 'orders_table':
+                table_sql = EmbeddedAnalytics.union_orders_deltas(connection, table_sql, EmbeddedAnalytics.find_orders_deltas(folder_path), watermark_column)
+            connection.execute(f'CREATE VIEW "{table_name}" AS {table_sql}')
+        return connection
+
+    @staticmethod
+    def run_workload(connection, sql_path: str = os.path.join('_05_SQL', '_02_queries.sql')):
+        """
+        The run_workload function runs each query of a .sql file, e.g. _05_SQL/_02_queries.sql, against the views.
+        Queries DuckDB cannot run, e.g. those using PostgreSQL's to_timestamp with a format, are reported with their error
+        rather than stopping the others.
+
+        Args:
+            connection: DuckDB connection, see connect.
+            sql_path (str): Path to the .sql file.
+
+        Returns:
+            dict: Query name -> {'time_ms', 'result' (pd.DataFrame)} or {'error': message}.
+        """
+        results = {}
+        for query_name, query in IndexAdvisor.read_workload(sql_path).items():
+            start_time = time.perf_counter()
+            try:
+                result_df = connection.execute(query).df()
+            except Exception as e:
+                results[query_name] = {'error': str(e).splitlines()[0]}
+                continue
+            results[query_name] = {'time_ms': round((time.perf_counter() - start_time) * 1000, 3), 'result': result_df}
+        return results
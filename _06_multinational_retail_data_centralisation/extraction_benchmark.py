@@ -0,0 +1,336 @@
+from _06_multinational_retail_data_centralisation.benchmark import Benchmark
+from _06_multinational_retail_data_centralisation.data_cleaning import DataCleaning as dcl
+from _06_multinational_retail_data_centralisation.data_extraction import DataExtractor as dex
+from _06_multinational_retail_data_centralisation.database_utils import DatabaseConnector as dc
+from _06_multinational_retail_data_centralisation.json_streaming import JsonStreamReader
+from _06_multinational_retail_data_centralisation.synthetic_data import SyntheticDataGenerator
+from _06_multinational_retail_data_centralisation.table_staging import TableStaging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # stand-in for the stores API
+from sqlalchemy import create_engine # SQLite databases standing in for the RDS and sales_data
+
+import argparse # command line entry point
+import json # to answer the stub stores API and write the date events
+import os # to write the generated files
+import pandas as pd
+import shutil # to remove the staged stores and join the generated JSON
+import tempfile # to write the generated PDF and JSON files
+import threading # to serve the stub stores API
+import time # to time each read
+import tracemalloc # to measure the memory allocated by each read
+
+
+class ExtractionBenchmark(Benchmark):
+    """
+    A utility class for measuring the extraction of the orders from the RDS, the stores from the API, the card details PDF, the products
+    CSV in S3 and the date events JSON, comparing the concurrent and streaming readers of DataExtractor and JsonStreamReader with a single read.
+    """
+    def run_rds_extraction(self, number_of_orders: int = 2000000, chunksizes: list = None):
+        """
+        The run_rds_extraction function times the orders going from the RDS through cleaning and staging into sales_data, and their peak
+        memory, read in one go and streamed in chunks as main.py does (see DataExtractor.stream_rds_table and TableStaging.save_chunks),
+        and saves the results. SQLite databases stand in for the RDS and sales_data.
+
+        Args:
+            number_of_orders (int): Number of generated orders in the RDS table.
+            chunksizes (list): Numbers of rows per chunk to compare, defaults to None (one read) and 100000.
+
+        Returns:
+            dict: 'extract_rds@<rows>/<chunksize or whole>' -> wall time in seconds, peak memory allocated in bytes and number of rows.
+        """
+        rds_folder_path = tempfile.mkdtemp()
+        rds_engine = create_engine(f"sqlite:///{os.path.join(rds_folder_path, 'rds.db')}")
+        self.generator.orders_table(number_of_orders).to_sql('orders_table', rds_engine, index=False, chunksize=100000)
+        previous_results = self.load_results()
+        results = {}
+
+        def load_orders(chunksize, staging_folder_path):
+            engine2 = create_engine(f"sqlite:///{os.path.join(staging_folder_path, 'sales_data.db')}")
+            if chunksize is None:
+                cleaned_orders_df = dcl.clean_orders_data(dex.read_rds_table('orders_table', rds_engine), inplace=True)
+                TableStaging.save_table(cleaned_orders_df, staging_folder_path, 'orders_table_data_cleaned', 'parquet', index=True)
+                dc.upload_to_db(cleaned_orders_df, 'orders_table', engine2)
+            else:
+                cleaned_chunks = (dcl.clean_orders_data(chunk, inplace=True) for chunk in dex.read_rds_table('orders_table', rds_engine, chunksize=chunksize))
+                staged_chunks = TableStaging.save_chunks(cleaned_chunks, staging_folder_path, 'orders_table_data_cleaned', 'parquet', index=True)
+                for chunk_number, cleaned_chunk in enumerate(staged_chunks):
+                    dc.upload_to_db(cleaned_chunk, 'orders_table', engine2, if_exists='replace' if chunk_number == 0 else 'append')
+            engine2.dispose()
+
+        for chunksize in chunksizes or [None, 100000]:
+            staging_folder_path = tempfile.mkdtemp()
+            start_time = time.perf_counter()
+            load_orders(chunksize, staging_folder_path)
+            wall_time = time.perf_counter() - start_time
+            tracemalloc.start()
+            load_orders(chunksize, staging_folder_path)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            shutil.rmtree(staging_folder_path)
+
+            result_key = f"extract_rds@{number_of_orders}/{chunksize or 'whole'}"
+            results[result_key] = {'wall_time': round(wall_time, 6), 'peak_memory_bytes': peak_memory, 'rows_out': number_of_orders}
+            print(self.describe_result(result_key, results[result_key], previous_results.get(result_key)))
+
+        rds_engine.dispose()
+        shutil.rmtree(rds_folder_path)
+        self.save_results({**previous_results, **results})
+        return results
+
+    @staticmethod
+    def serve_stores(stores_df, latency_seconds: float):
+        """
+        The serve_stores function starts a stub of the stores API on localhost, answering GET /store_details/<n> with row n of a table
+        after a delay standing in for the round trip to the real API.
+
+        Args:
+            stores_df (pd.DataFrame): Stores to serve.
+            latency_seconds (float): Delay before each answer.
+
+        Returns:
+            ThreadingHTTPServer: Running server; call shutdown() once done.
+        """
+        store_bodies = [json.dumps(store_data, default=str).encode('utf-8') for store_data in stores_df.to_dict(orient='records')]
+
+        class StoreHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep connections alive, as the real API does
+            disable_nagle_algorithm = True  # Send the headers and body without waiting for an ACK
+
+            def do_GET(self):
+                time.sleep(latency_seconds)
+                body = store_bodies[int(self.path.rsplit('/', 1)[-1])]
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class StoreServer(ThreadingHTTPServer):
+            request_queue_size = 64  # Accept every worker's connection at once
+
+        server = StoreServer(('127.0.0.1', 0), StoreHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def run_store_retrieval(self, number_of_stores: int = 451, worker_counts: list = None, latency_seconds: float = 0.05):
+        """
+        The run_store_retrieval function times retrieving generated stores from a stub of the stores API, one after another and with
+        increasing numbers of workers (see DataExtractor.retrieve_stores_data), and saves the results.
+
+        Args:
+            number_of_stores (int): Number of stores served, 451 as in the real API.
+            worker_counts (list): Numbers of workers to compare, defaults to 1 (serial), 4, 16 and 32.
+            latency_seconds (float): Delay of the stub API before each answer.
+
+        Returns:
+            dict: 'extract_stores@<stores>/<workers>w' -> wall time in seconds and number of rows.
+        """
+        server = self.serve_stores(self.generator.store_details(number_of_stores), latency_seconds)
+        endpoint = f"http://127.0.0.1:{server.server_port}/store_details/{{store_number}}"
+        staging_folder_path = tempfile.mkdtemp()
+        previous_results = self.load_results()
+        results = {}
+
+        for max_workers in worker_counts or [1, 4, 16, 32]:
+            start_time = time.perf_counter()
+            stores_df, _, _ = dex.retrieve_stores_data(endpoint, {}, number_of_stores, staging_folder_path, staging_folder_path, max_workers=max_workers)
+            result_key = f"extract_stores@{number_of_stores}/{max_workers}w"
+            results[result_key] = {'wall_time': round(time.perf_counter() - start_time, 6), 'peak_memory_bytes': 0, 'rows_out': len(stores_df)}
+            print(self.describe_result(result_key, results[result_key], previous_results.get(result_key)))
+
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(staging_folder_path)
+        self.save_results({**previous_results, **results})
+        return results
+
+    def run_pdf_extraction(self, number_of_pages: int = 300, worker_counts: list = None, pages_per_task: int = 10):
+        """
+        The run_pdf_extraction function times the extraction of a generated card details PDF, read in one pass and then
+        in page ranges with increasing numbers of workers (see DataExtractor.stream_pdf_pages), and saves the results.
+
+        Args:
+            number_of_pages (int): Number of pages of the generated PDF.
+            worker_counts (list): Numbers of workers to compare, defaults to 1 (one pass), 2, 4 and 8.
+            pages_per_task (int): Number of pages in each range.
+
+        Returns:
+            dict: 'extract_pdf@<pages>p/<workers>w' -> wall time in seconds and number of rows.
+        """
+        import tabula # read tables in a PDF; only loaded for this benchmark
+
+        pdf_path = self.generator.card_details_pdf(os.path.join(tempfile.gettempdir(), f"card_details_{number_of_pages}_pages.pdf"), number_of_pages)
+        previous_results = self.load_results()
+        results = {}
+
+        for max_workers in worker_counts or [1, 2, 4, 8]:
+            start_time = time.perf_counter()
+            if max_workers == 1:
+                card_details_df = pd.concat(tabula.read_pdf(pdf_path, pages='all'))
+            else:
+                card_details_df = pd.concat(dex.stream_pdf_pages(pdf_path, max_workers, pages_per_task))
+            result_key = f"extract_pdf@{number_of_pages}p/{max_workers}w"
+            results[result_key] = {'wall_time': round(time.perf_counter() - start_time, 6), 'peak_memory_bytes': 0, 'rows_out': len(card_details_df)}
+            print(self.describe_result(result_key, results[result_key], previous_results.get(result_key)))
+
+        os.remove(pdf_path)
+        self.save_results({**previous_results, **results})
+        return results
+
+    def run_s3_extraction(self, s3_address: str, worker_counts: list = None, part_size: int = 8 * 1024 ** 2):
+        """
+        The run_s3_extraction function times the parsing of a CSV object in S3 and its peak memory, streamed from one GET and
+        then downloaded in byte ranges with increasing numbers of workers (see DataExtractor.read_s3_object), and saves the results.
+        Set AWS_ENDPOINT_URL to run it against a local stand-in for S3, e.g. MinIO.
+
+        Args:
+            s3_address (str): Address of the object, e.g. 's3://bucket/products.csv'.
+            worker_counts (list): Numbers of workers to compare, defaults to 1 (one GET), 2, 4 and 8.
+            part_size (int): Number of bytes in each range.
+
+        Returns:
+            dict: 'extract_s3@<object key>/<workers>w' -> wall time in seconds, peak memory allocated in bytes and number of rows.
+        """
+        previous_results = self.load_results()
+        results = {}
+
+        for max_workers in worker_counts or [1, 2, 4, 8]:
+            wall_times = []
+            for _ in range(self.repeats):
+                start_time = time.perf_counter()
+                products_df = dex.read_s3_object(s3_address, max_workers=max_workers, part_size=part_size, index_col=0)
+                wall_times.append(time.perf_counter() - start_time)
+            tracemalloc.start()
+            dex.read_s3_object(s3_address, max_workers=max_workers, part_size=part_size, index_col=0)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            result_key = f"extract_s3@{s3_address.split('/', 3)[-1]}/{max_workers}w"
+            results[result_key] = {'wall_time': round(min(wall_times), 6), 'peak_memory_bytes': peak_memory, 'rows_out': len(products_df)}
+            print(self.describe_result(result_key, results[result_key], previous_results.get(result_key)))
+
+        self.save_results({**previous_results, **results})
+        return results
+
+    def write_date_events(self, number_of_rows: int, json_path: str, ndjson_path: str, chunk_size: int = 1000000):
+        """
+        The write_date_events function writes generated date events as a column-oriented JSON document, as DataFrame.to_json does,
+        and as NDJSON, a chunk of rows at a time, so tables of tens of millions of rows are never held in memory.
+        Each chunk is generated with its own seed, following the seed of the generator.
+
+        Args:
+            number_of_rows (int): Number of date events.
+            json_path (str): Path of the column-oriented JSON file to write.
+            ndjson_path (str): Path of the NDJSON file to write.
+            chunk_size (int): Number of rows generated at a time.
+        """
+        parts_folder_path = tempfile.mkdtemp()  # One file per column, holding its rows, joined once every chunk is written
+        column_names = None
+        with open(ndjson_path, 'w', encoding='utf-8') as ndjson_file:
+            for chunk_number, first_row in enumerate(range(0, number_of_rows, chunk_size)):
+                chunk_generator = SyntheticDataGenerator(self.generator.raw_csv_folder_path, seed=self.generator.seed + chunk_number)
+                chunk_df = chunk_generator.date_details(min(chunk_size, number_of_rows - first_row))
+                chunk_df.index += first_row
+                chunk_df.to_json(ndjson_file, orient='records', lines=True)
+                column_names = list(chunk_df.columns)
+                for column_name in column_names:
+                    with open(os.path.join(parts_folder_path, column_name), 'a', encoding='utf-8') as part_file:
+                        part_file.write((',' if first_row else '') + chunk_df[column_name].to_json()[1:-1])  # The rows without their braces
+                del chunk_df
+
+        with open(json_path, 'w', encoding='utf-8') as json_file:
+            json_file.write('{')
+            for column_number, column_name in enumerate(column_names or []):
+                json_file.write(f'{"," if column_number else ""}{json.dumps(column_name)}:{{')
+                with open(os.path.join(parts_folder_path, column_name), 'r', encoding='utf-8') as part_file:
+                    shutil.copyfileobj(part_file, json_file)
+                json_file.write('}')
+            json_file.write('}')
+        shutil.rmtree(parts_folder_path)
+
+    def run_json_extraction(self, sizes: list = None, reader_names: list = None):
+        """
+        The run_json_extraction function compares reading and cleaning generated date events with pd.read_json, as the pipeline does
+        by default, with JsonStreamReader dropping the invalid rows as it reads, from a column-oriented document and from NDJSON,
+        and saves the results. At tens of millions of rows pd.read_json needs several times the memory of the streaming readers,
+        so leave it out of reader_names at those sizes.
+
+        Args:
+            sizes (list): Numbers of date events, defaults to 100000 and 1000000.
+            reader_names (list): Readers to compare, defaults to 'read_json', 'stream' and 'stream_ndjson'.
+
+        Returns:
+            dict: 'extract_json@<rows>/<reader>' -> wall time in seconds, peak memory allocated in bytes and number of rows kept.
+        """
+        row_filter = ('time_period', dcl.time_period_mask)
+        stream = lambda json_path: dcl.clean_date_data(JsonStreamReader.read_json_table(json_path, row_filter=row_filter), inplace=True)
+        readers = {'read_json': lambda json_path: dcl.clean_date_data(pd.read_json(json_path), inplace=True), 'stream': stream, 'stream_ndjson': stream}
+        previous_results = self.load_results()
+        results = {}
+
+        for number_of_rows in sizes or [100000, 1000000]:
+            json_paths = {'read_json': os.path.join(tempfile.gettempdir(), f"date_details_{number_of_rows}.json"),
+                          'stream_ndjson': os.path.join(tempfile.gettempdir(), f"date_details_{number_of_rows}.ndjson")}
+            json_paths['stream'] = json_paths['read_json']
+            self.write_date_events(number_of_rows, json_paths['read_json'], json_paths['stream_ndjson'])
+
+            for reader_name in reader_names or list(readers):
+                reader = readers[reader_name]
+                wall_times = []
+                for _ in range(self.repeats):
+                    start_time = time.perf_counter()
+                    rows_out = len(reader(json_paths[reader_name]))  # The table is not kept, so only one is held at a time
+                    wall_times.append(time.perf_counter() - start_time)
+                tracemalloc.start()
+                reader(json_paths[reader_name])
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                result_key = f"extract_json@{number_of_rows}/{reader_name}"
+                results[result_key] = {'wall_time': round(min(wall_times), 6), 'peak_memory_bytes': peak_memory, 'rows_out': rows_out}
+                print(self.describe_result(result_key, results[result_key], previous_results.get(result_key)))
+
+            for json_path in set(json_paths.values()):
+                os.remove(json_path)
+        self.save_results({**previous_results, **results})
+        return results
+
+
+if __name__ == "__main__":
+    # e.g. python -m _06_multinational_retail_data_centralisation.extraction_benchmark rds 2000000 --chunksize 100000
+    # or   python -m _06_multinational_retail_data_centralisation.extraction_benchmark stores 451
+    # or   python -m _06_multinational_retail_data_centralisation.extraction_benchmark pdf 300
+    # or   python -m _06_multinational_retail_data_centralisation.extraction_benchmark s3 s3://bucket/products.csv
+    # or   python -m _06_multinational_retail_data_centralisation.extraction_benchmark json 100000 1000000
+    # or   python -m _06_multinational_retail_data_centralisation.extraction_benchmark json 10000000 20000000 --reader stream --reader stream_ndjson --repeats 1
+    parser = argparse.ArgumentParser(description = 'Time the extraction of the RDS, stores API, PDF, S3 and JSON sources.')
+    subparsers = parser.add_subparsers(dest = 'source', required = True)
+    rds_parser = subparsers.add_parser('rds', help = 'clean, stage and upload generated orders read in one go and in chunks')
+    rds_parser.add_argument('number_of_orders', type = int, nargs = '?', default = 2000000, help = 'number of generated orders')
+    rds_parser.add_argument('--chunksize', type = int, action = 'append', help = 'rows per chunk to compare with one read, 100000 by default')
+    stores_parser = subparsers.add_parser('stores', help = 'retrieve generated stores from a stub API, serially and concurrently')
+    stores_parser.add_argument('number_of_stores', type = int, nargs = '?', default = 451, help = 'number of stores served')
+    stores_parser.add_argument('--latency', type = float, default = 0.05, help = 'seconds the stub API waits before each answer')
+    pdf_parser = subparsers.add_parser('pdf', help = 'extract a generated card details PDF in page ranges')
+    pdf_parser.add_argument('pages', type = int, nargs = '?', default = 300, help = 'number of pages of the generated PDF')
+    s3_parser = subparsers.add_parser('s3', help = 'parse a CSV object in S3 downloaded in byte ranges')
+    s3_parser.add_argument('s3_address', help = "address of the object, e.g. 's3://bucket/products.csv'")
+    json_parser = subparsers.add_parser('json', help = 'read and clean generated date events with pd.read_json and JsonStreamReader')
+    json_parser.add_argument('sizes', type = int, nargs = '*', help = 'numbers of date events')
+    json_parser.add_argument('--reader', choices = ['read_json', 'stream', 'stream_ndjson'], action = 'append', help = 'reader to compare, all of them by default')
+    json_parser.add_argument('--repeats', type = int, default = 3, help = 'number of timed runs of each reader; the fastest is kept')
+    arguments = parser.parse_args()
+
+    if arguments.source == 'rds':
+        ExtractionBenchmark().run_rds_extraction(number_of_orders = arguments.number_of_orders,
+                                                 chunksizes = [None] + arguments.chunksize if arguments.chunksize else None)
+    elif arguments.source == 'stores':
+        ExtractionBenchmark().run_store_retrieval(number_of_stores = arguments.number_of_stores, latency_seconds = arguments.latency)
+    elif arguments.source == 'pdf':
+        ExtractionBenchmark().run_pdf_extraction(number_of_pages = arguments.pages)
+    elif arguments.source == 's3':
+        ExtractionBenchmark().run_s3_extraction(s3_address = arguments.s3_address)
+    else:
+        ExtractionBenchmark(repeats = arguments.repeats).run_json_extraction(sizes = arguments.sizes or None, reader_names = arguments.reader)
@@ -0,0 +1,261 @@
+import hashlib # to build content-addressed keys
+import json # to save the cache index
+import os # to create directories
+import pandas as pd
+import shutil # to remove evicted entries
+import threading # to share the cache between pipeline stages
+import time # to track when entries were last used
+import uuid # to give each version of an entry its own folder
+
+
+class ExtractionCache:
+    """
+    A local cache of extracted DataFrames. Entries are keyed by the identity of their source together with a fingerprint
+    of the source's current version (e.g. ETag, Last-Modified or a checksum), so a changed source is extracted again.
+    A source without a version, e.g. an API, can be cached for a limited time by passing a maximum age.
+    The total size of the cache is bounded; the least recently used entries are evicted first.
+    Each version of an entry is saved in a folder of its own. A folder being read is pinned, so an entry evicted, expired or replaced
+    while its chunks are read is only deleted once the last reader has finished.
+    """
+    def __init__(self, cache_folder_path: str = '.extraction_cache', max_size_bytes: int = 2 * 1024 ** 3):
+        """
+        Args:
+            cache_folder_path (str): Folder in which the cached DataFrames are saved.
+            max_size_bytes (int): Maximum total size of the cached files.
+        """
+        self.cache_folder_path = cache_folder_path
+        self.max_size_bytes = max_size_bytes
+        self.index_path = os.path.join(cache_folder_path, 'index.json')
+        self.lock = threading.Lock()
+        self.readers = {}  # Entry folder -> number of unfinished readers of its chunks
+        self.removed_folders = set()  # Folders of removed entries, deleted once their last reader has finished
+
+        os.makedirs(cache_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as index_file:
+                self.index = json.load(index_file)  # Key -> source, size, number of chunks, time created and time of last use
+        else:
+            self.index = {}
+        entry_folder_names = {entry.get('folder', key) for key, entry in self.index.items()}
+        for folder_name in os.listdir(cache_folder_path):  # Folders left by an interrupted stream, or removed while read by an earlier run
+            if folder_name not in entry_folder_names and os.path.isdir(os.path.join(cache_folder_path, folder_name)):
+                shutil.rmtree(os.path.join(cache_folder_path, folder_name), ignore_errors=True)
+
+    @staticmethod
+    def make_key(source: str, fingerprint: dict):
+        """
+        The make_key function builds the key of a cache entry from the source identity and its fingerprint.
+
+        Args:
+            source (str): Identity of the source, e.g. its URL or table name.
+            fingerprint (dict): Values identifying the current version of the source.
+
+        Returns:
+            str: SHA-256 hex digest of the source and fingerprint.
+        """
+        identity = json.dumps({'source': source, 'fingerprint': fingerprint}, sort_keys=True, default=str)
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def save_index(self):
+        """
+        The save_index function writes the cache index to disk, replacing the previous index in one step.
+        """
+        temporary_index_path = f"{self.index_path}.tmp"
+        with open(temporary_index_path, 'w') as index_file:
+            json.dump(self.index, index_file)
+        os.replace(temporary_index_path, self.index_path)
+
+    def entry_folder_path(self, key: str, entry: dict):
+        """
+        The entry_folder_path function gives the folder holding the chunks of an entry.
+
+        Args:
+            key (str): Key of the entry.
+            entry (dict): The entry in the index.
+
+        Returns:
+            str: Path of the folder.
+        """
+        return os.path.join(self.cache_folder_path, entry.get('folder', key))  # Entries saved before folders were versioned use their key
+
+    def read_chunks(self, entry_folder_path: str, number_of_chunks: int):
+        """
+        The read_chunks function reads the chunks of a pinned entry folder one at a time, unpinning the folder once they have all
+        been read or the generator is closed. get_chunks starts the generator, so that closing it always unpins the folder.
+
+        Args:
+            entry_folder_path (str): Folder holding the chunks, pinned by get_chunks.
+            number_of_chunks (int): Number of chunks in the folder.
+
+        Yields:
+            pd.DataFrame: None once started, then the next chunk.
+        """
+        try:
+            yield None
+            for chunk_number in range(number_of_chunks):
+                yield pd.read_pickle(os.path.join(entry_folder_path, f"chunk_{chunk_number:05d}.pkl"))
+        finally:
+            with self.lock:
+                self.readers[entry_folder_path] -= 1
+                if not self.readers[entry_folder_path]:
+                    del self.readers[entry_folder_path]
+                    if entry_folder_path in self.removed_folders:  # Removed while it was read
+                        self.removed_folders.discard(entry_folder_path)
+                        shutil.rmtree(entry_folder_path, ignore_errors=True)
+
+    def get_chunks(self, source: str, fingerprint: dict, max_age_seconds: float = None):
+        """
+        The get_chunks function returns the cached chunks for a source, reading each chunk from disk only when it is needed.
+        The entry's folder is pinned until the chunks have all been read or the generator is closed.
+
+        Args:
+            source (str): Identity of the source.
+            fingerprint (dict): Values identifying the current version of the source.
+            max_age_seconds (float): Age after which the entry is extracted again. None keeps it while the fingerprint matches.
+
+        Returns:
+            generator: DataFrames of the cached chunks, or None if the source version is not cached or has expired.
+        """
+        key = self.make_key(source, fingerprint)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            if max_age_seconds is not None and time.time() - entry.get('created', 0) > max_age_seconds:
+                self.remove_entry(key)  # Expired
+                self.save_index()
+                return None
+            entry['last_access'] = time.time()
+            self.save_index()
+            entry_folder_path = self.entry_folder_path(key, entry)
+            self.readers[entry_folder_path] = self.readers.get(entry_folder_path, 0) + 1  # Pin the folder before the lock is released
+
+        chunks = self.read_chunks(entry_folder_path, entry['chunks'])
+        next(chunks)  # Start the generator, so closing it unpins the folder
+        return chunks
+
+    def get(self, source: str, fingerprint: dict, max_age_seconds: float = None):
+        """
+        The get function returns the cached DataFrame for a source.
+
+        Args:
+            source (str): Identity of the source.
+            fingerprint (dict): Values identifying the current version of the source.
+            max_age_seconds (float): Age after which the entry is extracted again. None keeps it while the fingerprint matches.
+
+        Returns:
+            pd.DataFrame: The cached DataFrame, or None if the source version is not cached or has expired.
+        """
+        chunks = self.get_chunks(source, fingerprint, max_age_seconds)
+        if chunks is None:
+            return None
+        chunks = list(chunks)
+        return chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+
+    def put_chunks(self, source: str, fingerprint: dict, chunks):
+        """
+        The put_chunks function saves chunks of a DataFrame to the cache as they pass through, yielding each one on unchanged.
+        The chunks are saved to a new folder, and the entry is only added to the cache once the last chunk has been saved,
+        so an interrupted stream is never served and the chunks of an entry being read are never overwritten.
+
+        Args:
+            source (str): Identity of the source.
+            fingerprint (dict): Values identifying the current version of the source.
+            chunks (iterable): DataFrames to save.
+
+        Yields:
+            pd.DataFrame: The next chunk.
+        """
+        key = self.make_key(source, fingerprint)
+        entry_folder_name = f"{key}_{uuid.uuid4().hex}"
+        entry_folder_path = os.path.join(self.cache_folder_path, entry_folder_name)
+        os.makedirs(entry_folder_path)
+
+        size = 0
+        number_of_chunks = 0
+        try:
+            for chunk in chunks:
+                chunk_path = os.path.join(entry_folder_path, f"chunk_{number_of_chunks:05d}.pkl")
+                chunk.to_pickle(chunk_path)  # Pickle keeps the dtypes and index of the DataFrame
+                size += os.path.getsize(chunk_path)
+                number_of_chunks += 1
+                yield chunk
+        except BaseException:
+            shutil.rmtree(entry_folder_path, ignore_errors=True)  # Never served, so no reader can have it pinned
+            raise
+
+        with self.lock:
+            if key in self.index:
+                self.remove_entry(key)  # Saved by another stage meanwhile
+            self.index[key] = {'source': source, 'size': size, 'chunks': number_of_chunks, 'created': time.time(), 'last_access': time.time(),
+                               'folder': entry_folder_name}
+            self.evict()
+            self.save_index()
+
+    def put(self, source: str, fingerprint: dict, df):
+        """
+        The put function saves a DataFrame to the cache.
+
+        Args:
+            source (str): Identity of the source.
+            fingerprint (dict): Values identifying the current version of the source.
+            df (pd.DataFrame): DataFrame to save.
+        """
+        for _ in self.put_chunks(source, fingerprint, [df]):
+            pass
+
+    def remove_entry(self, key: str):
+        """
+        The remove_entry function deletes an entry and its files. The files of an entry being read are deleted once the last reader
+        has finished, see read_chunks. Called with the lock held.
+
+        Args:
+            key (str): Key of the entry.
+        """
+        entry_folder_path = self.entry_folder_path(key, self.index.pop(key))
+        if self.readers.get(entry_folder_path):
+            self.removed_folders.add(entry_folder_path)
+        else:
+            shutil.rmtree(entry_folder_path, ignore_errors=True)
+
+    def evict(self):
+        """
+        The evict function removes the least recently used entries until the cache is within its maximum size.
+        Called with the lock held.
+        """
+        total_size = sum(entry['size'] for entry in self.index.values())
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]['last_access']):
+            if total_size <= self.max_size_bytes:
+                break
+            self.remove_entry(key)
+            total_size -= entry['size']
+            print(f"Evicted '{entry['source']}' from the extraction cache.")
+
+    def fetch(self, source: str, fingerprint: dict, extract_data, max_age_seconds: float = None):
+        """
+        The fetch function returns the cached DataFrame for a source if its current version is cached.
+        Otherwise it calls extract_data and caches the result. A fingerprint of None means the version of the
+        source cannot be determined, in which case the data is always extracted and not cached.
+
+        Args:
+            source (str): Identity of the source.
+            fingerprint (dict): Values identifying the current version of the source, or None.
+            extract_data (function): Function extracting the DataFrame from the source, called without arguments.
+            max_age_seconds (float): Age after which the entry is extracted again, for a fingerprint that cannot tell every
+                change of the source. None keeps it while the fingerprint matches.
+
+        Returns:
+            pd.DataFrame: The extracted DataFrame.
+        """
+        if fingerprint is None:
+            return extract_data()
+
+        df = self.get(source, fingerprint, max_age_seconds)
+        if df is not None:
+            print(f"Loaded '{source}' from the extraction cache.")
+            return df
+
+        df = extract_data()
+        if df is not None:
+            self.put(source, fingerprint, df)
+        return df
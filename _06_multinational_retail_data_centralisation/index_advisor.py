@@ -0,0 +1,259 @@
+from concurrent.futures import ThreadPoolExecutor # build the indexes of different tables at the same time
+from sqlalchemy import Index, MetaData, Table, inspect
+
+import json # to read EXPLAIN plans and save the report
+import re # to split the workload into statements
+import time # to time the queries and the index builds
+
+
+class IndexAdvisor:
+    """
+    A utility class for indexing the star-schema for the queries of _05_SQL/_02_queries.sql and the incremental loads.
+    The star-schema only has the primary keys of the dimension tables, so every join from 'orders_table' and every filter on
+    store type, country or date reads whole tables. The candidate indexes below cover those joins and filters; build_indexes
+    creates the missing ones, on PostgreSQL with CREATE INDEX CONCURRENTLY so the tables stay writable, then runs ANALYZE.
+    explain_workload times each query with EXPLAIN ANALYZE before and after, and lists the indexes its plan uses.
+    """
+    # (table, key columns, included columns) of the candidate indexes. Included columns make the index covering on PostgreSQL,
+    # so the joins read the index only; other databases index the key columns.
+    candidate_indexes = [
+        ('orders_table', ['date_uuid'], []),  # Foreign keys of 'orders_table', used by every join
+        ('orders_table', ['user_uuid'], []),
+        ('orders_table', ['store_code'], []),
+        ('orders_table', ['product_code'], ['product_quantity']),
+        ('orders_table', ['card_number'], []),
+        ('orders_table', ['index'], []),  # High-water mark of the incremental orders load and of the sales aggregates
+        ('dim_products', ['product_code'], ['product_price_(gbp)']),  # Price of each order without reading the table
+        ('dim_store_details', ['country_code', 'store_type'], ['store_code']),  # Stores of a country by type, e.g. Task 8
+        ('dim_date_times', ['year', 'month'], ['date_uuid']),  # Sales by year and month, e.g. Task 6
+    ]
+
+    @staticmethod
+    def index_name(table_name: str, key_columns: list):
+        """
+        The index_name function names a candidate index after its table and key columns, e.g. 'ix_orders_table_date_uuid'.
+
+        Args:
+            table_name (str): Name of the database table.
+            key_columns (list): Key columns of the index.
+
+        Returns:
+            str: Name of the index.
+        """
+        return re.sub(r'\W', '', f"ix_{table_name}_{'_'.join(key_columns)}")[:63]  # PostgreSQL truncates names to 63 characters
+
+    @staticmethod
+    def missing_indexes(engine2):
+        """
+        The missing_indexes function finds the candidate indexes that the database does not have yet.
+        A candidate is skipped if its table or columns do not exist, or if an index or primary key already has the same key columns
+        and, on PostgreSQL, includes its included columns.
+
+        Args:
+            engine2: Database engine object.
+
+        Returns:
+            list: (table, key columns, included columns) of the missing indexes.
+        """
+        inspector = inspect(engine2)
+        missing = []
+        for table_name, key_columns, include_columns in IndexAdvisor.candidate_indexes:
+            if not inspector.has_table(table_name):
+                continue
+            table_columns = {column_info['name'] for column_info in inspector.get_columns(table_name)}
+            if not set(key_columns + include_columns) <= table_columns:
+                continue
+
+            needed_include = set(include_columns) if engine2.dialect.name == 'postgresql' else set()
+            existing_indexes = [(index_info['name'], index_info['column_names'], set(index_info.get('include_columns') or index_info.get('dialect_options', {}).get('postgresql_include') or []))
+                                for index_info in inspector.get_indexes(table_name)]
+            existing_indexes.append((None, inspector.get_pk_constraint(table_name)['constrained_columns'], set()))
+            if not any(name == IndexAdvisor.index_name(table_name, key_columns) or (column_names == key_columns and needed_include <= included)
+                       for name, column_names, included in existing_indexes):
+                missing.append((table_name, key_columns, include_columns))
+        return missing
+
+    @staticmethod
+    def create_index(engine2, table_name: str, key_columns: list, include_columns: list):
+        """
+        The create_index function creates one index. On PostgreSQL it is built with CREATE INDEX CONCURRENTLY, which cannot run
+        inside a transaction, so the connection is in autocommit mode. A build that fails leaves an invalid index, which is dropped.
+
+        Args:
+            engine2: Database engine object.
+            table_name (str): Name of the database table.
+            key_columns (list): Key columns of the index.
+            include_columns (list): Columns included in the index on PostgreSQL.
+
+        Returns:
+            float: Build time in seconds.
+        """
+        index_table = Table(table_name, MetaData(), autoload_with=engine2)
+        index = Index(IndexAdvisor.index_name(table_name, key_columns), *[index_table.c[column_name] for column_name in key_columns],
+                      postgresql_include=include_columns, postgresql_concurrently=True)
+        start_time = time.perf_counter()
+        with engine2.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            try:
+                index.create(connection, checkfirst=True)
+            except Exception:
+                index.drop(connection, checkfirst=True)  # Drop the invalid index left by a failed concurrent build
+                raise
+        return time.perf_counter() - start_time
+
+    @staticmethod
+    def build_indexes(engine2, max_workers: int = 4):
+        """
+        The build_indexes function creates the missing candidate indexes and runs ANALYZE on the tables indexed, so the planner
+        has up to date statistics. The indexes of different tables are built at the same time; those of one table one after
+        the other, as concurrent index builds on the same table wait for each other.
+
+        Args:
+            engine2: Database engine object.
+            max_workers (int): Number of tables indexed at the same time.
+
+        Returns:
+            dict: Name of each index created -> build time in seconds.
+        """
+        missing = IndexAdvisor.missing_indexes(engine2)
+        if not missing:
+            print("The star-schema already has every candidate index.\n")
+            return {}
+
+        indexes_by_table = {}
+        for table_name, key_columns, include_columns in missing:
+            indexes_by_table.setdefault(table_name, []).append((key_columns, include_columns))
+
+        def index_table(table_name):
+            build_times = {}
+            for key_columns, include_columns in indexes_by_table[table_name]:
+                index_name = IndexAdvisor.index_name(table_name, key_columns)
+                build_times[index_name] = IndexAdvisor.create_index(engine2, table_name, key_columns, include_columns)
+                print(f"Created index '{index_name}' on '{table_name}' ({', '.join(key_columns)}) in {build_times[index_name]:.2f}s.")
+            return build_times
+
+        build_times = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for table_build_times in executor.map(index_table, indexes_by_table):
+                build_times.update(table_build_times)
+
+        quote = engine2.dialect.identifier_preparer.quote
+        with engine2.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            for table_name in indexes_by_table:
+                connection.exec_driver_sql(f"ANALYZE {quote(table_name)}")
+        print(f"Analysed {len(indexes_by_table)} tables.\n")
+        return build_times
+
+    @staticmethod
+    def read_workload(sql_path: str):
+        """
+        The read_workload function reads the queries of a .sql file, e.g. _05_SQL/_02_queries.sql, named after the comment above each,
+        e.g. 'Task 3. Which months produced the largest amount of sales'. Commented out statements are left out.
+
+        Args:
+            sql_path (str): Path to the .sql file.
+
+        Returns:
+            dict: Query name -> SQL.
+        """
+        with open(sql_path, 'r', encoding='utf-8') as file:
+            sql = file.read()
+        workload = {}
+        for statement in sql.split(';'):
+            lines = [line for line in statement.splitlines() if line.strip()]
+            comments = [line.strip().lstrip('-').strip() for line in lines if line.strip().startswith('--')]
+            query = '\n'.join(line for line in lines if not line.strip().startswith('--')).strip()
+            if query.upper().startswith(('SELECT', 'WITH')):
+                name = next((comment for comment in comments if comment.startswith('Task')), comments[0] if comments else f"Query {len(workload) + 1}")
+                workload[name] = query
+        return workload
+
+    @staticmethod
+    def explain_query(query: str, engine2):
+        """
+        The explain_query function runs a query and reports its time and the indexes its plan uses.
+        On PostgreSQL this is EXPLAIN (ANALYZE, FORMAT JSON): the planning and execution times of the server and the indexes
+        scanned by the plan. Other databases run the query and report its wall time, with the indexes of EXPLAIN QUERY PLAN.
+
+        Args:
+            query (str): The SQL query.
+            engine2: Database engine object.
+
+        Returns:
+            dict: 'time_ms' and 'indexes' (names of the indexes used).
+        """
+        with engine2.connect() as connection:
+            connection = connection.execution_options(no_parameters=True)  # no_parameters leaves '%' in the SQL untouched
+            if engine2.dialect.name == 'postgresql':
+                plan = connection.exec_driver_sql(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}").scalar()
+                plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]
+                nodes, indexes = [plan['Plan']], set()
+                while nodes:
+                    node = nodes.pop()
+                    if 'Index Name' in node:
+                        indexes.add(node['Index Name'])
+                    nodes.extend(node.get('Plans', []))
+                return {'time_ms': round(plan['Planning Time'] + plan['Execution Time'], 3), 'indexes': sorted(indexes)}
+
+            start_time = time.perf_counter()
+            connection.exec_driver_sql(query).fetchall()
+            time_ms = (time.perf_counter() - start_time) * 1000
+            plan_details = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {query}")]
+            indexes = {match for detail in plan_details for match in re.findall(r'USING (?:COVERING )?INDEX (\w+)', detail)}
+            return {'time_ms': round(time_ms, 3), 'indexes': sorted(indexes)}
+
+    @staticmethod
+    def explain_workload(workload: dict, engine2):
+        """
+        The explain_workload function runs explain_query for each query of a workload. Queries the database cannot run are
+        reported with their error rather than stopping the others.
+
+        Args:
+            workload (dict): Query name -> SQL, see read_workload.
+            engine2: Database engine object.
+
+        Returns:
+            dict: Query name -> result of explain_query, or {'error': message}.
+        """
+        explained = {}
+        for query_name, query in workload.items():
+            try:
+                explained[query_name] = IndexAdvisor.explain_query(query, engine2)
+            except Exception as e:
+                explained[query_name] = {'error': str(e).splitlines()[0]}
+        return explained
+
+    @staticmethod
+    def index_workload(engine2, sql_path: str, explain: bool = True, max_workers: int = 4, report_path: str = None):
+        """
+        The index_workload function builds the missing candidate indexes and, when explain is set, times the queries of a .sql file
+        before and after, printing each query's times and the indexes it then uses.
+
+        Args:
+            engine2: Database engine object.
+            sql_path (str): Path to the .sql file of the workload, e.g. _05_SQL/_02_queries.sql.
+            explain (bool): Whether to time the workload before and after; each query is run twice.
+            max_workers (int): Number of tables indexed at the same time.
+            report_path (str): Path of a JSON file to save the report to, if given.
+
+        Returns:
+            dict: 'indexes_created' (name -> build time in seconds), and with explain 'before' and 'after' (see explain_workload).
+        """
+        workload = IndexAdvisor.read_workload(sql_path) if explain else {}
+        report = {'before': IndexAdvisor.explain_workload(workload, engine2) if IndexAdvisor.missing_indexes(engine2) else {}}
+        report['indexes_created'] = {index_name: round(build_time, 3) for index_name, build_time in IndexAdvisor.build_indexes(engine2, max_workers).items()}
+        report['after'] = IndexAdvisor.explain_workload(workload, engine2)
+
+        for query_name, after in report['after'].items():
+            before = report['before'].get(query_name, {})
+            if 'error' in after:
+                print(f"{query_name[:60]:<60} not run: {after['error']}")
+            elif 'time_ms' in before:
+                print(f"{query_name[:60]:<60} {before['time_ms']:>10.1f} ms -> {after['time_ms']:>10.1f} ms  {', '.join(after['indexes']) or 'no index'}")
+            else:
+                print(f"{query_name[:60]:<60} {after['time_ms']:>10.1f} ms  {', '.join(after['indexes']) or 'no index'}")
+
+        if report_path is not None:
+            with open(report_path, 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+            print(f"Saved the index report as '{report_path}'.\n")
+        return report
@@ -0,0 +1,231 @@
+from contextlib import contextmanager # to measure the stages of the pipeline
+
+import cProfile # optional profile of each stage
+import inspect # to recognise generators of chunks
+import json # to save the metrics
+import os # to create directories and size files
+import pandas as pd
+import threading # stages run on several threads
+import time # to time each step
+
+try:
+    import resource # peak resident set size; not available on Windows
+except ImportError:
+    resource = None
+
+
+class PipelineMetrics:
+    """
+    A utility class for recording the wall time, rows in and out, bytes in and out, and peak resident set size (RSS)
+    of every extract, clean and load call made by the pipeline, and of every stage.
+    The records are saved as JSON so that runs can be compared to find regressions and bottlenecks.
+    Each stage can optionally be profiled with cProfile, saving one .prof file per stage.
+    """
+    def __init__(self, metrics_path: str = 'pipeline_metrics.json', profile_folder_path: str = None, measure_bytes: bool = True,
+                 deep_memory_usage: bool = False):
+        """
+        Args:
+            metrics_path (str): Path of the JSON file the metrics are saved to.
+            profile_folder_path (str): Folder for the cProfile output of each stage. None disables profiling.
+            measure_bytes (bool): Whether to measure the memory used by the DataFrames passed in and out of each step.
+            deep_memory_usage (bool): Whether to also count the strings held by object columns. This reads every value of
+                those columns on every call, so it is off by default and the bytes only cover the column buffers and object pointers.
+        """
+        self.metrics_path = metrics_path
+        self.profile_folder_path = profile_folder_path
+        self.measure_bytes = measure_bytes
+        self.deep_memory_usage = deep_memory_usage
+        self.step_records = []
+        self.stage_records = []
+        self.lock = threading.Lock()
+        self.current = threading.local()  # Name of the stage running on each thread
+
+    @staticmethod
+    def peak_rss_bytes():
+        """
+        The peak_rss_bytes function gives the highest resident set size of the process so far.
+
+        Returns:
+            int: Peak RSS in bytes, or None where the resource module is not available.
+        """
+        if resource is None:
+            return None
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_rss if os.uname().sysname == 'Darwin' else peak_rss * 1024  # Linux reports kilobytes, macOS bytes
+
+    def describe(self, value):
+        """
+        The describe function measures a value passed in or out of a step. A DataFrame gives its number of rows and memory use,
+        a tuple is described by the first DataFrame it holds, and the path of a file gives the size of the file.
+
+        Args:
+            value: Argument or return value of the step.
+
+        Returns:
+            tuple: Number of rows and number of bytes, each None if unknown.
+        """
+        if isinstance(value, tuple):
+            value = next((item for item in value if isinstance(item, pd.DataFrame)), None)
+        if isinstance(value, pd.DataFrame):
+            return len(value), int(value.memory_usage(deep=self.deep_memory_usage).sum()) if self.measure_bytes else None
+        if isinstance(value, str) and os.path.isfile(value):
+            return None, os.path.getsize(value)
+        return None, None
+
+    def record(self, step_name: str, wall_time: float, rows_in, bytes_in, rows_out, bytes_out, error: Exception = None):
+        """
+        The record function adds the metrics of one call to the records.
+
+        Args:
+            step_name (str): Name of the step, e.g. 'DataCleaning.clean_user_data'.
+            wall_time (float): Wall time of the call in seconds.
+            rows_in (int): Rows of the DataFrame passed in.
+            bytes_in (int): Bytes of the DataFrame passed in.
+            rows_out (int): Rows of the DataFrame returned.
+            bytes_out (int): Bytes of the DataFrame or file returned.
+            error (Exception): Exception raised by the call, if any.
+        """
+        step_record = {'stage': getattr(self.current, 'stage_name', None), 'step': step_name, 'status': 'failed' if error else 'succeeded',
+                       'wall_time': round(wall_time, 6), 'rows_in': rows_in, 'rows_out': rows_out, 'bytes_in': bytes_in,
+                       'bytes_out': bytes_out, 'peak_rss_bytes': self.peak_rss_bytes(), 'error': repr(error) if error else None}
+        with self.lock:
+            self.step_records.append(step_record)
+
+    def instrument(self, function, step_name: str):
+        """
+        The instrument function wraps a function so that every call to it is recorded. When the function returns a generator,
+        e.g. the chunks of a streamed table, the step is recorded once the generator is exhausted, counting the rows of every
+        chunk and only the time spent producing them.
+
+        Args:
+            function (function): Function to wrap.
+            step_name (str): Name the calls are recorded under.
+
+        Returns:
+            function: The wrapped function.
+        """
+        def instrumented_function(*args, **kwargs):
+            rows_in, bytes_in = next((self.describe(arg) for arg in list(args) + list(kwargs.values()) if isinstance(arg, pd.DataFrame)), (None, None))
+            start_time = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                self.record(step_name, time.perf_counter() - start_time, rows_in, bytes_in, None, None, e)
+                raise
+            wall_time = time.perf_counter() - start_time
+
+            if inspect.isgenerator(result):
+                return self.instrument_chunks(result, step_name, wall_time, rows_in, bytes_in)
+            rows_out, bytes_out = self.describe(result)
+            self.record(step_name, wall_time, rows_in, bytes_in, rows_out, bytes_out)
+            return result
+
+        return instrumented_function
+
+    def instrument_chunks(self, chunks, step_name: str, wall_time: float, rows_in, bytes_in):
+        """
+        The instrument_chunks function passes on the chunks of a generator, recording the step once the last chunk has been produced.
+
+        Args:
+            chunks (generator): Chunks returned by the step.
+            step_name (str): Name the step is recorded under.
+            wall_time (float): Time already spent in the call that returned the generator.
+            rows_in (int): Rows of the DataFrame passed in.
+            bytes_in (int): Bytes of the DataFrame passed in.
+
+        Yields:
+            The next chunk.
+        """
+        rows_out, bytes_out = 0, 0
+        while True:
+            start_time = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                wall_time += time.perf_counter() - start_time
+                break
+            except Exception as e:
+                self.record(step_name, wall_time + time.perf_counter() - start_time, rows_in, bytes_in, rows_out, bytes_out, e)
+                raise
+            wall_time += time.perf_counter() - start_time
+            chunk_rows, chunk_bytes = self.describe(chunk)
+            rows_out += chunk_rows or 0
+            bytes_out += chunk_bytes or 0
+            yield chunk
+        self.record(step_name, wall_time, rows_in, bytes_in, rows_out, bytes_out)
+
+    def instrument_object(self, wrapped, name: str = None):
+        """
+        The instrument_object function wraps an object, e.g. a DataCleaning instance, so that calls to its public methods are recorded.
+
+        Args:
+            wrapped: Object whose methods are recorded.
+            name (str): Prefix of the step names. Defaults to the name of the object's class.
+
+        Returns:
+            InstrumentedObject: Object behaving like the wrapped one.
+        """
+        return InstrumentedObject(wrapped, self, name or type(wrapped).__name__)
+
+    @contextmanager
+    def stage(self, stage_name: str):
+        """
+        The stage function measures a stage of the pipeline run on the current thread. The steps called within it are recorded
+        under the stage's name and, if a profile folder is set, the stage is profiled with cProfile.
+
+        Args:
+            stage_name (str): Name of the stage.
+        """
+        self.current.stage_name = stage_name
+        profiler = cProfile.Profile() if self.profile_folder_path else None
+        start_time = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()  # Only profiles the current thread, i.e. this stage
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                os.makedirs(self.profile_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
+                profile_path = os.path.join(self.profile_folder_path, f"{''.join(c if c.isalnum() else '_' for c in stage_name)}.prof")
+                profiler.dump_stats(profile_path)  # View with e.g. python -m pstats or snakeviz
+                print(f"Saved the profile of stage '{stage_name}' as '{profile_path}'.")
+            with self.lock:
+                self.stage_records.append({'stage': stage_name, 'wall_time': round(time.perf_counter() - start_time, 6),
+                                           'peak_rss_bytes': self.peak_rss_bytes()})
+            self.current.stage_name = None
+
+    def save(self, extra: dict = None):
+        """
+        The save function writes the recorded stages and steps to the metrics JSON file and clears the records.
+
+        Args:
+            extra (dict): Further metrics to save alongside, e.g. the statistics of the connection pools.
+
+        Returns:
+            str: Path of the metrics file.
+        """
+        with self.lock:
+            metrics = {'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S'), **(extra or {}), 'stages': self.stage_records, 'steps': self.step_records}
+            self.stage_records, self.step_records = [], []
+        os.makedirs(os.path.dirname(self.metrics_path) or '.', exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
+        with open(self.metrics_path, 'w') as metrics_file:
+            json.dump(metrics, metrics_file, indent=2)
+        print(f"Saved the metrics of {len(metrics['steps'])} steps as '{self.metrics_path}'.")
+        return self.metrics_path
+
+
+class InstrumentedObject:
+    """
+    Wraps an object so that each call to one of its public methods is recorded by PipelineMetrics. Other attributes are passed through.
+    """
+    def __init__(self, wrapped, metrics: PipelineMetrics, name: str):
+        self.wrapped = wrapped
+        self.metrics = metrics
+        self.name = name
+
+    def __getattr__(self, attribute_name: str):
+        attribute = getattr(self.wrapped, attribute_name)
+        if callable(attribute) and not attribute_name.startswith('_'):
+            return self.metrics.instrument(attribute, f"{self.name}.{attribute_name}")
+        return attribute
@@ -0,0 +1,233 @@
+import numpy as np
+import os # to tell local files from URLs
+import pandas as pd
+
+try:
+    import ijson # incremental JSON parser; optional, pd.read_json is used without it
+except ImportError:
+    ijson = None
+
+
+class JsonStreamReader:
+    """
+    A utility class for reading a JSON table incrementally with ijson from a local file or a URL, instead of parsing the whole
+    document into Python objects at once as pd.read_json does. It reads two layouts:
+    - the column-oriented document written by DataFrame.to_json, e.g. {"time_period": {"0": "Evening", ...}, ...}. Each row of
+      each column is parsed as it is read; only the parser's buffer of the document is held, never the text of a whole column.
+    - newline-delimited JSON (NDJSON), with one record per line. Each record is parsed as it is read.
+    A row filter, e.g. ('time_period', DataCleaning.time_period_mask), drops invalid rows as they are read. NDJSON records are
+    filtered in batches, before they become DataFrames. In a column-oriented document, the rows of the filter column are checked
+    as soon as that column has been read: the columns read before it are filtered then, and the rows dropped are never kept
+    from the columns read after it.
+    Repeated strings of a column, e.g. the months or the time periods, are kept as one object each.
+    Values are kept as they are in the document, as pd.read_json(dtype=False, convert_dates=False) keeps them: numbers held as text
+    are not converted and no column is parsed as dates. Without ijson, the document is read whole with pd.read_json instead.
+    """
+    # Number of rows of a column after which repeated strings are no longer looked up, if fewer than half of them repeat
+    distinct_sample_size = 10000
+
+    @staticmethod
+    def open_bytes(json_path: str):
+        """
+        The open_bytes function opens a local JSON file, or streams a remote one, as bytes.
+
+        Args:
+            json_path (str): URL or local path of the JSON file.
+
+        Returns:
+            io.RawIOBase: Binary stream of the document.
+        """
+        if os.path.exists(json_path):
+            return open(json_path, 'rb')
+        import requests # only needed for remote files
+        response = requests.get(json_path, stream=True)
+        response.raise_for_status()
+        response.raw.decode_content = True  # Undo any gzip transfer encoding
+        return response.raw
+
+    @staticmethod
+    def read_value(events, event: str, value):
+        """
+        The read_value function gives the value starting with an event of the parser. Objects and arrays are built from the events
+        that follow, up to the end of the value.
+
+        Args:
+            events (iterator): The ijson.basic_parse events of the document, positioned after the event.
+            event (str): The first event of the value, e.g. 'string' or 'start_map'.
+            value: The value of that event.
+
+        Returns:
+            The parsed value.
+        """
+        if event not in ('start_map', 'start_array'):
+            return value
+        builder, depth = ijson.ObjectBuilder(), 0
+        while True:
+            builder.event(event, value)
+            depth += (event in ('start_map', 'start_array')) - (event in ('end_map', 'end_array'))
+            if depth == 0:
+                return builder.value
+            event, value = next(events)
+
+    @staticmethod
+    def read_column(events, row_positions: dict = None, number_of_rows: int = 0):
+        """
+        The read_column function reads the rows of one column of a column-oriented document, from the parser events of its object.
+        Repeated strings are kept once, until the first distinct_sample_size rows show that fewer than half of them repeat.
+
+        Args:
+            events (iterator): The ijson.basic_parse events of the document, positioned after the 'start_map' of the column.
+            row_positions (dict): Key of each row to keep -> its position in the table, or None to keep every row in document order.
+            number_of_rows (int): Number of rows to keep, with row_positions.
+
+        Returns:
+            tuple: The keys of the rows in document order (None with row_positions), and the values as an array.
+                   With row_positions, rows missing from the column are NaN.
+        """
+        distinct_values = {}
+        if row_positions is None:
+            keys, values = [], []
+        else:
+            keys, values = None, np.full(number_of_rows, np.nan, dtype=object)
+        row_number = 0
+
+        for event, value in events:
+            if event == 'map_key':
+                key = value
+                continue
+            if event == 'end_map':
+                break
+            value = JsonStreamReader.read_value(events, event, value)
+            if event == 'string' and distinct_values is not None:
+                value = distinct_values.setdefault(value, value)
+            row_number += 1
+            if row_number == JsonStreamReader.distinct_sample_size and len(distinct_values) > row_number // 2:
+                distinct_values = None  # Mostly distinct, e.g. the uuids: stop looking them up
+            if row_positions is None:
+                keys.append(key)
+                values.append(value)
+            else:
+                position = row_positions.get(key)
+                if position is not None:  # The row was not dropped by the filter
+                    values[position] = value
+
+        if row_positions is None:
+            values = np.array(values, dtype=object) if values else np.empty(0, dtype=object)
+        return keys, values
+
+    @staticmethod
+    def read_columns(byte_stream, row_filter: tuple = None, buffer_size: int = 1024 ** 2):
+        """
+        The read_columns function reads a column-oriented JSON document row by row. The rows of the table are the keys of its
+        first column. The columns whose keys are not those of the first column, in the same order, are aligned on them.
+
+        Args:
+            byte_stream: Binary stream of the document.
+            row_filter (tuple): Name of a column and a function giving the mask of the rows to keep from that column, or None.
+            buffer_size (int): Number of bytes read at a time.
+
+        Returns:
+            pd.DataFrame: The table, indexed by the keys of the document.
+        """
+        filter_column, mask_function = row_filter or (None, None)
+        events = ijson.basic_parse(byte_stream, use_float=True, buf_size=buffer_size)  # Numbers are parsed as json.loads does
+        columns, index_keys, row_positions, keep = {}, None, None, None
+
+        if next(events)[0] != 'start_map':
+            raise ValueError("The JSON document is not an object of columns.")
+        for event, column_name in events:
+            if event == 'end_map':
+                break
+            if next(events)[0] != 'start_map':
+                raise ValueError(f"Column '{column_name}' of the JSON document is not an object of rows.")
+
+            if keep is not None:  # Only the kept rows are taken from the columns after the filter column
+                _, columns[column_name] = JsonStreamReader.read_column(events, row_positions, len(index_keys))
+                continue
+
+            keys, values = JsonStreamReader.read_column(events)
+            if index_keys is None:
+                index_keys = keys
+            elif keys != index_keys:
+                row_positions = row_positions or {key: position for position, key in enumerate(index_keys)}
+                aligned_values = np.full(len(index_keys), np.nan, dtype=object)
+                for key, value in zip(keys, values):
+                    position = row_positions.get(key)
+                    if position is not None:
+                        aligned_values[position] = value
+                values = aligned_values
+            columns[column_name] = values
+            del keys
+
+            if column_name == filter_column:
+                keep = np.asarray(mask_function(pd.Series(values, dtype=object)), dtype=bool)
+                columns = {name: column_values[keep] for name, column_values in columns.items()}  # Drop the invalid rows already read
+                index_keys = [key for key, kept in zip(index_keys, keep) if kept]
+                row_positions = {key: position for position, key in enumerate(index_keys)}
+
+        if index_keys is None:
+            return pd.DataFrame()
+        index = pd.Index(index_keys, dtype=object)
+        try:
+            index = index.astype('int64')  # Keys of a DataFrame.to_json document are row numbers
+        except (TypeError, ValueError):
+            pass
+        return pd.DataFrame(columns, index=index)
+
+    @staticmethod
+    def read_records(byte_stream, row_filter: tuple = None, batch_size: int = 100000, buffer_size: int = 1024 ** 2):
+        """
+        The read_records function reads an NDJSON document one record at a time, dropping the rows the filter rejects in batches
+        of records, before each batch becomes a DataFrame.
+
+        Args:
+            byte_stream: Binary stream of the document.
+            row_filter (tuple): Name of a column and a function giving the mask of the rows to keep from that column, or None.
+            batch_size (int): Number of records filtered at a time.
+            buffer_size (int): Number of bytes read at a time.
+
+        Returns:
+            pd.DataFrame: The table, indexed by line number as pd.read_json(lines=True) would.
+        """
+        filter_column, mask_function = row_filter or (None, None)
+        records = ijson.items(byte_stream, '', multiple_values=True, use_float=True, buf_size=buffer_size)
+        batches, row_number = [], 0
+        while True:
+            batch = [record for _, record in zip(range(batch_size), records)]
+            if not batch:
+                break
+            positions = np.arange(row_number, row_number + len(batch))
+            row_number += len(batch)
+
+            if filter_column is not None:
+                keep = np.asarray(mask_function(pd.Series([record.get(filter_column) for record in batch], dtype=object)), dtype=bool)
+                batch = [record for record, kept in zip(batch, keep) if kept]
+                positions = positions[keep]
+            batches.append(pd.DataFrame.from_records(batch, index=positions))
+
+        return pd.concat(batches) if batches else pd.DataFrame()
+
+    @staticmethod
+    def read_json_table(json_path: str, lines: bool = None, row_filter: tuple = None, batch_size: int = 100000):
+        """
+        The read_json_table function reads a JSON table incrementally, see read_columns and read_records.
+        Without ijson, the whole document is read with pd.read_json and filtered once read.
+
+        Args:
+            json_path (str): URL or local path of the JSON file.
+            lines (bool): Whether the file is NDJSON. None decides from the extension, '.ndjson' or '.jsonl'.
+            row_filter (tuple): Name of a column and a function giving the mask of the rows to keep from that column, or None.
+            batch_size (int): Number of NDJSON records filtered at a time.
+
+        Returns:
+            pd.DataFrame: The table.
+        """
+        if lines is None:
+            lines = json_path.split('?')[0].endswith(('.ndjson', '.jsonl'))
+        if ijson is None:
+            table_df = pd.read_json(json_path, lines=lines, dtype=False, convert_dates=False)  # Keep the values as they are in the document
+            return table_df[np.asarray(row_filter[1](table_df[row_filter[0]]), dtype=bool)] if row_filter is not None else table_df
+        with JsonStreamReader.open_bytes(json_path) as byte_stream:
+            if lines:
+                return JsonStreamReader.read_records(byte_stream, row_filter, batch_size)
+            return JsonStreamReader.read_columns(byte_stream, row_filter)
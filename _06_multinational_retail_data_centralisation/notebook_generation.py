@@ -0,0 +1,97 @@
+import hashlib # to fingerprint notebook contents
+import json # to read the fingerprint of existing notebooks
+import os # to create directories
+
+
+class NotebookGenerator:
+    """
+    A utility class for generating the notebooks used to inspect the extracted tables.
+    Notebooks are collected while the pipeline runs and only written afterwards by generate_notebooks,
+    which skips any notebook whose table schema and location have not changed since it was last written.
+    """
+    def __init__(self):
+        self.pending_notebooks = []  # (notebook path, code of the cell, fingerprint of the table schema and location)
+
+    @staticmethod
+    def table_cell_code(table_name: str, read_statement: str, staged_filename: str):
+        """
+        The table_cell_code function builds the code cell that loads a staged table into a DataFrame and displays it.
+
+        Args:
+            table_name (str): Name of the table.
+            read_statement (str): Python expression loading the table, see TableStaging.read_statement.
+            staged_filename (str): Path of the staged file.
+
+        Returns:
+            str: Code of the cell.
+        """
+        return (f"import pandas as pd\n\n"
+                f"# Import data from '{staged_filename}' into DataFrame.\n"
+                f"table_name = '{table_name}'\n"
+                f"{table_name}_df = {read_statement}\n"
+                f"# Display the DataFrame\n"
+                f"display({table_name}_df)")
+
+    @staticmethod
+    def dataframe_schema(df):
+        """
+        The dataframe_schema function describes the columns of a DataFrame for fingerprinting its notebook.
+
+        Args:
+            df (pd.DataFrame): The table shown by the notebook.
+
+        Returns:
+            list: Column name and dtype of each column.
+        """
+        return [[str(column), str(dtype)] for column, dtype in df.dtypes.items()]
+
+    def add_table_notebook(self, notebook_path: str, code: str, schema: list):
+        """
+        The add_table_notebook function records a notebook to be written by generate_notebooks.
+
+        Args:
+            notebook_path (str): Path of the .ipynb file.
+            code (str): Code of the notebook's cell, which holds the location of the table.
+            schema (list): Column names and types of the table, e.g. from dataframe_schema.
+        """
+        fingerprint = hashlib.sha256(json.dumps([code, schema]).encode('utf-8')).hexdigest()
+        self.pending_notebooks.append((notebook_path, code, fingerprint))
+
+    @staticmethod
+    def notebook_fingerprint(notebook_path: str):
+        """
+        The notebook_fingerprint function reads the fingerprint saved in the metadata of an existing notebook.
+
+        Args:
+            notebook_path (str): Path of the .ipynb file.
+
+        Returns:
+            str: The saved fingerprint, or None if the notebook does not exist or has none.
+        """
+        try:
+            with open(notebook_path, 'r') as nb_file:
+                return json.load(nb_file).get('metadata', {}).get('table_fingerprint')
+        except (OSError, ValueError):
+            return None
+
+    def generate_notebooks(self):
+        """
+        The generate_notebooks function writes the recorded notebooks, skipping those whose table schema and location are unchanged.
+        nbformat is only imported here, so runs that do not generate notebooks never load it.
+        """
+        import nbformat # save as .ipynb
+
+        for notebook_path, code, fingerprint in self.pending_notebooks:
+            if self.notebook_fingerprint(notebook_path) == fingerprint:
+                print(f"'{notebook_path}' is up to date.")
+                continue
+
+            os.makedirs(os.path.dirname(notebook_path) or '.', exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
+            notebook = nbformat.v4.new_notebook()  # Create a new notebook and add a code cell for the table to the notebook
+            notebook.cells.append(nbformat.v4.new_code_cell(code))
+            notebook.metadata['table_fingerprint'] = fingerprint
+            with open(notebook_path, 'w') as nb_file:
+                nbformat.write(notebook, nb_file)
+            print(f"Saved '{notebook_path}'.")
+
+        self.pending_notebooks = []
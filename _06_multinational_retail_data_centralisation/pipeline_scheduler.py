@@ -0,0 +1,124 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait # run stages on a worker pool
+from contextlib import nullcontext # stages are only measured when metrics are given
+
+import time # to time each stage
+
+
+class PipelineScheduler:
+    """
+    A utility class for running the stages of the ETL pipeline concurrently while respecting the dependencies between them.
+    """
+    def __init__(self, metrics=None):
+        """
+        Args:
+            metrics (PipelineMetrics): Records the metrics of each stage and of the steps called within it. None disables them.
+        """
+        self.metrics = metrics
+        self.stages = {}  # Stage name -> (stage function, names of the stages it depends on)
+        self.stage_results = {}  # Stage name -> status, wall time and error of the last run
+
+    def add_stage(self, stage_name: str, stage_function, depends_on: list = None):
+        """
+        The add_stage function registers a stage of the pipeline. A stage only starts once all the stages it depends on
+        have succeeded, so dependencies must be added before the stages that depend on them.
+
+        Args:
+            stage_name (str): Name of the stage.
+            stage_function (function): Function run by the stage, called without arguments.
+            depends_on (list): Names of the stages that must succeed before this stage starts.
+        """
+        depends_on = list(depends_on or [])
+        unknown_stages = [dependency for dependency in depends_on if dependency not in self.stages]
+        if unknown_stages:
+            raise ValueError(f"Stage '{stage_name}' depends on stages that have not been added: {unknown_stages}")
+        self.stages[stage_name] = (stage_function, depends_on)
+
+    def select_stages(self, stage_names: list):
+        """
+        The select_stages function gives a scheduler holding only some of the stages, e.g. to run a single stage.
+        Dependencies on stages that are not selected are dropped, as their work is taken to have been done by an earlier run.
+
+        Args:
+            stage_names (list): Names of the stages to keep.
+
+        Returns:
+            PipelineScheduler: Scheduler holding the selected stages, in the order they were added.
+        """
+        unknown_stages = [stage_name for stage_name in stage_names if stage_name not in self.stages]
+        if unknown_stages:
+            raise ValueError(f"Unknown stages: {unknown_stages}")
+        selected_pipeline = PipelineScheduler(metrics=self.metrics)
+        for stage_name, (stage_function, depends_on) in self.stages.items():
+            if stage_name in stage_names:
+                selected_pipeline.stages[stage_name] = (stage_function, [dependency for dependency in depends_on if dependency in stage_names])
+        return selected_pipeline
+
+    def run_stage(self, stage_name: str):
+        """
+        The run_stage function runs a single stage, recording its wall-clock time.
+        An exception raised by the stage is caught and recorded so that it cannot stop the other stages.
+
+        Args:
+            stage_name (str): Name of the stage to run.
+
+        Returns:
+            dict: Status ('succeeded' or 'failed'), wall time in seconds and error of the stage.
+        """
+        stage_function, _ = self.stages[stage_name]
+        print(f"######################################## Started: {stage_name} ########################################")
+        start_time = time.perf_counter()
+        try:
+            with self.metrics.stage(stage_name) if self.metrics is not None else nullcontext():
+                stage_function()
+            status, error = 'succeeded', None
+        except Exception as e:
+            print(f"Stage '{stage_name}' failed: {e!r}")
+            status, error = 'failed', e
+        wall_time = time.perf_counter() - start_time
+        print(f"######################################## Finished: {stage_name} ({status}, {wall_time:.2f}s) ########################################")
+        return {'status': status, 'wall_time': wall_time, 'error': error}
+
+    def run(self, max_workers: int = 4):
+        """
+        The run function runs all the stages on a pool of worker threads. Each stage is started as soon as all of its
+        dependencies have succeeded; stages depending on a failed or skipped stage are skipped.
+        A summary of the per-stage timings is printed at the end.
+
+        Args:
+            max_workers (int): Maximum number of stages running at the same time.
+
+        Returns:
+            dict: Stage name -> status, wall time in seconds and error of each stage.
+        """
+        self.stage_results = {}
+        pending_stages = dict(self.stages)
+        running_stages = {}  # Future -> stage name
+        start_time = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending_stages or running_stages:
+                for stage_name, (_, depends_on) in list(pending_stages.items()):
+                    dependency_statuses = [self.stage_results.get(dependency, {}).get('status') for dependency in depends_on]
+                    if any(status in ('failed', 'skipped') for status in dependency_statuses):
+                        print(f"Stage '{stage_name}' skipped as a stage it depends on did not succeed.")
+                        self.stage_results[stage_name] = {'status': 'skipped', 'wall_time': 0.0, 'error': None}
+                        del pending_stages[stage_name]
+                    elif all(status == 'succeeded' for status in dependency_statuses):
+                        running_stages[executor.submit(self.run_stage, stage_name)] = stage_name
+                        del pending_stages[stage_name]
+
+                if not running_stages:
+                    continue  # Stages were only skipped this round; check the remaining ones again
+
+                finished_stages, _ = wait(running_stages, return_when=FIRST_COMPLETED)
+                for future in finished_stages:
+                    self.stage_results[running_stages.pop(future)] = future.result()
+
+        total_wall_time = time.perf_counter() - start_time
+        print("Pipeline stage timings:")
+        for stage_name in self.stages:
+            result = self.stage_results[stage_name]
+            print(f"    {stage_name}: {result['status']} in {result['wall_time']:.2f}s")
+        print(f"Pipeline finished in {total_wall_time:.2f}s.\n")
+
+        return self.stage_results
@@ -0,0 +1,86 @@
+from collections import deque # parts in the order they are read
+from concurrent.futures import ThreadPoolExecutor # download parts concurrently
+
+import io
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    A read-only file object over an S3 object, downloaded as byte ranges by concurrent GET requests.
+    Parts are downloaded ahead of the reader, at most one per worker, and handed on in order, so a large object is parsed
+    while it downloads with only a few parts held in memory, and no local file is written.
+    Every range is requested with the ETag of the object, so an object overwritten during the download fails the read
+    instead of mixing parts of both versions.
+    Wrap it in io.BufferedReader before passing it to pd.read_csv.
+    """
+    def __init__(self, s3_client, bucket_name: str, object_key: str, object_size: int, part_size: int = 8 * 1024 ** 2, max_workers: int = 4,
+                 etag: str = None):
+        """
+        Args:
+            s3_client: boto3 S3 client, shared by the workers.
+            bucket_name (str): Name of the bucket.
+            object_key (str): Key of the object.
+            object_size (int): Size of the object in bytes, e.g. its ContentLength.
+            part_size (int): Number of bytes requested by each GET.
+            max_workers (int): Number of parts downloaded at the same time.
+            etag (str): ETag of the object, e.g. from head_object, that every range must match. None accepts any version.
+        """
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.part_starts = iter(range(0, object_size, part_size))
+        self.part_size = part_size
+        self.object_size = object_size
+        self.if_match = {'IfMatch': etag} if etag else {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending_parts = deque()  # Futures of the parts being downloaded, in object order
+        self.part = memoryview(b'')  # Part being read
+        for _ in range(max_workers):
+            self.request_next_part()
+
+    def request_next_part(self):
+        """
+        The request_next_part function starts the download of the next byte range, if any are left.
+        """
+        part_start = next(self.part_starts, None)
+        if part_start is not None:
+            part_end = min(part_start + self.part_size, self.object_size) - 1
+            self.pending_parts.append(self.executor.submit(self.download_part, part_start, part_end))
+
+    def download_part(self, part_start: int, part_end: int):
+        """
+        The download_part function downloads one byte range of the object.
+
+        Args:
+            part_start (int): Offset of the first byte.
+            part_end (int): Offset of the last byte, inclusive.
+
+        Returns:
+            bytes: The bytes of the range.
+
+        Raises:
+            botocore.exceptions.ClientError: 'PreconditionFailed' if the object no longer has the expected ETag.
+        """
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.object_key, Range=f"bytes={part_start}-{part_end}", **self.if_match)
+        return response['Body'].read()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.part:
+            if not self.pending_parts:
+                return 0  # End of the object
+            self.part = memoryview(self.pending_parts.popleft().result())
+            self.request_next_part()  # Keep every worker busy
+        number_of_bytes = min(len(buffer), len(self.part))
+        buffer[:number_of_bytes] = self.part[:number_of_bytes]
+        self.part = self.part[number_of_bytes:]
+        return number_of_bytes
+
+    def close(self):
+        if not self.closed:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.pending_parts.clear()
+        super().close()
@@ -0,0 +1,363 @@
+from sqlalchemy import BigInteger, Column, Float, MetaData, String, Table, case, cast, column, func, inspect, select, table, true
+from sqlalchemy.dialects import postgresql, sqlite # for INSERT ... ON CONFLICT
+
+import pandas as pd
+import time # to report the refresh time
+
+
+class SalesAggregates:
+    """
+    A utility class for answering the business questions of _05_SQL/_02_queries.sql from summary tables rather than from
+    the join of 'orders_table' with 'dim_products', 'dim_store_details' and 'dim_date_times'.
+    'agg_sales_daily' holds the number of sales, product quantity and total sales of each day at each store type and country.
+    'agg_sales_monthly' (month grain) and 'agg_sales_store_type' (store type grain) are rolled up from it.
+    refresh aggregates the orders added since the previous refresh and merges them into the daily table, so only new orders
+    are joined. The summary tables are a few thousand rows, so each question reads far less than the joins do.
+    Orders are joined to every dimension, which the foreign keys of the star-schema guarantee.
+    The totals depend on the dimension tables too, e.g. on product prices; invalidate is called when one of them changes,
+    so the next refresh rebuilds the summary tables from every order.
+    """
+    grain_columns = ['year', 'month', 'day', 'store_type', 'country_code']  # Grain of the daily table
+    sum_columns = ['number_of_sales', 'product_quantity', 'total_sales']  # Measures that add up across the grain
+    time_columns = ['first_sale_time', 'last_sale_time']  # Earliest and latest 'HH:MM:SS' timestamp, kept at the daily grain
+    dimension_tables = ['dim_products', 'dim_store_details', 'dim_date_times']  # Tables joined into the totals, see raw_sales_select
+
+    metadata = MetaData()
+    daily_table = Table('agg_sales_daily', metadata,
+                        *[Column(column_name, String(255), primary_key=True) for column_name in ['year', 'month', 'day', 'store_type', 'country_code']],
+                        Column('number_of_sales', BigInteger, nullable=False), Column('product_quantity', BigInteger),
+                        Column('total_sales', Float(precision=53)), Column('first_sale_time', String(255)), Column('last_sale_time', String(255)))
+    monthly_table = Table('agg_sales_monthly', metadata,
+                          Column('year', String(255), primary_key=True), Column('month', String(255), primary_key=True),
+                          Column('number_of_sales', BigInteger, nullable=False), Column('product_quantity', BigInteger),
+                          Column('total_sales', Float(precision=53)))
+    store_type_table = Table('agg_sales_store_type', metadata,
+                             Column('store_type', String(255), primary_key=True), Column('country_code', String(255), primary_key=True),
+                             Column('number_of_sales', BigInteger, nullable=False), Column('product_quantity', BigInteger),
+                             Column('total_sales', Float(precision=53)))
+    state_table = Table('agg_sales_state', metadata,
+                        Column('source_table', String(255), primary_key=True), Column('high_water_mark', BigInteger),
+                        Column('rows_aggregated', BigInteger))  # How far 'orders_table' has been aggregated
+
+    # Business question of _02_queries.sql -> function answering it
+    questions = {'Task 3. Months with the most sales': 'monthly_sales',
+                 'Task 4. Online and offline sales': 'online_sales',
+                 'Task 5. Share of sales by store type': 'store_type_sales_share',
+                 'Task 6a. Best month of each year': 'best_month_of_each_year',
+                 'Task 6b. Best months across the years': 'top_months',
+                 'Task 8. Sales by store type in Germany': 'country_store_type_sales',
+                 'Task 9. Time between sales each year': 'sales_velocity'}
+
+    @staticmethod
+    def raw_sales_select(grain: list, after_mark = None, up_to_mark = None, watermark_column: str = 'index', with_times: bool = False):
+        """
+        The raw_sales_select function builds the query grouping the joined orders, products, stores and date events at a grain,
+        as the queries of _02_queries.sql do.
+
+        Args:
+            grain (list): Columns to group by, from grain_columns.
+            after_mark: Only select the orders whose watermark column is above this, if given.
+            up_to_mark: Only select the orders whose watermark column is at most this, if given.
+            watermark_column (str): Column of 'orders_table' that increases with every new order.
+            with_times (bool): Whether to also select the earliest and latest timestamp of each group.
+
+        Returns:
+            sqlalchemy.sql.Select: Query giving the grain columns followed by the measures.
+        """
+        orders = table('orders_table', column(watermark_column), column('date_uuid'), column('store_code'), column('product_code'), column('product_quantity'))
+        products = table('dim_products', column('product_code'), column('product_price_(gbp)'))
+        stores = table('dim_store_details', column('store_code'), column('store_type'), column('country_code'))
+        dates = table('dim_date_times', column('date_uuid'), column('year'), column('month'), column('day'), column('timestamp'))
+        grain_expressions = {'year': dates.c.year, 'month': dates.c.month, 'day': dates.c.day,
+                             'store_type': stores.c.store_type, 'country_code': stores.c.country_code}
+
+        measures = [func.count().label('number_of_sales'),
+                    func.sum(orders.c.product_quantity).label('product_quantity'),
+                    func.sum(orders.c.product_quantity * products.c['product_price_(gbp)']).label('total_sales')]
+        if with_times:
+            measures += [func.min(dates.c.timestamp).label('first_sale_time'), func.max(dates.c.timestamp).label('last_sale_time')]
+
+        joined = (orders.join(products, orders.c.product_code == products.c.product_code)
+                        .join(stores, orders.c.store_code == stores.c.store_code)
+                        .join(dates, orders.c.date_uuid == dates.c.date_uuid))
+        statement = select(*[grain_expressions[column_name].label(column_name) for column_name in grain], *measures).select_from(joined)
+        if after_mark is not None:
+            statement = statement.where(orders.c[watermark_column] > after_mark)
+        if up_to_mark is not None:
+            statement = statement.where(orders.c[watermark_column] <= up_to_mark)
+        return statement.group_by(*[grain_expressions[column_name] for column_name in grain])
+
+    @staticmethod
+    def summary_select(grain: list, source_table: Table = None, with_times: bool = False):
+        """
+        The summary_select function builds the query rolling a summary table up to a coarser grain.
+        Unless given, the smallest summary table holding the grain is read.
+
+        Args:
+            grain (list): Columns to group by, from grain_columns.
+            source_table (Table): Summary table to read, e.g. daily_table.
+            with_times (bool): Whether to also select the earliest and latest timestamp of each group, kept in the daily table only.
+
+        Returns:
+            sqlalchemy.sql.Select: Query giving the grain columns followed by the measures.
+        """
+        if source_table is None:
+            if with_times or not set(grain) <= {'year', 'month'} and not set(grain) <= {'store_type', 'country_code'}:
+                source_table = SalesAggregates.daily_table
+            elif set(grain) <= {'year', 'month'}:
+                source_table = SalesAggregates.monthly_table
+            else:
+                source_table = SalesAggregates.store_type_table
+
+        measures = [cast(func.sum(source_table.c.number_of_sales), BigInteger).label('number_of_sales'),  # SUM of a BIGINT is NUMERIC on PostgreSQL
+                    cast(func.sum(source_table.c.product_quantity), BigInteger).label('product_quantity'),
+                    func.sum(source_table.c.total_sales).label('total_sales')]
+        if with_times:
+            measures += [func.min(source_table.c.first_sale_time).label('first_sale_time'), func.max(source_table.c.last_sale_time).label('last_sale_time')]
+        return select(*[source_table.c[column_name] for column_name in grain], *measures).group_by(*[source_table.c[column_name] for column_name in grain])
+
+    @staticmethod
+    def refresh(engine2, watermark_column: str = 'index', full_refresh: bool = False):
+        """
+        The refresh function brings the summary tables up to date with 'orders_table', creating them on first use.
+        Only the orders above the high-water mark of the previous refresh are joined and aggregated; their daily totals are added
+        to 'agg_sales_daily' in one INSERT ... ON CONFLICT statement, and the month and store type tables are rolled up again from it.
+        Everything is rebuilt when full_refresh is set, on the first refresh, when 'orders_table' has been reloaded since the last one,
+        i.e. it no longer holds the same number of orders up to the high-water mark, and when a dimension table has changed since the last one
+        (see invalidate), e.g. product prices or store types, which are already summed into the totals.
+
+        Args:
+            engine2: Database engine object (PostgreSQL or SQLite).
+            watermark_column (str): Column of 'orders_table' that increases with every new order.
+            full_refresh (bool): Whether to rebuild the summary tables from every order.
+
+        Returns:
+            int: Number of orders aggregated.
+        """
+        if not inspect(engine2).has_table('orders_table'):
+            print("'orders_table' is not in the database yet; the sales aggregates were not refreshed.\n")
+            return 0
+
+        start_time = time.perf_counter()
+        SalesAggregates.metadata.create_all(engine2)  # Only creates the tables that do not exist
+        daily_table, state_table = SalesAggregates.daily_table, SalesAggregates.state_table
+        watermark = column(watermark_column)
+        orders = table('orders_table', watermark)
+
+        with engine2.begin() as connection:
+            state = connection.execute(select(state_table.c.high_water_mark, state_table.c.rows_aggregated)
+                                       .where(state_table.c.source_table == 'orders_table')).first()
+            high_water_mark = state.high_water_mark if state is not None and not full_refresh else None
+            latest_mark = connection.execute(select(func.max(watermark)).select_from(orders)).scalar()
+            if latest_mark is None:
+                print("'orders_table' is empty; the sales aggregates were not refreshed.\n")
+                return 0
+
+            if high_water_mark is not None:
+                rows_at_mark = connection.execute(select(func.count()).select_from(orders).where(watermark <= high_water_mark)).scalar()
+                if rows_at_mark != state.rows_aggregated:
+                    print("'orders_table' was reloaded since the last refresh; rebuilding the sales aggregates.")
+                    high_water_mark = None
+
+            if high_water_mark is None:
+                connection.execute(daily_table.delete())
+
+            new_sales = SalesAggregates.raw_sales_select(SalesAggregates.grain_columns, high_water_mark, latest_mark,
+                                                         watermark_column, with_times=True).subquery()  # Orders appended since the last refresh
+            dialect_insert = postgresql.insert if engine2.dialect.name == 'postgresql' else sqlite.insert
+            statement = dialect_insert(daily_table).from_select(list(new_sales.c.keys()), select(new_sales).where(true()))  # WHERE true lets SQLite parse ON CONFLICT after a SELECT
+            excluded = statement.excluded
+            statement = statement.on_conflict_do_update(
+                index_elements=SalesAggregates.grain_columns,
+                set_={**{column_name: daily_table.c[column_name] + excluded[column_name] for column_name in SalesAggregates.sum_columns},
+                      'first_sale_time': case((excluded.first_sale_time < daily_table.c.first_sale_time, excluded.first_sale_time), else_=daily_table.c.first_sale_time),
+                      'last_sale_time': case((excluded.last_sale_time > daily_table.c.last_sale_time, excluded.last_sale_time), else_=daily_table.c.last_sale_time)}
+            )
+            merged_days = connection.execute(statement).rowcount
+
+            for summary_table, grain in [(SalesAggregates.monthly_table, ['year', 'month']), (SalesAggregates.store_type_table, ['store_type', 'country_code'])]:
+                connection.execute(summary_table.delete())
+                connection.execute(summary_table.insert().from_select(grain + SalesAggregates.sum_columns, SalesAggregates.summary_select(grain, daily_table)))
+
+            rows_aggregated = connection.execute(select(func.count()).select_from(orders).where(watermark <= latest_mark)).scalar()
+            new_orders = rows_aggregated - (state.rows_aggregated if high_water_mark is not None else 0)
+            connection.execute(state_table.delete().where(state_table.c.source_table == 'orders_table'))
+            connection.execute(state_table.insert().values(source_table='orders_table', high_water_mark=latest_mark, rows_aggregated=rows_aggregated))
+
+        elapsed_time = time.perf_counter() - start_time
+        print(f"Refreshed the sales aggregates {'incrementally' if high_water_mark is not None else 'from every order'}: "
+              f"{new_orders} orders into {merged_days} days in {elapsed_time:.2f}s.\n")
+        return new_orders
+
+    @staticmethod
+    def invalidate(engine2, changed_table: str):
+        """
+        The invalidate function marks the summary tables as out of date after a dimension table they are joined from has changed,
+        by removing the high-water mark of the previous refresh. The next refresh then rebuilds them from every order, even when it
+        runs in a later run of the pipeline.
+
+        Args:
+            engine2: Database engine object.
+            changed_table (str): Name of the changed table. Tables other than dimension_tables leave the summary tables as they are.
+
+        Returns:
+            bool: Whether the summary tables were marked as out of date.
+        """
+        if changed_table not in SalesAggregates.dimension_tables or not inspect(engine2).has_table(SalesAggregates.state_table.name):
+            return False
+        state_table = SalesAggregates.state_table
+        with engine2.begin() as connection:
+            removed_marks = connection.execute(state_table.delete().where(state_table.c.source_table == 'orders_table')).rowcount
+        if removed_marks:
+            print(f"'{changed_table}' changed; the sales aggregates will be rebuilt from every order at their next refresh.")
+        return bool(removed_marks)
+
+    @staticmethod
+    def read_sales(engine2, grain: list, use_aggregates: bool = True, with_times: bool = False):
+        """
+        The read_sales function gives the number of sales, product quantity and total sales at a grain, read from the summary tables
+        or computed from the joined tables.
+
+        Args:
+            engine2: Database engine object.
+            grain (list): Columns to group by, from grain_columns.
+            use_aggregates (bool): Whether to read the summary tables. False joins 'orders_table' with the dimension tables.
+            with_times (bool): Whether to also give the earliest and latest timestamp of each group.
+
+        Returns:
+            pd.DataFrame: One row per group.
+        """
+        if use_aggregates:
+            statement = SalesAggregates.summary_select(grain, with_times=with_times)
+        else:
+            statement = SalesAggregates.raw_sales_select(grain, with_times=with_times)
+        with engine2.connect() as connection:
+            return pd.read_sql(statement, connection)
+
+    @staticmethod
+    def monthly_sales(engine2, limit: int = 6, use_aggregates: bool = True):
+        """
+        The monthly_sales function answers Task 3: which months produced the largest amount of sales.
+
+        Args:
+            engine2: Database engine object.
+            limit (int): Number of months given.
+            use_aggregates (bool): Whether to read the summary tables, see read_sales.
+
+        Returns:
+            pd.DataFrame: 'total_sales' and 'month', largest first.
+        """
+        monthly_df = SalesAggregates.read_sales(engine2, ['month'], use_aggregates)
+        monthly_df['total_sales'] = monthly_df['total_sales'].round(2)
+        return monthly_df.nlargest(limit, 'total_sales')[['total_sales', 'month']].reset_index(drop=True)
+
+    @staticmethod
+    def online_sales(engine2, use_aggregates: bool = True):
+        """
+        The online_sales function answers Task 4: how many sales are coming from online, i.e. from the 'Web Portal' store type.
+
+        Args:
+            engine2: Database engine object.
+            use_aggregates (bool): Whether to read the summary tables, see read_sales.
+
+        Returns:
+            pd.DataFrame: 'number_of_sales', 'product_quantity_count' and 'location' ('Web' or 'Offline'), fewest sales first.
+        """
+        store_type_df = SalesAggregates.read_sales(engine2, ['store_type'], use_aggregates)
+        store_type_df['location'] = store_type_df['store_type'].eq('Web Portal').map({True: 'Web', False: 'Offline'})
+        location_df = store_type_df.groupby('location', as_index=False)[['number_of_sales', 'product_quantity']].sum()
+        location_df = location_df.rename(columns={'product_quantity': 'product_quantity_count'})
+        return location_df.sort_values('number_of_sales')[['number_of_sales', 'product_quantity_count', 'location']].reset_index(drop=True)
+
+    @staticmethod
+    def store_type_sales_share(engine2, use_aggregates: bool = True):
+        """
+        The store_type_sales_share function answers Task 5: what percentage of sales come through each type of store.
+
+        Args:
+            engine2: Database engine object.
+            use_aggregates (bool): Whether to read the summary tables, see read_sales.
+
+        Returns:
+            pd.DataFrame: 'store_type', 'average_sum_of_payments' (total sales) and 'percentage_total(%)', largest first.
+        """
+        store_type_df = SalesAggregates.read_sales(engine2, ['store_type'], use_aggregates)
+        store_type_df['average_sum_of_payments'] = store_type_df['total_sales'].round(2)
+        store_type_df['percentage_total(%)'] = (store_type_df['total_sales'] / store_type_df['total_sales'].sum() * 100).round(2)
+        return store_type_df.sort_values('average_sum_of_payments', ascending=False)[['store_type', 'average_sum_of_payments', 'percentage_total(%)']].reset_index(drop=True)
+
+    @staticmethod
+    def top_months(engine2, limit: int = 10, use_aggregates: bool = True):
+        """
+        The top_months function answers Task 6b: which months, across all years, produced the highest sales.
+
+        Args:
+            engine2: Database engine object.
+            limit (int): Number of months given.
+            use_aggregates (bool): Whether to read the summary tables, see read_sales.
+
+        Returns:
+            pd.DataFrame: 'total_sales', 'year' and 'month', largest first.
+        """
+        monthly_df = SalesAggregates.read_sales(engine2, ['year', 'month'], use_aggregates)
+        monthly_df['total_sales'] = monthly_df['total_sales'].round(2)
+        return monthly_df.nlargest(limit, 'total_sales')[['total_sales', 'year', 'month']].reset_index(drop=True)
+
+    @staticmethod
+    def best_month_of_each_year(engine2, limit: int = 10, use_aggregates: bool = True):
+        """
+        The best_month_of_each_year function answers Task 6a: which month in each year produced the highest sales.
+
+        Args:
+            engine2: Database engine object.
+            limit (int): Number of years given.
+            use_aggregates (bool): Whether to read the summary tables, see read_sales.
+
+        Returns:
+            pd.DataFrame: 'total_sales', 'year' and 'month', largest first.
+        """
+        monthly_df = SalesAggregates.read_sales(engine2, ['year', 'month'], use_aggregates)
+        best_months_df = monthly_df.loc[monthly_df.groupby('year')['total_sales'].idxmax()]
+        best_months_df['total_sales'] = best_months_df['total_sales'].round(2)
+        return best_months_df.nlargest(limit, 'total_sales')[['total_sales', 'year', 'month']].reset_index(drop=True)
+
+    @staticmethod
+    def country_store_type_sales(engine2, country_code: str = 'DE', use_aggregates: bool = True):
+        """
+        The country_store_type_sales function answers Task 8: which store type is selling the most in a country, by default Germany.
+
+        Args:
+            engine2: Database engine object.
+            country_code (str): Country of the stores.
+            use_aggregates (bool): Whether to read the summary tables, see read_sales.
+
+        Returns:
+            pd.DataFrame: 'total_sales', 'store_type' and 'country_code', smallest first as in _02_queries.sql.
+        """
+        store_type_df = SalesAggregates.read_sales(engine2, ['store_type', 'country_code'], use_aggregates)
+        country_df = store_type_df[store_type_df['country_code'] == country_code].copy()
+        country_df['total_sales'] = country_df['total_sales'].round(2)
+        return country_df.sort_values('total_sales')[['total_sales', 'store_type', 'country_code']].reset_index(drop=True)
+
+    @staticmethod
+    def sales_velocity(engine2, use_aggregates: bool = True):
+        """
+        The sales_velocity function answers Task 9: how quickly the company is making sales, as the average time between
+        consecutive sales in each year. Ordered by time, the gaps between consecutive sales add up to the time between the
+        first and the last sale, so the average is that time divided by the number of gaps, computed from the daily totals.
+
+        Args:
+            engine2: Database engine object.
+            use_aggregates (bool): Whether to read the summary tables, see read_sales.
+
+        Returns:
+            pd.DataFrame: 'year' and 'actual_time_taken' (pd.Timedelta), slowest first.
+        """
+        daily_df = SalesAggregates.read_sales(engine2, ['year', 'month', 'day'], use_aggregates, with_times=True)
+        sale_dates = pd.to_datetime(daily_df[['year', 'month', 'day']].apply(pd.to_numeric, errors='coerce'), errors='coerce')
+        daily_df['first_sale'] = sale_dates + pd.to_timedelta(daily_df['first_sale_time'], errors='coerce')
+        daily_df['last_sale'] = sale_dates + pd.to_timedelta(daily_df['last_sale_time'], errors='coerce')
+
+        yearly_df = daily_df.groupby('year').agg(first_sale=('first_sale', 'min'), last_sale=('last_sale', 'max'), number_of_sales=('number_of_sales', 'sum'))
+        yearly_df['actual_time_taken'] = (yearly_df['last_sale'] - yearly_df['first_sale']) / (yearly_df['number_of_sales'] - 1).where(yearly_df['number_of_sales'] > 1)
+        return yearly_df.sort_values('actual_time_taken', ascending=False)[['actual_time_taken']].reset_index()
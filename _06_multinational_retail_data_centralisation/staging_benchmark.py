@@ -0,0 +1,66 @@
+from _06_multinational_retail_data_centralisation.benchmark import Benchmark
+from _06_multinational_retail_data_centralisation.table_staging import TableStaging
+
+import argparse # command line entry point
+import os # to find the CSV files and size the staged files
+import pandas as pd
+import shutil # to remove the staged tables
+import tempfile # to write the staged tables
+import time # to time each write and read
+
+
+class StagingBenchmark(Benchmark):
+    """
+    A utility class for measuring how long the staged tables take to write and read in each staging format, and their size on disk,
+    starting from the CSV files the pipeline stages, e.g. those in _01_raw_tables_csv and _03_cleaned_tables_csv.
+    """
+    def run_staging(self, csv_folder_paths: list = None, staging_formats: list = None):
+        """
+        The run_staging function reads each CSV file of the folders, stages it in each format with TableStaging.save_table,
+        then times reading it back with TableStaging.read_table, and saves the results.
+
+        Args:
+            csv_folder_paths (list): Folders holding the CSV files, defaults to '_01_raw_tables_csv' and '_03_cleaned_tables_csv'.
+            staging_formats (list): Formats to compare, defaults to 'csv', 'parquet' and 'feather'.
+
+        Returns:
+            dict: 'staging@<table>/<format>' -> best read time in seconds, best write time in seconds, size on disk in bytes and number of rows.
+        """
+        previous_results = self.load_results()
+        results = {}
+        staging_folder_path = tempfile.mkdtemp()
+
+        for csv_folder_path in csv_folder_paths or ['_01_raw_tables_csv', '_03_cleaned_tables_csv']:
+            for csv_filename in sorted(os.listdir(csv_folder_path)):
+                if not csv_filename.endswith('.csv'):
+                    continue
+                table_name = csv_filename[:-len('.csv')]
+                table_df = pd.read_csv(os.path.join(csv_folder_path, csv_filename), low_memory=False)
+
+                for staging_format in staging_formats or ['csv', 'parquet', 'feather']:
+                    write_times, read_times = [], []
+                    for _ in range(self.repeats):
+                        start_time = time.perf_counter()
+                        staged_filename = TableStaging.save_table(table_df, staging_folder_path, table_name, staging_format)
+                        write_times.append(time.perf_counter() - start_time)
+                        start_time = time.perf_counter()
+                        TableStaging.read_table(staged_filename)
+                        read_times.append(time.perf_counter() - start_time)
+
+                    result_key = f"staging@{table_name}/{staging_format}"
+                    results[result_key] = {'wall_time': round(min(read_times), 6), 'peak_memory_bytes': 0, 'write_time': round(min(write_times), 6),
+                                           'file_bytes': os.path.getsize(staged_filename), 'rows_out': len(table_df)}
+                    print(f"{self.describe_result(result_key, results[result_key], previous_results.get(result_key))}"
+                          f"  write {results[result_key]['write_time']:.4f}s, {results[result_key]['file_bytes'] / 1024 ** 2:.2f} MiB on disk")
+
+        shutil.rmtree(staging_folder_path)
+        self.save_results({**previous_results, **results})
+        return results
+
+
+if __name__ == "__main__":
+    # e.g. python -m _06_multinational_retail_data_centralisation.staging_benchmark _01_raw_tables_csv _03_cleaned_tables_csv
+    parser = argparse.ArgumentParser(description = 'Time writing and reading the staged tables as CSV, Parquet and Feather.')
+    parser.add_argument('csv_folder_paths', nargs = '*', help = "folders holding the CSV files, '_01_raw_tables_csv' and '_03_cleaned_tables_csv' by default")
+    arguments = parser.parse_args()
+    StagingBenchmark().run_staging(csv_folder_paths = arguments.csv_folder_paths or None)
@@ -0,0 +1,77 @@
+from _06_multinational_retail_data_centralisation.benchmark import Benchmark
+
+import argparse # command line entry point
+import subprocess # to import a module in a fresh interpreter
+import sys # to run the same interpreter
+
+
+class StartupBenchmark(Benchmark):
+    """
+    A utility class for measuring how long a module, by default main.py, takes to import, and which of its imports are the slowest.
+    The run fails when the import is slower than a threshold, or loads a module that only the stages using it should import.
+    """
+    # Modules main.py only imports in the stages that use them
+    deferred_modules = ['_06_multinational_retail_data_centralisation.dtype_planner', '_06_multinational_retail_data_centralisation.embedded_analytics',
+                        '_06_multinational_retail_data_centralisation.extraction_cache', '_06_multinational_retail_data_centralisation.index_advisor',
+                        '_06_multinational_retail_data_centralisation.pipeline_scheduler', '_06_multinational_retail_data_centralisation.sales_aggregates',
+                        'boto3', 'duckdb', 'nbformat', 'requests', 'tabula']
+
+    def run_startup(self, module_name: str = 'main', slowest_count: int = 10, max_seconds: float = None, deferred_modules: list = None):
+        """
+        The run_startup function measures how long a module, by default main.py, takes to import in a fresh interpreter
+        with python -X importtime, printing the slowest imports, and saves the best of the repeats.
+        It then checks the best import time against max_seconds, and that none of the deferred modules were imported.
+        Run it from the folder holding the module.
+
+        Args:
+            module_name (str): Name of the module to import.
+            slowest_count (int): Number of the slowest imports to print and save.
+            max_seconds (float): Longest import time allowed. None only compares it with the previous run.
+            deferred_modules (list): Modules the import must not load, defaults to deferred_modules when importing main.
+
+        Returns:
+            dict: 'startup@<module>' -> import time in seconds and the slowest imports with their cumulative time in seconds.
+
+        Raises:
+            RuntimeError: If the import fails, is slower than max_seconds or loads a deferred module.
+        """
+        if deferred_modules is None:
+            deferred_modules = self.deferred_modules if module_name == 'main' else []
+        previous_results = self.load_results()
+        best_result = None
+        for _ in range(self.repeats):
+            completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module_name}"], capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise RuntimeError(f"Importing '{module_name}' failed:\n{completed.stderr}")
+            import_times = {}  # Imported module -> cumulative import time in microseconds
+            for line in completed.stderr.splitlines():
+                if line.startswith('import time:') and '|' in line and not line.rstrip().endswith('imported package'):
+                    _, cumulative_time, imported_module = line.split('|')
+                    import_times[imported_module.strip()] = int(cumulative_time)
+            result = {'wall_time': round(import_times[module_name] / 1e6, 6), 'peak_memory_bytes': 0, 'rows_out': 0,
+                      'slowest_imports': {imported_module: round(cumulative_time / 1e6, 6) for imported_module, cumulative_time
+                                          in sorted(import_times.items(), key=lambda item: -item[1])[1:slowest_count + 1]}}
+            if best_result is None or result['wall_time'] < best_result['wall_time']:
+                best_result = result
+
+        result_key = f"startup@{module_name}"
+        print(self.describe_result(result_key, best_result, previous_results.get(result_key)))
+        for imported_module, cumulative_time in best_result['slowest_imports'].items():
+            print(f"    {imported_module:<60} {cumulative_time:>10.4f}s")
+        self.save_results({**previous_results, result_key: best_result})
+
+        problems = [f"'{deferred_module}' was imported" for deferred_module in deferred_modules if deferred_module in import_times]  # The same modules are imported by every run
+        if max_seconds is not None and best_result['wall_time'] > max_seconds:
+            problems.append(f"the import took {best_result['wall_time']:.4f}s, more than {max_seconds}s")
+        if problems:
+            raise RuntimeError(f"Importing '{module_name}': {'; '.join(problems)}.")
+        return {result_key: best_result}
+
+
+if __name__ == "__main__":
+    # e.g. python -m _06_multinational_retail_data_centralisation.startup_benchmark main --max-seconds 1
+    parser = argparse.ArgumentParser(description = 'Time the import of a module with python -X importtime, failing if it is too slow or imports a deferred module.')
+    parser.add_argument('module_name', nargs = '?', default = 'main', help = 'module to import, main.py by default')
+    parser.add_argument('--max-seconds', type = float, default = None, help = 'fail if the import takes longer than this many seconds')
+    arguments = parser.parse_args()
+    StartupBenchmark().run_startup(module_name = arguments.module_name, max_seconds = arguments.max_seconds)
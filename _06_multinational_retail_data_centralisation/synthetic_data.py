@@ -0,0 +1,232 @@
+import numpy as np
+import os # to find the raw CSV files
+import pandas as pd
+import uuid # to generate unique keys
+
+
+class SyntheticDataGenerator:
+    """
+    A utility class for generating raw tables of any size for benchmarking the cleaning functions.
+    Tables saved in the raw CSV folder are resampled with replacement, so the generated rows keep the dirty patterns of the real data
+    and in the same proportions, e.g. 'GGB' country codes, '?' in card numbers, 'eeEurope' continents, mixed date formats
+    and '2 x 100g' weights. The natural keys are regenerated so that they stay unique.
+    The orders and date events tables are not saved as CSV, so they are generated from their known columns and dirty values.
+    """
+    def __init__(self, raw_csv_folder_path: str = '_01_raw_tables_csv', seed: int = 0):
+        """
+        Args:
+            raw_csv_folder_path (str): Folder holding the raw CSV files the tables are resampled from.
+            seed (int): Seed of the random number generator, so the same tables are generated on every run.
+        """
+        self.raw_csv_folder_path = raw_csv_folder_path
+        self.seed = seed
+        self.raw_tables = {}  # Table name -> raw DataFrame, read on first use
+
+    def random_state(self):
+        """
+        The random_state function gives a new random number generator seeded with the generator's seed.
+
+        Returns:
+            np.random.Generator: Random number generator.
+        """
+        return np.random.default_rng(self.seed)
+
+    def read_raw_table(self, table_name: str, **read_csv_kwargs):
+        """
+        The read_raw_table function reads a raw table from its CSV file, once.
+
+        Args:
+            table_name (str): Name of the table, e.g. 'legacy_users'.
+            **read_csv_kwargs: Arguments passed on to pd.read_csv.
+
+        Returns:
+            pd.DataFrame: The raw table.
+        """
+        if table_name not in self.raw_tables:
+            self.raw_tables[table_name] = pd.read_csv(os.path.join(self.raw_csv_folder_path, f"{table_name}.csv"), **read_csv_kwargs)
+        return self.raw_tables[table_name]
+
+    def resample(self, raw_df, number_of_rows: int):
+        """
+        The resample function draws rows from a raw table with replacement.
+
+        Args:
+            raw_df (pd.DataFrame): The raw table.
+            number_of_rows (int): Number of rows to draw.
+
+        Returns:
+            pd.DataFrame: The drawn rows, with a new RangeIndex.
+        """
+        positions = self.random_state().integers(0, len(raw_df), size=number_of_rows)
+        return raw_df.iloc[positions].reset_index(drop=True)
+
+    def uuids(self, number_of_rows: int):
+        """
+        The uuids function generates unique UUID strings, reproducibly for a given seed.
+
+        Args:
+            number_of_rows (int): Number of UUIDs.
+
+        Returns:
+            np.ndarray: UUID strings.
+        """
+        random_bytes = self.random_state().bytes(16 * number_of_rows)
+        return np.array([str(uuid.UUID(bytes=random_bytes[i:i + 16], version=4)) for i in range(0, len(random_bytes), 16)], dtype=object)
+
+    def legacy_users(self, number_of_rows: int):
+        """
+        The legacy_users function generates a raw legacy_users table, as read from the RDS database ('NULL' rows kept as text).
+
+        Args:
+            number_of_rows (int): Number of rows.
+
+        Returns:
+            pd.DataFrame: Raw user data.
+        """
+        raw_df = self.read_raw_table('legacy_users', index_col=0, keep_default_na=False, na_values=[''])
+        users_df = self.resample(raw_df, number_of_rows)
+        users_df['index'] = np.arange(number_of_rows)
+        users_df['user_uuid'] = self.uuids(number_of_rows)
+        return users_df
+
+    def card_details(self, number_of_rows: int):
+        """
+        The card_details function generates a raw card_details table, as extracted from the PDF.
+
+        Args:
+            number_of_rows (int): Number of rows.
+
+        Returns:
+            pd.DataFrame: Raw card details.
+        """
+        raw_df = self.read_raw_table('card_details', dtype={'card_number': str})
+        return self.resample(raw_df, number_of_rows)
+
+    def store_details(self, number_of_rows: int):
+        """
+        The store_details function generates a raw store_details table, as retrieved from the API.
+
+        Args:
+            number_of_rows (int): Number of rows.
+
+        Returns:
+            pd.DataFrame: Raw store details.
+        """
+        raw_df = self.read_raw_table('store_details')
+        stores_df = self.resample(raw_df, number_of_rows)
+        stores_df['index'] = np.arange(number_of_rows)
+        return stores_df
+
+    def products_details(self, number_of_rows: int):
+        """
+        The products_details function generates a raw products_details table, as downloaded from S3.
+
+        Args:
+            number_of_rows (int): Number of rows.
+
+        Returns:
+            pd.DataFrame: Raw product details.
+        """
+        raw_df = self.read_raw_table('products_details', index_col=0)
+        products_df = self.resample(raw_df, number_of_rows)
+        products_df['uuid'] = self.uuids(number_of_rows)
+        return products_df
+
+    def orders_table(self, number_of_rows: int):
+        """
+        The orders_table function generates a raw orders_table, with the empty 'first_name', 'last_name' and '1' columns
+        the RDS table holds. Users and products are drawn from the generated legacy_users and products_details tables.
+
+        Args:
+            number_of_rows (int): Number of rows.
+
+        Returns:
+            pd.DataFrame: Raw order details.
+        """
+        rng = self.random_state()
+        users = self.legacy_users(min(number_of_rows, 15000))
+        products = self.read_raw_table('products_details', index_col=0)
+        cards = self.read_raw_table('card_details', dtype={'card_number': str})
+        stores = self.read_raw_table('store_details')
+        return pd.DataFrame({'level_0': np.arange(number_of_rows),
+                             'index': np.arange(number_of_rows),
+                             'date_uuid': self.uuids(number_of_rows),
+                             'first_name': None,
+                             'last_name': None,
+                             'user_uuid': users['user_uuid'].to_numpy()[rng.integers(0, len(users), number_of_rows)],
+                             'card_number': cards['card_number'].to_numpy()[rng.integers(0, len(cards), number_of_rows)],
+                             'store_code': stores['store_code'].to_numpy()[rng.integers(0, len(stores), number_of_rows)],
+                             'product_code': products['product_code'].to_numpy()[rng.integers(0, len(products), number_of_rows)],
+                             '1': np.nan,
+                             'product_quantity': rng.integers(1, 14, number_of_rows)})
+
+    def date_details(self, number_of_rows: int):
+        """
+        The date_details function generates a raw date_details table, as read from the JSON file.
+        About 0.3% of the rows hold 'NULL' or a random 10 character code in every column, like the real file.
+
+        Args:
+            number_of_rows (int): Number of rows.
+
+        Returns:
+            pd.DataFrame: Raw date events.
+        """
+        rng = self.random_state()
+        dates_df = pd.DataFrame({'timestamp': pd.to_datetime(rng.integers(0, 86400, number_of_rows), unit='s').strftime('%H:%M:%S'),
+                                 'month': rng.integers(1, 13, number_of_rows).astype(str),
+                                 'year': rng.integers(1992, 2023, number_of_rows).astype(str),
+                                 'day': rng.integers(1, 29, number_of_rows).astype(str),
+                                 'time_period': rng.choice(['Evening', 'Morning', 'Midday', 'Late_Hours'], number_of_rows),
+                                 'date_uuid': self.uuids(number_of_rows)})
+
+        dirty_rows = rng.random(number_of_rows) < 0.003
+        codes = rng.choice(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'), size=(int(dirty_rows.sum()), 10))
+        dirty_values = np.where(rng.random(len(codes)) < 0.5, 'NULL', [''.join(code) for code in codes]) if len(codes) else []
+        for column in dates_df.columns:
+            dates_df.loc[dirty_rows, column] = dirty_values
+        return dates_df
+
+    def card_details_pdf(self, pdf_path: str, number_of_pages: int, rows_per_page: int = 50):
+        """
+        The card_details_pdf function writes a card details PDF like the one on S3, with a table of generated rows on every page,
+        for benchmarking the PDF extraction. The PDF is written directly, without a PDF library.
+
+        Args:
+            pdf_path (str): Path of the PDF file to write.
+            number_of_pages (int): Number of pages.
+            rows_per_page (int): Number of table rows on each page.
+
+        Returns:
+            str: Path of the PDF file.
+        """
+        cards_df = self.card_details(number_of_pages * rows_per_page).fillna('NULL').astype(str)
+        column_positions = [40, 170, 250, 420]  # x position of each column on the page
+
+        def escape(text):
+            return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+        objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]  # The page tree is added last
+        page_numbers = []
+        for page in range(number_of_pages):
+            page_rows = [list(cards_df.columns)] + cards_df.iloc[page * rows_per_page:(page + 1) * rows_per_page].values.tolist()
+            text_commands = [f"BT /F1 8 Tf {x} {800 - 15 * row_number} Td ({escape(value)}) Tj ET"
+                             for row_number, row in enumerate(page_rows) for x, value in zip(column_positions, row)]
+            content = '\n'.join(text_commands).encode('latin-1', errors='replace')
+            objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+            objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+            page_numbers.append(len(objects))
+        objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b' '.join(b"%d 0 R" % number for number in page_numbers), number_of_pages)
+
+        pdf = bytearray(b"%PDF-1.4\n")
+        offsets = []
+        for object_number, pdf_object in enumerate(objects, 1):
+            offsets.append(len(pdf))
+            pdf += b"%d 0 obj\n%s\nendobj\n" % (object_number, pdf_object)
+        xref_offset = len(pdf)
+        pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        pdf += b''.join(b"%010d 00000 n \n" % offset for offset in offsets)
+        pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+
+        with open(pdf_path, 'wb') as pdf_file:
+            pdf_file.write(pdf)
+        return pdf_path
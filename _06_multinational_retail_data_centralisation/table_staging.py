@@ -0,0 +1,199 @@
+import os # to create directories
+import pandas as pd
+
+
+class TableStaging:
+    """
+    A utility class for saving and loading the raw and cleaned tables staged on disk between the steps of the pipeline.
+    Parquet and Feather (Arrow IPC) keep the dtypes of the DataFrame, e.g. category, string and datetime, and are
+    compressed; CSV is kept for exporting the tables to other tools.
+    """
+    file_extensions = {'parquet': 'parquet', 'feather': 'feather', 'csv': 'csv'}
+
+    @staticmethod
+    def table_path(folder_path: str, table_name: str, staging_format: str):
+        """
+        The table_path function builds the path a table is staged at.
+
+        Args:
+            folder_path (str): Folder holding the staged tables.
+            table_name (str): Name of the table.
+            staging_format (str): 'parquet', 'feather' or 'csv'.
+
+        Returns:
+            str: Path of the staged file.
+        """
+        if staging_format not in TableStaging.file_extensions:
+            raise ValueError(f"Unknown staging format '{staging_format}'. Expected one of {list(TableStaging.file_extensions)}.")
+        return os.path.join(folder_path, f"{table_name}.{TableStaging.file_extensions[staging_format]}")
+
+    @staticmethod
+    def to_arrow_compatible(df):
+        """
+        The to_arrow_compatible function converts object columns holding a mix of types, e.g. numbers and 'N/A' strings,
+        to the pandas string dtype so that they can be written to Parquet or Feather. Other columns are unchanged.
+
+        Args:
+            df (pd.DataFrame): DataFrame to convert.
+
+        Returns:
+            pd.DataFrame: DataFrame that can be converted to an Arrow table.
+        """
+        mixed_columns = [column for column in df.columns
+                         if df[column].dtype == object and df[column].dropna().map(type).nunique() > 1]
+        if not mixed_columns:
+            return df
+        print(f"Columns {mixed_columns} hold mixed types and are staged as strings.")
+        return df.astype({column: 'string' for column in mixed_columns})
+
+    @staticmethod
+    def save_table(df, folder_path: str, table_name: str, staging_format: str = 'parquet', index: bool = False, export_csv: bool = False):
+        """
+        The save_table function stages a DataFrame on disk in the chosen format, optionally also exporting it as CSV.
+
+        Args:
+            df (pd.DataFrame): DataFrame to save.
+            folder_path (str): Folder holding the staged tables.
+            table_name (str): Name of the table.
+            staging_format (str): 'parquet' (zstd compressed), 'feather' (lz4 compressed Arrow IPC) or 'csv'.
+            index (bool): Whether to save the DataFrame index.
+            export_csv (bool): Whether to also save the table as CSV.
+
+        Returns:
+            str: Path of the staged file.
+        """
+        os.makedirs(folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
+        staged_filename = TableStaging.table_path(folder_path, table_name, staging_format)
+
+        if staging_format == 'parquet':
+            TableStaging.to_arrow_compatible(df).to_parquet(staged_filename, index=index, compression='zstd')
+        elif staging_format == 'feather':
+            staged_df = TableStaging.to_arrow_compatible(df)
+            if not index:
+                staged_df = staged_df.reset_index(drop=True)  # Saved as a range, so read back as the default index
+            staged_df.to_feather(staged_filename, compression='lz4')  # The index is kept in the pandas metadata and restored by read_table
+        else:
+            df.to_csv(staged_filename, index=index)
+
+        if export_csv and staging_format != 'csv':
+            df.to_csv(TableStaging.table_path(folder_path, table_name, 'csv'), index=index)
+
+        return staged_filename
+
+    @staticmethod
+    def staging_schema(first_schema, dictionaries: bool = True):
+        """
+        The staging_schema function gives the Arrow schema a chunked table is staged with, from the schema of its first chunk, so that the
+        later chunks can be cast to it. A column that is empty in the first chunk is staged as strings, and categoricals get a 32-bit
+        dictionary index, as a later chunk can hold more categories than an 8-bit index has room for.
+
+        Args:
+            first_schema (pa.Schema): Schema of the first chunk as pa.Table.from_pandas builds it.
+            dictionaries (bool): Whether categoricals are staged as dictionaries. Arrow IPC files hold one dictionary per column
+                for all their record batches, so Feather stages them as their values instead; read_table makes them categoricals again.
+
+        Returns:
+            pa.Schema: The schema of the staged file, keeping the pandas metadata of the first chunk.
+        """
+        import pyarrow as pa # build the schema of the staged file
+        fields = []
+        for field in first_schema:
+            if pa.types.is_null(field.type):
+                field = field.with_type(pa.string())  # An empty column holds text in the later chunks
+            elif pa.types.is_dictionary(field.type):
+                value_type = pa.string() if pa.types.is_null(field.type.value_type) else field.type.value_type
+                field = field.with_type(pa.dictionary(pa.int32(), value_type, field.type.ordered) if dictionaries else value_type)
+            fields.append(field)
+        return pa.schema(fields, metadata=first_schema.metadata)
+
+    @staticmethod
+    def save_chunks(table_chunks, folder_path: str, table_name: str, staging_format: str = 'parquet', index: bool = False, export_csv: bool = False):
+        """
+        The save_chunks function stages a table streamed in chunks, appending each chunk to the staged file as it passes through, so the
+        whole table is never held in memory. The file is the one save_table writes: Parquet gets one row group per chunk, Feather one
+        record batch per chunk. Every chunk is cast to the column types of the first, see staging_schema, failing on values that do not
+        fit them. The chunks are yielded on unchanged so they can be cleaned and uploaded in the same pass.
+
+        Args:
+            table_chunks (iterable): DataFrames holding consecutive chunks of a table.
+            folder_path (str): Folder holding the staged tables.
+            table_name (str): Name of the table.
+            staging_format (str): 'parquet' (zstd compressed), 'feather' (lz4 compressed Arrow IPC) or 'csv'.
+            index (bool): Whether to save the DataFrame index.
+            export_csv (bool): Whether to also save the table as CSV.
+
+        Yields:
+            pd.DataFrame: The next chunk of the table.
+        """
+        os.makedirs(folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
+        staged_filename = TableStaging.table_path(folder_path, table_name, staging_format)
+        csv_filename = TableStaging.table_path(folder_path, table_name, 'csv') if export_csv or staging_format == 'csv' else None
+
+        writer = None
+        rows_saved = 0
+        try:
+            for chunk in table_chunks:
+                if staging_format != 'csv':
+                    import pyarrow as pa # build the Arrow table of each chunk
+                    chunk_table = pa.Table.from_pandas(TableStaging.to_arrow_compatible(chunk), preserve_index=index)
+                    if writer is None:
+                        schema = TableStaging.staging_schema(chunk_table.schema, dictionaries=staging_format == 'parquet')
+                        if staging_format == 'parquet':
+                            import pyarrow.parquet as pq
+                            writer = pq.ParquetWriter(staged_filename, schema, compression='zstd')
+                        else:
+                            writer = pa.ipc.new_file(staged_filename, schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+                    writer.write_table(chunk_table.cast(schema, safe=True))
+                if csv_filename is not None:
+                    chunk.to_csv(csv_filename, index=index, mode='w' if rows_saved == 0 else 'a', header=rows_saved == 0)
+                rows_saved += len(chunk)
+                print(f"Saved {rows_saved} rows as {staged_filename}.")
+                yield chunk
+        finally:
+            if writer is not None:
+                writer.close()  # Write the footer, so the rows saved so far can be read
+
+    @staticmethod
+    def read_table(staged_filename: str):
+        """
+        The read_table function loads a staged table, working out its format from the file extension.
+        Parquet and Feather files are memory-mapped rather than read into a buffer first, and the index they were saved with is restored,
+        as are the categoricals of a Feather file staged in chunks.
+        CSV files are read back with a default index; the saved index is the first column.
+
+        Args:
+            staged_filename (str): Path of the staged file.
+
+        Returns:
+            pd.DataFrame: The staged table.
+        """
+        if staged_filename.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            return pq.read_table(staged_filename, memory_map=True).to_pandas()
+        if staged_filename.endswith('.feather'):
+            import pyarrow.feather as feather
+            staged_table = feather.read_table(staged_filename, memory_map=True)
+            staged_df = staged_table.to_pandas()
+            categorical_columns = [column['name'] for column in (staged_table.schema.pandas_metadata or {}).get('columns', [])
+                                   if column['pandas_type'] == 'categorical' and column['name'] in staged_df.columns
+                                   and staged_df[column['name']].dtype != 'category']
+            return staged_df.astype({column: 'category' for column in categorical_columns}) if categorical_columns else staged_df
+        return pd.read_csv(staged_filename)
+
+    @staticmethod
+    def read_statement(staged_filename: str, index_col: bool = False):
+        """
+        The read_statement function gives the pandas call that loads a staged table, for use in the generated notebooks.
+
+        Args:
+            staged_filename (str): Path of the staged file, as seen from the notebook.
+            index_col (bool): Whether the first column of a CSV file is the index.
+
+        Returns:
+            str: Python expression loading the table into a DataFrame.
+        """
+        if staged_filename.endswith('.parquet'):
+            return f"pd.read_parquet(r'{staged_filename}')"
+        if staged_filename.endswith('.feather'):
+            return f"pd.read_feather(r'{staged_filename}')"
+        return f"pd.read_csv(r'{staged_filename}'{', index_col=0' if index_col else ''})"
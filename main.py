@@ -1,48 +1,138 @@
-import nbformat # save as .ipynb
-import pandas as pd
-import yaml # to read .yaml. Help with read_db
+import argparse # command line entry point
+import threading # the engines and the extraction cache are created by whichever stage needs them first
 import os # to create directories
 
 from _06_multinational_retail_data_centralisation.data_cleaning import DataCleaning as dcl
 from _06_multinational_retail_data_centralisation.data_extraction import DataExtractor as dex
 from _06_multinational_retail_data_centralisation.database_utils import DatabaseConnector as dc
+from _06_multinational_retail_data_centralisation.instrumentation import PipelineMetrics
+from _06_multinational_retail_data_centralisation.table_staging import TableStaging
 from decouple import config # Calling sensitive information
+from functools import lru_cache, partial # read the API credentials once; pass report_dates to the chunk cleaners
 
 ############################################################################################################################################################
 # Initialise instances
-data_cleaner = dcl()
-api_connector = dc()
-data_extractor = dex()
+pipeline_metrics = PipelineMetrics(metrics_path = 'pipeline_metrics.json', profile_folder_path = None)  # Records every extract, clean and load call; set profile_folder_path (e.g. '.profiles') to cProfile each stage, best with pipeline_max_workers = 1
+data_cleaner = pipeline_metrics.instrument_object(dcl())
+api_connector = pipeline_metrics.instrument_object(dc())
+data_extractor = pipeline_metrics.instrument_object(dex())
 
 cred_path='db_creds.yaml'
+db_pool_options = {'pool_size': 6, 'max_overflow': 4, 'pool_timeout': 60, 'pool_pre_ping': True, 'statement_timeout_ms': None}  # Keep pool_size at least pipeline_max_workers so concurrent stages do not wait for a connection
+engines = {}  # 'RDS' and 'sales_data' engines, created on first use by get_engines
+engines_lock = threading.Lock()
 
-credentials = api_connector.read_db_creds(file_path = cred_path)    # Read .yaml for credentials
-engine, engine2 = api_connector.init_db_engine(credentials)      # Initialise database engine
+def get_engines():
+    """
+    The get_engines function gives the pooled RDS and sales_data engines, shared by the stages. The database credentials are read
+    and the engines created the first time it is called, so stages that do not use the databases never need the credentials.
 
-cred_config_access = config('credentials_env') # refers to .yaml file via decouple import config; to gain access to private credentials for API
-cred_config_api = api_connector.read_db_creds(file_path = cred_config_access) # extracts the credentials from .yaml file
+    Returns:
+        tuple: RDS engine and sales_data engine.
+    """
+    with engines_lock:
+        if not engines:
+            credentials = api_connector.read_db_creds(file_path = cred_path)    # Read .yaml for credentials
+            engines['RDS'], engines['sales_data'] = api_connector.init_db_engine(credentials, **db_pool_options)      # Initialise database engine
+    return engines['RDS'], engines['sales_data']
+
+@lru_cache(maxsize = None)
+def get_api_credentials():
+    """
+    The get_api_credentials function reads the private credentials for the API and the S3 bucket the first time it is called.
+
+    Returns:
+        dict: The API credentials.
+    """
+    cred_config_access = config('credentials_env') # refers to .yaml file via decouple import config; to gain access to private credentials for API
+    return api_connector.read_db_creds(file_path = cred_config_access) # extracts the credentials from .yaml file
 
 # Define file paths
 raw_csv_folder_path = '_01_raw_tables_csv'  # Define the folder path where you want to save the CSV files
 raw_notebook_folder_path = '_02_manipulate_raw_tables_ipynb'  # Define the folder path where you want to save the notebooks
 cleaned_csv_folder_path = '_03_cleaned_tables_csv'  # Define the folder path where you want to save the cleaned CSV files
+staging_format = 'parquet'  # Format the raw and cleaned tables are staged in: 'parquet', 'feather' or 'csv'
+export_csv = True  # Also save the staged tables as CSV
+
+store_api_max_workers = 16  # Number of stores requested from the API at the same time
+store_api_cache_max_age_seconds = 0  # How long the extraction cache reuses the stores; the API gives no version of them, so 0 always calls it
+clean_inplace = True  # Let the cleaners change the extracted tables instead of copying them; the raw tables are not used after cleaning
+report_date_parsing = False  # Print, for each date column cleaned, the rows parsed by a known format and by the dateutil fallback, and the time taken
+s3_max_workers = 4  # Number of byte ranges of an S3 object downloaded at the same time; 1 streams it with a single GET
+pdf_max_workers = 4  # Number of page ranges of the card details PDF extracted at the same time; 1 reads it in one pass
+pdf_stream_ranges = True  # Clean and load the card details one page range at a time as they are extracted; False reads the whole PDF first
+stream_date_events = False  # Read the date events JSON incrementally with ijson, dropping the rows with an invalid time_period as it is read; the values are kept as text, where pd.read_json converts them
+rds_chunksize = 100000  # Number of rows streamed from the RDS tables at a time; None reads each table in one go
+rds_watermark_column = 'index'  # Column of the RDS tables that increases with every new row; its highest value is part of a table's version in the extraction cache
+pipeline_max_workers = 6  # Number of ETL stages run at the same time
+star_schema_sql_path = os.path.join('_05_SQL', '_01_star_schema_sales_data.sql')  # Completes the star-schema once all tables are uploaded
+typed_upload = True  # Convert the cleaned tables to compact dtypes and create them with their star-schema column types, see DtypePlanner
+star_schema_keys_sql_path = os.path.join('_05_SQL', '_04_star_schema_keys.sql')  # Only adds the keys, run instead of the full script with typed_upload
+schema_first_load = True  # Create each table with its keys before its rows are loaded, so the star-schema stage has nothing left to do; needs typed_upload, see check_settings
+
+orders_incremental_load = True  # Only load the orders added since the last run once 'orders_table' is in the database; False reloads the whole table
+orders_watermark_column = 'index'  # Column of 'orders_table' that increases with every new order, used as the high-water mark
+dimension_load_mode = 'upsert'  # 'upsert' merges the dimension tables once the star-schema is built, keeping their keys; 'replace' recreates them, and the foreign keys of 'orders_table' are added back by the star-schema stage
+dimension_keys = {'dim_users': 'user_uuid', 'dim_card_details': 'card_number', 'dim_store_details': 'store_code',
+                  'dim_products': 'product_code', 'dim_date_times': 'date_uuid'}  # Natural key each dimension table is merged on
+star_schema_foreign_keys = {'orders_table': {'fk_orders_date': ('date_uuid', 'dim_date_times'), 'fk_orders_user': ('user_uuid', 'dim_users'),
+                                             'fk_orders_store': ('store_code', 'dim_store_details'), 'fk_orders_product': ('product_code', 'dim_products'),
+                                             'fk_orders_card': ('card_number', 'dim_card_details')}}  # Constraint name -> (column, referenced dimension table)
+
+create_workload_indexes = True  # Index the foreign keys of 'orders_table' and the columns the business questions filter and group on, see IndexAdvisor
+explain_index_workload = False  # Time the queries of _02_queries.sql with EXPLAIN ANALYZE before and after the indexes are built; runs each query twice
+queries_sql_path = os.path.join('_05_SQL', '_02_queries.sql')
+index_report_path = 'index_report.json'  # Where the index build times and query timings are saved
+refresh_sales_aggregates = True  # Keep the summary tables SalesAggregates answers the business questions from up to date after each load
+sales_aggregates_full_refresh = False  # Always rebuild the summary tables from every order; otherwise only new orders are added, unless a dimension table they join changed
+
+generate_notebooks = False  # Write the notebooks for inspecting the raw tables once the ETL stages have run
+notebook_generator = None  # Collects the notebooks when generate_notebooks is set
+if generate_notebooks:
+    from _06_multinational_retail_data_centralisation.notebook_generation import NotebookGenerator # only needed when the notebooks are written
+    notebook_generator = NotebookGenerator()
+
+use_extraction_cache = True  # Reuse extracted tables while their sources are unchanged; False always extracts
+extraction_cache_options = {'cache_folder_path': '.extraction_cache', 'max_size_bytes': 2 * 1024 ** 3}
+extraction_caches = {}  # The extraction cache, created on first use by get_extraction_cache
+extraction_cache_lock = threading.Lock()
+
+def get_extraction_cache():
+    """
+    The get_extraction_cache function gives the extraction cache shared by the stages. The cache and its folder are created
+    the first time it is called, so importing main.py or running stages that extract nothing never touches the disk.
+
+    Returns:
+        ExtractionCache: The extraction cache, or None if use_extraction_cache is False.
+    """
+    if not use_extraction_cache:
+        return None
+    with extraction_cache_lock:
+        if not extraction_caches:
+            from _06_multinational_retail_data_centralisation.extraction_cache import ExtractionCache # only needed by the stages that extract
+            extraction_caches['cache'] = ExtractionCache(**extraction_cache_options)
+    return extraction_caches['cache']
 
 ############################################################################################################################################################
 
-def setup_and_extract_data(cred_path: str, table_index: int = 2): # Step 1: Specify the correct file path
+def setup_and_extract_data(cred_path: str, table_index: int = 2, chunksize: int = None): # Step 1: Specify the correct file path
     """
     The setup_and_extract_data function sets up database connection and extracts data from selected table.
     Lists all tables in the database, and prompts user (bt this has been hard coded) to select a table to extract data from (defaults to index 2).
     Reads the selected table into a pandas DataFrame, displays it, then saves it as a CSV file in the specified folder path (raw_csv_folder_path). 
     The CSV filename is named after the name of the selected table with .csv extension appended at end of filename e.g orders_table -&gt; orders_table.csv
+    When a chunksize is given the table is streamed instead: a generator of DataFrames is returned and each chunk is appended
+    to the staged file as it is read (see TableStaging.save_chunks), so the whole table is never held in memory.
         
     Args:
         cred_path (str): Path to the credentials file.
         table_index (int): Index of the table to extract data from.
+        chunksize (int): Number of rows per chunk. None reads the whole table at once.
 
     Returns:
-        tuple: DataFrame containing selected table data, name of the selected table and database engine.
+        tuple: DataFrame (or generator of DataFrames) containing selected table data, name of the selected table and database engine.
     """
+    engine, engine2 = get_engines()
     tables = data_extractor.list_db_tables(engine)  # Step 4: List all tables in the database
     print("Available Tables:\n") 
     for i, table_name in enumerate(tables, 1):  # Available Tables: ['legacy_store_details', 'legacy_users', 'orders_table']  i.e. table 1, 2, 3 (indices 0, 1, 2 respectively)
@@ -52,40 +142,146 @@ def setup_and_extract_data(cred_path: str, table_index: int = 2): # Step 1: Spec
     selected_table = tables[selected_index]
     print(f"Table {table_index}. '{selected_table}', shall be extracted.\n")
 
-    selected_table_df = data_extractor.read_rds_table(selected_table, engine)  # Step 5: Read the selected table into a pandas DataFrame
-
-    print(selected_table_df, "\n")  # Display the DataFrame
-
-    os.makedirs(raw_csv_folder_path, exist_ok=True) # Ensure that the folder exists, create it if it doesn't
-    raw_csv_filename = os.path.join(raw_csv_folder_path, f"{selected_table}.csv")  # Save the DataFrame as a CSV file in the specified folder
-    selected_table_df.to_csv(raw_csv_filename, index=True)
-    print(f"Saved {selected_table} DataFrame as {raw_csv_filename}. \n")
-
-    os.makedirs(raw_notebook_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-    notebook = nbformat.v4.new_notebook()  # Create a new notebook and add a code cell for the table to the notebook
-    code_cell = nbformat.v4.new_code_cell(f"import pandas as pd\n"
-                                            f"import sys\n"
-                                            f"sys.path.append('C:\\\\Users\\\\chemi\\\\AiCore_Projects\\\\multinational-retail-data-centralisation')\n"
-                                            f"sys.path.append(r'c:\\Users\\chemi\\AiCore_Projects\\multinational-retail-data-centralisation')\n"
-                                            #f"sys.path.append(r'..\multinational-retail-data-centralisation946')\n"
-                                            #f"sys.path.append('..\\multinational-retail-data-centralisation946')\n\n"
-                                            f"from _06_multinational_retail_data_centralisation.database_utils import DatabaseConnector as dc\n\n"
-                                            f"api_connector = dc()\n"
-                                            f"credentials = api_connector.read_db_creds('..\{cred_path}')\n"
-                                            f"engine, _ = api_connector.init_db_engine(credentials)\n"
-                                            f"# Import data from '{selected_table}' table into DataFrame\n"
-                                            f"{selected_table}_df = pd.read_sql('{selected_table}', engine)\n"
-                                            f"# Display the DataFrame\n"
-                                            f"{selected_table}_df")
-    notebook.cells.append(code_cell) 
-
-    raw_notebook_filename = os.path.join(raw_notebook_folder_path, f"{selected_table}.ipynb")  # Save the notebook to a .ipynb file in the specified folder
-    with open(raw_notebook_filename, 'w') as nb_file:
-        nbformat.write(notebook, nb_file)
-        print(f"Saved {selected_table} DataFrame as {raw_notebook_filename}.\n")
+    if chunksize is None:
+        selected_table_df = data_extractor.read_rds_table(selected_table, engine, cache=get_extraction_cache(), watermark_column=rds_watermark_column)  # Step 5: Read the selected table into a pandas DataFrame
+
+        print(selected_table_df, "\n")  # Display the DataFrame
+
+        raw_staged_filename = TableStaging.save_table(selected_table_df, raw_csv_folder_path, selected_table, staging_format, index=True, export_csv=export_csv)  # Save the DataFrame in the specified folder
+        print(f"Saved {selected_table} DataFrame as {raw_staged_filename}. \n")
+    else:
+        table_chunks = data_extractor.read_rds_table(selected_table, engine, chunksize=chunksize, cache=get_extraction_cache(), watermark_column=rds_watermark_column)  # Step 5: Stream the selected table in chunks
+        selected_table_df = TableStaging.save_chunks(table_chunks, raw_csv_folder_path, selected_table, staging_format, index=True, export_csv=export_csv)  # Append each chunk to the staged file
+
+    if notebook_generator is not None:  # Record a notebook for the table, written once the pipeline has run
+        code = (f"import pandas as pd\n"
+                f"import sys\n"
+                f"sys.path.append('C:\\\\Users\\\\chemi\\\\AiCore_Projects\\\\multinational-retail-data-centralisation')\n"
+                f"sys.path.append(r'c:\\Users\\chemi\\AiCore_Projects\\multinational-retail-data-centralisation')\n"
+                #f"sys.path.append(r'..\multinational-retail-data-centralisation946')\n"
+                #f"sys.path.append('..\\multinational-retail-data-centralisation946')\n\n"
+                f"from _06_multinational_retail_data_centralisation.database_utils import DatabaseConnector as dc\n\n"
+                f"api_connector = dc()\n"
+                f"credentials = api_connector.read_db_creds('..\{cred_path}')\n"
+                f"engine, _ = api_connector.init_db_engine(credentials, pool_size = 1, max_overflow = 0)  # A single connection is enough for a notebook\n"
+                f"# Import data from '{selected_table}' table into DataFrame\n"
+                f"{selected_table}_df = pd.read_sql('{selected_table}', engine)\n"
+                f"# Display the DataFrame\n"
+                f"{selected_table}_df")
+        notebook_generator.add_table_notebook(os.path.join(raw_notebook_folder_path, f"{selected_table}.ipynb"),  # Save the notebook to a .ipynb file in the specified folder
+                                              code,
+                                              data_extractor.list_table_columns(selected_table, engine)
+                                              )
 
     return selected_table_df, selected_table, engine2
 
+def check_settings():
+    """
+    The check_settings function rejects settings that cannot be used together, before any stage runs.
+    schema_first_load needs typed_upload: the star-schema stage is skipped once 'dim_users' has its primary key, so tables created
+    with their keys but without their star-schema columns and types would never be completed by _05_SQL/_01_star_schema_sales_data.sql.
+
+    Raises:
+        ValueError: If schema_first_load is set without typed_upload.
+    """
+    if schema_first_load and not typed_upload:
+        raise ValueError("schema_first_load needs typed_upload: set typed_upload = True, or schema_first_load = False to complete "
+                         "the star-schema with _05_SQL/_01_star_schema_sales_data.sql once the tables are loaded.")
+
+def plan_upload(cleaned_df, uploaded_table_name: str):
+    """
+    The plan_upload function prepares a cleaned table for upload. With typed_upload, the columns changed by the star-schema SQL
+    are matched and converted to compact dtypes, and the table is created with its star-schema column types, so it needs no casting once loaded.
+
+    Args:
+        cleaned_df (pd.DataFrame): The cleaned DataFrame.
+        uploaded_table_name (str): Name of the database table, e.g. 'dim_users'.
+
+    Returns:
+        tuple: The DataFrame to upload, and the column types to create the table with (None to let pandas infer them).
+    """
+    if not typed_upload:
+        return cleaned_df, None
+    from _06_multinational_retail_data_centralisation.dtype_planner import DtypePlanner # only needed with typed_upload
+    star_schema_df = data_cleaner.match_star_schema(cleaned_df, uploaded_table_name)  # Match the columns changed by the star-schema SQL
+    return DtypePlanner.plan_table(star_schema_df, uploaded_table_name)
+
+def upload_table(cleaned_df, uploaded_table_name: str, if_exists: str = 'replace'):
+    """
+    The upload_table function uploads a cleaned table, see plan_upload. With schema_first_load, the table is first created
+    with its final column types, its primary key (see dimension_keys) and its foreign keys (see star_schema_foreign_keys),
+    then the rows are appended, so each table is written once and never altered afterwards.
+
+    Args:
+        cleaned_df (pd.DataFrame): The cleaned DataFrame.
+        uploaded_table_name (str): Name of the database table, e.g. 'orders_table'.
+        if_exists (str): 'replace' to recreate the table, 'append' to add the rows to it.
+    """
+    if schema_first_load:
+        check_settings()
+    _, engine2 = get_engines()
+    upload_df, column_types = plan_upload(cleaned_df, uploaded_table_name)
+    if schema_first_load:
+        api_connector.create_table(upload_df, uploaded_table_name, engine2, dtype=column_types, primary_key=dimension_keys.get(uploaded_table_name),
+                                   foreign_keys=star_schema_foreign_keys.get(uploaded_table_name), if_exists=if_exists)
+        if_exists = 'append'  # Keep the keys of the new table
+    api_connector.upload_to_db(upload_df, uploaded_table_name, engine2, if_exists=if_exists, dtype=column_types)
+
+def load_dimension(cleaned_df, uploaded_table_name: str, if_exists: str = 'replace'):
+    """
+    The load_dimension function uploads a cleaned dimension table. Once the star-schema has been built, i.e. the table has its primary key,
+    the rows are merged into the table on its natural key (see dimension_keys) rather than recreating it, so the keys, indexes and
+    the foreign keys of 'orders_table' stay in place and only the changed rows are written.
+    When rows of a table the sales aggregates are joined from change, or the table is uploaded again, the aggregates are marked
+    for a rebuild from every order at their next refresh, see SalesAggregates.invalidate.
+
+    Args:
+        cleaned_df (pd.DataFrame): The cleaned DataFrame.
+        uploaded_table_name (str): Name of the dimension table, e.g. 'dim_users'.
+        if_exists (str): What to do when the table is uploaded rather than merged, 'replace' or 'append'.
+    """
+    from _06_multinational_retail_data_centralisation.dtype_planner import DtypePlanner # only needed with typed_upload
+    from _06_multinational_retail_data_centralisation.sales_aggregates import SalesAggregates # to mark the aggregates for a rebuild
+    _, engine2 = get_engines()
+    if dimension_load_mode == 'upsert' and api_connector.has_primary_key(uploaded_table_name, engine2):
+        star_schema_df = data_cleaner.match_star_schema(cleaned_df, uploaded_table_name)  # Match the columns changed by the star-schema SQL
+        column_types = None
+        if typed_upload:
+            star_schema_df, column_types = DtypePlanner.plan_table(star_schema_df, uploaded_table_name)
+        changed_rows = api_connector.upsert_to_db(star_schema_df, uploaded_table_name, dimension_keys[uploaded_table_name], engine2, dtype=column_types)
+    else:
+        upload_table(cleaned_df, uploaded_table_name, if_exists=if_exists)
+        changed_rows = len(cleaned_df)
+    if changed_rows:
+        SalesAggregates.invalidate(engine2, uploaded_table_name)  # The totals hold the previous prices, store types or dates
+
+def clean_and_upload_chunks(table_chunks, clean_data, selected_table: str, uploaded_table_name: str, engine2, index: bool, if_exists: str = 'replace'):
+    """
+    The clean_and_upload_chunks function cleans, saves and uploads a table one chunk at a time, keeping memory use bounded by the chunk size.
+    The first chunk replaces the cleaned staged file and is uploaded according to if_exists; the following chunks are appended to them.
+    The staged file is the one a run without chunks writes, in staging_format, see TableStaging.save_chunks.
+
+    Args:
+        table_chunks (iterable): DataFrames holding consecutive chunks of the table.
+        clean_data (function): DataCleaning method applied to each chunk.
+        selected_table (str): Name of the extracted table, used to name the cleaned staged file.
+        uploaded_table_name (str): Name of the database table to upload to.
+        engine2: Database engine object.
+        index (bool): Whether to save the DataFrame index in the cleaned staged file.
+        if_exists (str): What to do with the database table for the first chunk, 'replace' or 'append'.
+    """
+    cleaned_table_name = f"{selected_table}_data_cleaned"
+    cleaned_table_chunks = (clean_data(chunk, inplace=clean_inplace) for chunk in table_chunks)  # Clean each chunk as it is read
+    staged_chunks = TableStaging.save_chunks(cleaned_table_chunks, cleaned_csv_folder_path, cleaned_table_name, staging_format, index=index, export_csv=export_csv)
+    for chunk_number, cleaned_chunk in enumerate(staged_chunks):
+        chunk_if_exists = if_exists if chunk_number == 0 else 'append'
+        if uploaded_table_name in dimension_keys:
+            load_dimension(cleaned_chunk, uploaded_table_name, if_exists=chunk_if_exists)
+        else:
+            upload_table(cleaned_chunk, uploaded_table_name, if_exists=chunk_if_exists)
+
+    print(f"Saved cleaned '{selected_table}' DataFrame as '{TableStaging.table_path(cleaned_csv_folder_path, cleaned_table_name, staging_format)}'.\n")
+
 def one_etl_legacy_users():
     """
     The one_etl_leagacy_users function extracts, transforms, and loads data for legacy users.
@@ -94,17 +290,19 @@ def one_etl_legacy_users():
     It saves that cleaned DataFrame as a CSV file in our cleaned CSVs folder.
     Finally, it uploads that cleaned DataFrame to pgAdmin 4 using SQLAlchemy.   
     """
-    selected_table_df, selected_table, engine2 = setup_and_extract_data(cred_path = cred_path, table_index = 2)
-    cleaned_user_df = data_cleaner.clean_user_data(selected_table_df)  # Clean the selected table DataFrame
+    selected_table_df, selected_table, engine2 = setup_and_extract_data(cred_path = cred_path, table_index = 2, chunksize = rds_chunksize)
+    if rds_chunksize is not None:
+        clean_and_upload_chunks(selected_table_df, partial(data_cleaner.clean_user_data, report_dates=report_date_parsing), selected_table, 'dim_users', engine2, index=False)
+        return
+
+    cleaned_user_df = data_cleaner.clean_user_data(selected_table_df, inplace=clean_inplace, report_dates=report_date_parsing)  # Clean the selected table DataFrame
     print(f"Cleaned '{selected_table}' DataFrame: \n")
     print(cleaned_user_df, "\n")
 
-    os.makedirs(cleaned_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-    cleaned_csv_filename = os.path.join(cleaned_csv_folder_path, f"{selected_table}_data_cleaned.csv")  # Save the cleaned DataFrame as a CSV file in the specified folder
-    cleaned_user_df.to_csv(cleaned_csv_filename, index=False)
-    print(f"Saved cleaned '{selected_table}' DataFrame as '{cleaned_csv_filename}'.")
+    cleaned_staged_filename = TableStaging.save_table(cleaned_user_df, cleaned_csv_folder_path, f"{selected_table}_data_cleaned", staging_format, index=False, export_csv=export_csv)  # Save the cleaned DataFrame in the specified folder
+    print(f"Saved cleaned '{selected_table}' DataFrame as '{cleaned_staged_filename}'.")
 
-    api_connector.upload_to_db(cleaned_user_df, 'dim_users', engine2)  # Upload the cleaned data to the database
+    load_dimension(cleaned_user_df, 'dim_users')  # Upload or merge the cleaned data into the database
 
 def two_etl_card_details():
     """
@@ -113,25 +311,44 @@ def two_etl_card_details():
     Then it cleans that DataFrame using the clean_card_data function from our data_cleaner module.
     It saves that cleaned DataFrame as a CSV file in our cleaned CSVs folder.
     Finally, it uploads that cleaned DataFrame to pgAdmin 4 using SQLAlchemy.   
+    With pdf_stream_ranges, each page range of the PDF is cleaned, saved and uploaded as soon as it is extracted instead.
     """
+    cred_config_api = get_api_credentials()
     s3_card_details = cred_config_api['s3_card_details'] # access the .yaml key
-    date_details_df, table_name, raw_csv_filename = data_extractor.retrieve_pdf_data(pdf_path = s3_card_details, 
+    if pdf_stream_ranges:
+        _, engine2 = get_engines()
+        page_ranges, table_name, raw_staged_filename = data_extractor.retrieve_pdf_data(pdf_path = s3_card_details,
+                                                                                     raw_csv_folder_path = raw_csv_folder_path,
+                                                                                     raw_notebook_folder_path = raw_notebook_folder_path,
+                                                                                     cache = get_extraction_cache(),
+                                                                                     notebooks = notebook_generator,
+                                                                                     max_workers = pdf_max_workers,
+                                                                                     stream = True
+                                                                                     )  # Stream the page ranges of the PDF from the AWS S3 bucket
+        print(f"'{table_name}', shall be extracted to '{raw_staged_filename}'.\n")
+        clean_and_upload_chunks(page_ranges, partial(data_cleaner.clean_card_data, report_dates=report_date_parsing), table_name, 'dim_card_details', engine2, index=False)
+        return
+
+    date_details_df, table_name, raw_staged_filename = data_extractor.retrieve_pdf_data(pdf_path = s3_card_details, 
                                                                                      raw_csv_folder_path = raw_csv_folder_path, 
-                                                                                     raw_notebook_folder_path = raw_notebook_folder_path 
+                                                                                     raw_notebook_folder_path = raw_notebook_folder_path,
+                                                                                     cache = get_extraction_cache(),
+                                                                                     staging_format = staging_format,
+                                                                                     export_csv = export_csv,
+                                                                                     notebooks = notebook_generator,
+                                                                                     max_workers = pdf_max_workers
                                                                                      )  # Retrieve PDF from AWS S3 bucket and convert to CSV
     print(f"'{table_name}', shall be extracted.\n")
     print(date_details_df, "\n")  # Display the DataFrame
 
-    cleaned_date_df = data_cleaner.clean_card_data(date_details_df)
+    cleaned_date_df = data_cleaner.clean_card_data(date_details_df, inplace=clean_inplace, report_dates=report_date_parsing)
     print(f"Cleaned '{table_name}' DataFrame:\n")
     print(cleaned_date_df, "\n")
 
-    os.makedirs(cleaned_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-    cleaned_csv_filename = os.path.join(cleaned_csv_folder_path, f"{table_name}_data_cleaned.csv")  # Save the cleaned DataFrame as a CSV file in the specified folder
-    cleaned_date_df.to_csv(cleaned_csv_filename, index=False)
-    print(f"Saved cleaned '{table_name}' DataFrame as '{cleaned_csv_filename}'.\n")
+    cleaned_staged_filename = TableStaging.save_table(cleaned_date_df, cleaned_csv_folder_path, f"{table_name}_data_cleaned", staging_format, index=False, export_csv=export_csv)  # Save the cleaned DataFrame in the specified folder
+    print(f"Saved cleaned '{table_name}' DataFrame as '{cleaned_staged_filename}'.\n")
 
-    api_connector.upload_to_db(cleaned_date_df, 'dim_card_details', engine2)  # Upload the cleaned data to the database
+    load_dimension(cleaned_date_df, 'dim_card_details')  # Upload or merge the cleaned data into the database
 
 def three_etl_store_details():
     """
@@ -141,6 +358,7 @@ def three_etl_store_details():
     It saves that cleaned DataFrame as a CSV file in our cleaned CSVs folder.
     Finally, it uploads that cleaned DataFrame to pgAdmin 4 using SQLAlchemy.   
     """
+    cred_config_api = get_api_credentials()
     x_api_key = cred_config_api['api_key'] # access the .yaml key
     headers = {'x-api-key': x_api_key}
     number_of_stores_endpoint = cred_config_api['number_of_stores_endpoint']
@@ -151,7 +369,13 @@ def three_etl_store_details():
                                                                               headers, 
                                                                               number_of_stores,
                                                                               raw_csv_folder_path,
-                                                                              raw_notebook_folder_path
+                                                                              raw_notebook_folder_path,
+                                                                              max_workers = store_api_max_workers,
+                                                                              cache = get_extraction_cache(),
+                                                                              cache_max_age_seconds = store_api_cache_max_age_seconds,
+                                                                              staging_format = staging_format,
+                                                                              export_csv = export_csv,
+                                                                              notebooks = notebook_generator
                                                                               )  # retrieve data for all stores and save in a Pandas df
     if stores_df is not None:
         print(f"'{table_name}', shall be extracted.\n")
@@ -159,16 +383,14 @@ def three_etl_store_details():
     else:
         print("Failed to retrieve stores data.")
 
-    cleaned_store_df = data_cleaner.called_clean_store_data(stores_df)
+    cleaned_store_df = data_cleaner.called_clean_store_data(stores_df, inplace=clean_inplace)
     print(f"Cleaned '{table_name}' DataFrame: \n")
     print(cleaned_store_df, "\n")
 
-    os.makedirs(cleaned_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-    cleaned_csv_filename = os.path.join(cleaned_csv_folder_path, f"{table_name}_data_cleaned.csv")  # Save the cleaned DataFrame as a CSV file in the specified folder
-    cleaned_store_df.to_csv(cleaned_csv_filename, index=False)
-    print(f"Saved cleaned '{table_name}' DataFrame as '{cleaned_csv_filename}'.\n")
+    cleaned_staged_filename = TableStaging.save_table(cleaned_store_df, cleaned_csv_folder_path, f"{table_name}_data_cleaned", staging_format, index=False, export_csv=export_csv)  # Save the cleaned DataFrame in the specified folder
+    print(f"Saved cleaned '{table_name}' DataFrame as '{cleaned_staged_filename}'.\n")
 
-    api_connector.upload_to_db(cleaned_store_df, 'dim_store_details', engine2)  # Upload the cleaned data to the database
+    load_dimension(cleaned_store_df, 'dim_store_details')  # Upload or merge the cleaned data into the database
 
 def four_etl_product_details():
     """
@@ -178,13 +400,19 @@ def four_etl_product_details():
     It saves that cleaned DataFrame as a CSV file in our cleaned CSVs folder. 
     Finally, it uploads that cleaned DataFrame to pgAdmin 4 using SQLAlchemy.   
     """
+    cred_config_api = get_api_credentials()
     s3_address_products = cred_config_api['s3_address_products'] # access the .yaml key
     local_csv_file_path_products = cred_config_api['local_csv_file_path_products'] # specifies the desired local path to save the file
     local_ipynb_file_path_products = cred_config_api['local_ipynb_file_path_products'] 
     products_df, table_name, csv_filename = data_extractor.extract_from_s3(s3_address = s3_address_products, 
                                                                           csv_path = local_csv_file_path_products, 
                                                                           ipynb_path = local_ipynb_file_path_products,
-                                                                          raw_notebook_folder_path = raw_notebook_folder_path
+                                                                          raw_notebook_folder_path = raw_notebook_folder_path,
+                                                                          cache = get_extraction_cache(),
+                                                                          staging_format = staging_format,
+                                                                          notebooks = notebook_generator,
+                                                                          export_csv = export_csv,
+                                                                          max_workers = s3_max_workers
                                                                           )
     if products_df is not None:
         print(f"'{table_name}', shall be extracted.\n")
@@ -192,17 +420,15 @@ def four_etl_product_details():
     else:
         print("Failed to retrieve products data.")
 
-    products_df_filtered = data_cleaner.clean_products_data(products_df)
-    cleaned_products_data = data_cleaner.convert_product_weights(products_df_filtered)
+    products_df_filtered = data_cleaner.clean_products_data(products_df, inplace=clean_inplace, report_dates=report_date_parsing)
+    cleaned_products_data = data_cleaner.convert_product_weights(products_df_filtered, inplace=True)  # products_df_filtered is only used here
     print(f"Cleaned '{table_name}' DataFrame:\n")
     print(cleaned_products_data, "\n")
 
-    os.makedirs(cleaned_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-    cleaned_csv_filename = os.path.join(cleaned_csv_folder_path, f"{table_name}_data_cleaned.csv")  # Save the cleaned DataFrame as a CSV file in the specified folder
-    cleaned_products_data.to_csv(cleaned_csv_filename, index=True)
-    print(f"Saved cleaned '{table_name}' DataFrame as '{cleaned_csv_filename}'.\n")
+    cleaned_staged_filename = TableStaging.save_table(cleaned_products_data, cleaned_csv_folder_path, f"{table_name}_data_cleaned", staging_format, index=True, export_csv=export_csv)  # Save the cleaned DataFrame in the specified folder
+    print(f"Saved cleaned '{table_name}' DataFrame as '{cleaned_staged_filename}'.\n")
 
-    api_connector.upload_to_db(cleaned_products_data, 'dim_products', engine2)  # Upload the cleaned data to the database
+    load_dimension(cleaned_products_data, 'dim_products')  # Upload or merge the cleaned data into the database
 
 def five_etl_orders_details():
     """
@@ -211,18 +437,60 @@ def five_etl_orders_details():
     Then it cleans that DataFrame using the clean_orders_data function from the data_cleaner module.
     Next it saves that cleaned DataFrame as a CSV file in a specified folder on disk (the 'cleaned' subfolder).
     Finally, it uploads that cleaned DataFrame to pgAdmin 4 using SQLAlchemy.   
+    With orders_incremental_load, once 'orders_table' is in the database only the new orders are loaded, see five_etl_orders_delta.
     """
-    selected_table_df, selected_table, engine2 = setup_and_extract_data(cred_path = cred_path, table_index = 3)
-    cleaned_user_df = data_cleaner.clean_orders_data(selected_table_df)  # Clean the selected table DataFrame
+    _, engine2 = get_engines()
+    if orders_incremental_load:
+        high_water_mark = api_connector.read_high_water_mark('orders_table', orders_watermark_column, engine2)
+        if high_water_mark is not None:
+            five_etl_orders_delta(high_water_mark)
+            return
+
+    selected_table_df, selected_table, engine2 = setup_and_extract_data(cred_path = cred_path, table_index = 3, chunksize = rds_chunksize)
+    if rds_chunksize is not None:
+        clean_and_upload_chunks(selected_table_df, data_cleaner.clean_orders_data, selected_table, 'orders_table', engine2, index=True)
+        return
+
+    cleaned_user_df = data_cleaner.clean_orders_data(selected_table_df, inplace=clean_inplace)  # Clean the selected table DataFrame
     print(f"Cleaned '{selected_table}' DataFrame: \n")
     print(cleaned_user_df, "\n")
 
-    os.makedirs(cleaned_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-    cleaned_csv_filename = os.path.join(cleaned_csv_folder_path, f"{selected_table}_data_cleaned.csv")  # Save the cleaned DataFrame as a CSV file in the specified folder
-    cleaned_user_df.to_csv(cleaned_csv_filename, index=True)
-    print(f"Saved cleaned '{selected_table}' DataFrame as '{cleaned_csv_filename}'.\n")
+    cleaned_staged_filename = TableStaging.save_table(cleaned_user_df, cleaned_csv_folder_path, f"{selected_table}_data_cleaned", staging_format, index=True, export_csv=export_csv)  # Save the cleaned DataFrame in the specified folder
+    print(f"Saved cleaned '{selected_table}' DataFrame as '{cleaned_staged_filename}'.\n")
+
+    upload_table(cleaned_user_df, 'orders_table')  # Upload the cleaned data to the database
+
+def five_etl_orders_delta(high_water_mark):
+    """
+    The five_etl_orders_delta function loads only the orders added to the RDS 'orders_table' since the last run.
+    It extracts the rows whose watermark column is above the high-water mark, cleans them using the clean_orders_data function
+    and appends them to 'orders_table' in the database, so the run time grows with the number of new orders rather than the size of the table.
+    The new rows are saved in the cleaned folder as 'orders_table_delta_<high_water_mark>_data_cleaned', one file per incremental load,
+    so the staged orders stay complete for EmbeddedAnalytics.
+
+    Args:
+        high_water_mark: Highest value of the watermark column already loaded to the database.
+    """
+    engine, engine2 = get_engines()
+    delta_table = f"orders_table_delta_{high_water_mark}"  # Each incremental load is staged under its own name
+    print(f"Loading the orders with {orders_watermark_column} above {high_water_mark}.\n")
+    new_orders = data_extractor.read_new_rds_rows('orders_table', engine, orders_watermark_column, high_water_mark, chunksize=rds_chunksize)
+    if rds_chunksize is not None:
+        clean_and_upload_chunks(new_orders, data_cleaner.clean_orders_data, delta_table, 'orders_table', engine2, index=True, if_exists='append')
+        return
+
+    if new_orders.empty:
+        print("No new orders to load.\n")
+        return
+
+    cleaned_orders_df = data_cleaner.clean_orders_data(new_orders, inplace=clean_inplace)  # Clean the new rows only
+    print(f"Cleaned {len(cleaned_orders_df)} new orders: \n")
+    print(cleaned_orders_df, "\n")
+
+    cleaned_staged_filename = TableStaging.save_table(cleaned_orders_df, cleaned_csv_folder_path, f"{delta_table}_data_cleaned", staging_format, index=True, export_csv=export_csv)  # Save the new cleaned rows in the specified folder
+    print(f"Saved the new cleaned orders as '{cleaned_staged_filename}'.\n")
 
-    api_connector.upload_to_db(cleaned_user_df, 'orders_table', engine2)  # Upload the cleaned data to the database
+    upload_table(cleaned_orders_df, 'orders_table', if_exists='append')  # Append the new rows, keeping the keys of the star-schema
 
 def six_etl_date_events():
     """
@@ -232,43 +500,137 @@ def six_etl_date_events():
     It saves that cleaned DataFrame as a CSV file in our cleaned CSVs folder. 
     Finally, it uploads that cleaned DataFrame to pgAdmin 4 using SQLAlchemy.  
     """
+    cred_config_api = get_api_credentials()
     s3_address_date_events = cred_config_api['s3_address_date_events'] # access the .yaml key
-    date_details_df, table_name, raw_csv_filename = data_extractor.retrieve_json_data(json_path = s3_address_date_events, 
+    date_details_df, table_name, raw_staged_filename = data_extractor.retrieve_json_data(json_path = s3_address_date_events, 
                                                                                       raw_notebook_folder_path = raw_notebook_folder_path,
-                                                                                      raw_csv_folder_path = raw_csv_folder_path
+                                                                                      raw_csv_folder_path = raw_csv_folder_path,
+                                                                                      cache = get_extraction_cache(),
+                                                                                      staging_format = staging_format,
+                                                                                      export_csv = export_csv,
+                                                                                      notebooks = notebook_generator,
+                                                                                      stream = stream_date_events,
+                                                                                      row_filter = ('time_period', dcl.time_period_mask)
                                                                                       )  # Retrieve JSON data from the AWS S3 bucket and convert it to CSV format
-    date_details_df_filtered = data_cleaner.clean_date_data(date_details_df)  # Clean the date events DataFrame
+    date_details_df_filtered = data_cleaner.clean_date_data(date_details_df, inplace=clean_inplace)  # Clean the date events DataFrame
     print(f"Cleaned '{table_name}' DataFrame:\n")  # Display the cleaned DataFrame
     print(date_details_df_filtered, "\n")
 
-    os.makedirs(cleaned_csv_folder_path, exist_ok=True)  # Ensure that the folder exists, create it if it doesn't
-    cleaned_csv_filename = os.path.join(cleaned_csv_folder_path, f"{table_name}_data_cleaned.csv")  # Save the cleaned DataFrame as a CSV file in the specified folder
-    date_details_df_filtered.to_csv(cleaned_csv_filename, index=False)
-    print(f"Saved cleaned '{table_name}' DataFrame as '{cleaned_csv_filename}'.\n")
+    cleaned_staged_filename = TableStaging.save_table(date_details_df_filtered, cleaned_csv_folder_path, f"{table_name}_data_cleaned", staging_format, index=False, export_csv=export_csv)  # Save the cleaned DataFrame in the specified folder
+    print(f"Saved cleaned '{table_name}' DataFrame as '{cleaned_staged_filename}'.\n")
 
-    api_connector.upload_to_db(date_details_df_filtered, 'dim_date_times', engine2)  # Upload the cleaned data to the database
+    load_dimension(date_details_df_filtered, 'dim_date_times')  # Upload or merge the cleaned data into the database
+
+def seven_star_schema():
+    """
+    The seven_star_schema function casts the uploaded tables to their final data types and adds the primary and foreign keys
+    that complete the star-schema, by running the milestone 3 SQL script against the database.
+    The script is skipped once the star-schema has been built, as the dimension tables are then merged and 'orders_table' appended
+    to in place. To build it again, drop the tables first with _05_SQL/_03_drop_table_query.sql.
+    With typed_upload the tables were created with their final data types, so only the keys are added;
+    with schema_first_load the keys were created with the tables too, so only the foreign keys of 'orders_table' dropped when
+    a dimension table was replaced (see DatabaseConnector.create_table) are added back, once every table is loaded.
+    With create_workload_indexes, the indexes missing for the joins and filters of the business questions are then built and the tables analysed.
+    """
+    _, engine2 = get_engines()
+    if api_connector.has_primary_key('dim_users', engine2):
+        print("The star-schema is already in place.\n")
+    else:
+        api_connector.run_sql_file(star_schema_keys_sql_path if typed_upload else star_schema_sql_path, engine2)
+    if schema_first_load:
+        for table_name, foreign_keys in star_schema_foreign_keys.items():
+            api_connector.add_foreign_keys(table_name, foreign_keys, engine2)
+    if create_workload_indexes:
+        from _06_multinational_retail_data_centralisation.index_advisor import IndexAdvisor # only needed by this stage
+        IndexAdvisor.index_workload(engine2, queries_sql_path, explain = explain_index_workload, max_workers = db_pool_options['pool_size'], report_path = index_report_path)
+
+def eight_sales_aggregates():
+    """
+    The eight_sales_aggregates function refreshes the daily, monthly and store type summary tables of the sales once the tables
+    have been loaded. Only the orders added since the last refresh are aggregated, unless sales_aggregates_full_refresh is set
+    or a dimension table the totals are joined from has changed (see load_dimension).
+    The business questions of _05_SQL/_02_queries.sql can then be answered from them with SalesAggregates, e.g. SalesAggregates.monthly_sales(engine2).
+    """
+    from _06_multinational_retail_data_centralisation.sales_aggregates import SalesAggregates # only needed by this stage
+    _, engine2 = get_engines()
+    SalesAggregates.refresh(engine2, watermark_column = orders_watermark_column, full_refresh = sales_aggregates_full_refresh)
+
+def build_pipeline():
+    """
+    The build_pipeline function declares the stages of the ETL pipeline and the dependencies between them.
+    The six ETL stages read from different sources and write different tables, so they are independent of one another;
+    the star-schema stage needs all of the tables uploaded first. With schema_first_load, 'orders_table' is created with its
+    foreign keys, so the orders stage runs once the dimension tables have been loaded. When enabled, the sales aggregates are refreshed
+    after the star-schema stage and the notebooks are written after the ETL stages.
+
+    Returns:
+        PipelineScheduler: Scheduler holding the stages of the pipeline.
+    """
+    from _06_multinational_retail_data_centralisation.pipeline_scheduler import PipelineScheduler # not needed to import main.py or call a stage
+    pipeline = PipelineScheduler(metrics = pipeline_metrics)
+    pipeline.add_stage('1. ETL of Legacy Users', one_etl_legacy_users)
+    pipeline.add_stage('2. ETL of Card Details', two_etl_card_details)
+    pipeline.add_stage('3. ETL of Store Details', three_etl_store_details)
+    pipeline.add_stage('4. ETL of Product Details', four_etl_product_details)
+    pipeline.add_stage('6. ETL of Date Events', six_etl_date_events)
+    pipeline.add_stage('5. ETL of Orders Details', five_etl_orders_details, depends_on=list(pipeline.stages) if schema_first_load else None)
+    etl_stages = list(pipeline.stages)
+    pipeline.add_stage('7. Star-schema', seven_star_schema, depends_on=etl_stages)
+    if refresh_sales_aggregates:
+        pipeline.add_stage('8. Sales aggregates', eight_sales_aggregates, depends_on=['7. Star-schema'])
+    if notebook_generator is not None:
+        pipeline.add_stage('9. Notebooks', notebook_generator.generate_notebooks, depends_on=etl_stages)
+    return pipeline
 
 ############################################################################################################################################################
 ############################################################################################################################################################
 ############################################################################################################################################################
     
-if __name__ == "__main__":
-    print("######################################## 1. ETL of Legacy Users ########################################")
-    one_etl_legacy_users()
-
-    print("######################################## 2. ETL of Card Details ########################################")
-    two_etl_card_details()
-
-    print("######################################## 3. ETL of Store Details ########################################")
-    three_etl_store_details()
-
-    print("######################################## 4. ETL of Product Details ########################################")
-    four_etl_product_details()
-
-    print("######################################## 5. ETL of Orders Details ########################################")
-    five_etl_orders_details()
-
-    print("######################################## 6. ETL of Date Events ########################################")
-    six_etl_date_events()
+def main(argv: list = None):
+    """
+    The main function is the command line entry point. It runs the whole pipeline, or only the stages whose numbers are given,
+    e.g. `python main.py 5` for the orders only. Credentials are read and engines created only when a selected stage needs them,
+    and the engines are disposed of once the stages have run. `python main.py --analyse` runs no stage; it answers the business questions
+    from the cleaned staged tables with EmbeddedAnalytics instead.
 
+    Args:
+        argv (list): Command line arguments, defaults to those of the process.
+    """
+    parser = argparse.ArgumentParser(description = 'Extract, clean and load the sales data into the star-schema.')
+    parser.add_argument('stages', nargs = '*', help = 'numbers of the stages to run, e.g. 1 5; all stages by default')
+    parser.add_argument('--list', action = 'store_true', help = 'list the stages and exit')
+    parser.add_argument('--workers', type = int, default = pipeline_max_workers, help = 'number of stages run at the same time')
+    parser.add_argument('--analyse', action = 'store_true', help = 'answer the queries of _02_queries.sql from the cleaned staged tables with DuckDB, without a database, and exit')
+    arguments = parser.parse_args(argv)
+    check_settings()
+
+    if arguments.analyse:
+        from _06_multinational_retail_data_centralisation.embedded_analytics import EmbeddedAnalytics # loads pyarrow and DuckDB, only needed here
+        analytics_connection = EmbeddedAnalytics.connect(cleaned_csv_folder_path, watermark_column = orders_watermark_column)
+        for query_name, query_result in EmbeddedAnalytics.run_workload(analytics_connection, queries_sql_path).items():
+            if 'error' in query_result:
+                print(f"{query_name}\nNot run: {query_result['error']}\n")
+            else:
+                print(f"{query_name} ({query_result['time_ms']:.1f} ms)\n{query_result['result']}\n")
+        analytics_connection.close()
+        return
+
+    pipeline = build_pipeline()
+    if arguments.list:
+        print('\n'.join(pipeline.stages))
+        return
+    if arguments.stages:
+        stage_numbers = {stage_name.split('.')[0]: stage_name for stage_name in pipeline.stages}
+        unknown_numbers = [number for number in arguments.stages if number not in stage_numbers]
+        if unknown_numbers:
+            parser.error(f"unknown stages {unknown_numbers}, choose from {list(stage_numbers)}")
+        pipeline = pipeline.select_stages([stage_numbers[number] for number in arguments.stages])
+
+    try:
+        pipeline.run(max_workers = arguments.workers)
+    finally:
+        pool_stats = api_connector.dispose_engines(engines)  # Close the pooled connections of the engines that were created
+        pipeline_metrics.save(extra = {'connection_pools': pool_stats})
 
+if __name__ == "__main__":
+    main()
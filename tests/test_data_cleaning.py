@@ -0,0 +1,122 @@
+import numpy as np
+import os
+import pandas as pd
+import pytest
+import re
+
+from _06_multinational_retail_data_centralisation.data_cleaning import DataCleaning
+from tests.conftest import cleaned_csv_folder_path, raw_csv_folder_path
+
+
+def read_raw_table(filename: str, **kwargs):
+    return pd.read_csv(os.path.join(raw_csv_folder_path, filename), **kwargs)
+
+
+# Raw table, cleaner, whether the cleaned table is saved with its index, cleaned table of the original cleaners
+# 'NULL' and 'N/A' are values of the RDS and API tables rather than missing values, so only empty fields are read as missing
+baseline_tables = {
+    'legacy_users': (lambda: read_raw_table('legacy_users.csv', index_col=0, keep_default_na=False, na_values=['']),
+                     DataCleaning.clean_user_data, False, 'legacy_users_data_cleaned.csv'),
+    'card_details': (lambda: read_raw_table('card_details.csv'),
+                     DataCleaning.clean_card_data, False, 'card_details_data_cleaned.csv'),
+    'store_details': (lambda: read_raw_table('store_details.csv', keep_default_na=False, na_values=['']),
+                      DataCleaning.called_clean_store_data, False, 'store_details_data_cleaned.csv'),
+    'products_details': (lambda: read_raw_table('products_details.csv', index_col=0),
+                         lambda df, inplace: DataCleaning.convert_product_weights(DataCleaning.clean_products_data(df, inplace), inplace),
+                         True, 'products_details_data_cleaned.csv'),
+}
+
+
+@pytest.mark.parametrize('inplace', [False, True])
+@pytest.mark.parametrize('table_name', list(baseline_tables))
+def test_cleaners_match_baseline_outputs(table_name, inplace):
+    read_raw, clean, index, cleaned_filename = baseline_tables[table_name]
+    cleaned_df = clean(read_raw(), inplace=inplace)
+    with open(os.path.join(cleaned_csv_folder_path, cleaned_filename), 'r', encoding='utf-8') as file:
+        assert cleaned_df.to_csv(index=index) == file.read()
+
+
+def test_cleaners_leave_their_input_unchanged():
+    for read_raw, clean, _, _ in baseline_tables.values():
+        raw_df = read_raw()
+        clean(raw_df, inplace=False)
+        pd.testing.assert_frame_equal(raw_df, read_raw())
+
+
+def convert_weight(value):
+    """
+    The per-value conversion convert_product_weights replaced, applied to one weight.
+    """
+    try:
+        if 'x' in value:
+            numeric_part1, units1, numeric_part2, units2 = re.match(r"([\d.]+)\s*([a-zA-Z]*)\s*x\s*([\d.]+)\s*([a-zA-Z]*)", value).groups()
+            units, result = (units1 or units2).lower(), float(numeric_part1) * float(numeric_part2)
+        else:
+            numeric_part, units = re.match(r"([\d.]+)\s*([a-zA-Z]*)", value).groups()
+            units, result = units.lower(), float(numeric_part)
+        if units in ['g', 'gram', 'grams', 'ml', 'milliliter', 'milliliters']:
+            result /= 1000
+        elif units in ['oz', 'ounce', 'ounces']:
+            result *= 0.0283495
+        elif units not in ['kg', 'kilogram', 'kilograms']:
+            return np.nan
+        return round(result, 3)
+    except Exception:
+        return np.nan
+
+
+def test_convert_product_weights_matches_the_per_value_conversion():
+    weights = read_raw_table('products_details.csv', index_col=0)['weight']
+    weights = pd.concat([weights, pd.Series(['1362.5g', '2 x 0.5kg', '3x 125', '12 x 100g', '5lb', 'x', '.', 7])], ignore_index=True).rename('weight')  # Halves, multipacks, an unknown unit and unreadable values
+    assert weights.str.contains(' x ', regex=False).any()  # Multipacks, with and without units after the first number
+
+    converted = DataCleaning.convert_product_weights(weights.to_frame())['weight_(kg)']
+
+    expected = weights.map(convert_weight).astype(float)
+    mismatches = weights[~((converted == expected) | (converted.isna() & expected.isna()))]
+    assert mismatches.empty, f"Weights converted differently: {mismatches.tolist()}"
+
+
+def test_normalise_dates_parses_each_format():
+    dates = pd.Series(['2001-01-02', '2001/05/06', '1999 June 04', 'January 2001 03', '5 June 2000', 'not a date', None], name='join_date')
+    expected = pd.Series(pd.to_datetime(['2001-01-02', '2001-05-06', '1999-06-04', '2001-01-03', '2000-06-05', None, None]), name='join_date')
+    pd.testing.assert_series_equal(DataCleaning.normalise_dates(dates), expected)
+
+
+def test_normalise_dates_parses_each_fallback_string_once_per_call(monkeypatch):
+    parsed_strings = []
+    parse_date = DataCleaning.parse_date
+    monkeypatch.setattr(DataCleaning, 'parse_date', staticmethod(lambda date_string: parsed_strings.append(date_string) or parse_date(date_string)))
+
+    dates = pd.Series(['5 June 2000', 'not a date'] * 50 + ['2001-01-02'], name='date_added')
+    DataCleaning.normalise_dates(dates)
+    assert sorted(parsed_strings) == ['5 June 2000', 'not a date']
+
+    DataCleaning.normalise_dates(dates)  # Nothing is kept from one call to the next
+    assert len(parsed_strings) == 4
+
+
+def test_normalise_dates_only_reports_when_verbose(capsys):
+    dates = pd.Series(['2001-01-02', '5 June 2000'], name='join_date')
+    DataCleaning.clean_user_data(read_raw_table('legacy_users.csv', index_col=0, keep_default_na=False, na_values=['']))
+    DataCleaning.normalise_dates(dates)
+    assert capsys.readouterr().out == ''
+
+    DataCleaning.normalise_dates(dates, verbose=True)
+    assert capsys.readouterr().out.startswith("Parsed 'join_date': 1 rows by format, 1 by fallback in ")
+
+
+def test_cleaners_report_their_date_columns_when_asked(capsys):
+    users = read_raw_table('legacy_users.csv', index_col=0, keep_default_na=False, na_values=[''])
+    DataCleaning.clean_user_data(users, report_dates=True)
+    assert [line.split(':')[0] for line in capsys.readouterr().out.splitlines()] == ["Parsed 'date_of_birth'", "Parsed 'join_date'"]
+
+    DataCleaning.clean_card_data(read_raw_table('card_details.csv'), report_dates=True)
+    assert capsys.readouterr().out.startswith("Parsed 'date_payment_confirmed': ")
+
+
+def test_rejected_rows_matches_any_of_the_columns():
+    users = pd.DataFrame({'first_name': ['Ann', 'B0b', 'Cy', None], 'last_name': ['Lee', 'Lee', 'NULL', 'Day'], 'country': ['UK', 'UK', 'UK', 'US']},
+                         index=[10, 11, 12, 13])
+    rejected = DataCleaning.rejected_rows(users, ['first_name', 'last_name', 'country'], DataCleaning.user_reject_pattern)
+    pd.testing.assert_series_equal(rejected, pd.Series([False, True, True, False], index=[10, 11, 12, 13]))
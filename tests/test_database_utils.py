@@ -0,0 +1,209 @@
+import pandas as pd
+import pytest
+import threading
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy import inspect
+from sqlalchemy.types import Date, SmallInteger, String, Uuid
+
+from _06_multinational_retail_data_centralisation.database_utils import DatabaseConnector
+
+
+class RecordingConnection:
+    """
+    Stands in for the connection to_sql gives its insertion method, and for its psycopg2 connection and cursor,
+    recording the statement and CSV text given to copy_expert.
+    """
+    def __init__(self):
+        self.connection = self
+        self.copies = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def copy_expert(self, sql, buffer):
+        self.copies.append((sql, buffer.read()))
+
+
+def stores_df(rows):
+    return pd.DataFrame(rows, columns=['store_code', 'locality', 'staff_numbers'])
+
+
+def loaded_stores(engine2):
+    return pd.read_sql_table('dim_store_details', engine2).sort_values('store_code', ignore_index=True)
+
+
+def test_upsert_creates_missing_table(sqlite_engine):
+    first_df = stores_df([['BL-1', 'Bristol', 10], ['LD-2', 'London', 20]])
+    DatabaseConnector.upsert_to_db(first_df, 'dim_store_details', 'store_code', sqlite_engine)
+
+    pd.testing.assert_frame_equal(loaded_stores(sqlite_engine), first_df)
+
+
+def test_upsert_inserts_new_and_updates_changed_rows(sqlite_engine):
+    first_df = stores_df([['BL-1', 'Bristol', 10], ['LD-2', 'London', 20], ['MN-3', 'Manchester', 30]])
+    DatabaseConnector.create_table(first_df, 'dim_store_details', sqlite_engine, primary_key='store_code')
+    DatabaseConnector.upload_to_db(first_df, 'dim_store_details', sqlite_engine, if_exists='append')
+
+    second_df = stores_df([['LD-2', 'London', 25], ['MN-3', 'Manchester', 30], ['YK-4', 'York', 40], ['YK-4', 'York', 45]])
+    DatabaseConnector.upsert_to_db(second_df, 'dim_store_details', 'store_code', sqlite_engine)
+
+    expected_df = stores_df([['BL-1', 'Bristol', 10], ['LD-2', 'London', 25], ['MN-3', 'Manchester', 30], ['YK-4', 'York', 45]])
+    pd.testing.assert_frame_equal(loaded_stores(sqlite_engine), expected_df)  # Rows missing from the new data are kept, the last duplicate wins
+    assert DatabaseConnector.has_primary_key('dim_store_details', sqlite_engine)  # The table was merged into, not recreated
+
+
+def test_upsert_counts_changed_rows(sqlite_engine):
+    products_df = pd.DataFrame({'product_code': ['A1', 'B2'], 'date_added': pd.to_datetime(['2005-12-02', '2006-01-09']),
+                                'uuid': ['83dc0a69-f96f-4c34-bcb7-928acae19a94', '712254d7-aea7-4310-aff8-8bcdd0aec7ff']})
+    column_types = {'date_added': Date(), 'uuid': Uuid(as_uuid=False)}  # Stored as text and CHAR(32) by SQLite
+    DatabaseConnector.create_table(products_df, 'dim_products', sqlite_engine, dtype=column_types, primary_key='product_code')
+    DatabaseConnector.upload_to_db(products_df, 'dim_products', sqlite_engine, if_exists='append', dtype=column_types)
+
+    assert DatabaseConnector.upsert_to_db(products_df, 'dim_products', 'product_code', sqlite_engine, dtype=column_types) == 0
+    products_df.loc[1, 'date_added'] = pd.Timestamp('2007-01-01')
+    assert DatabaseConnector.upsert_to_db(products_df, 'dim_products', 'product_code', sqlite_engine, dtype=column_types) == 1
+
+
+def test_upsert_skips_columns_missing_from_table(sqlite_engine):
+    first_df = stores_df([['BL-1', 'Bristol', 10]])
+    DatabaseConnector.create_table(first_df, 'dim_store_details', sqlite_engine, primary_key='store_code')
+    DatabaseConnector.upload_to_db(first_df, 'dim_store_details', sqlite_engine, if_exists='append')
+
+    DatabaseConnector.upsert_to_db(first_df.assign(country_code='GB'), 'dim_store_details', 'store_code', sqlite_engine)
+
+    pd.testing.assert_frame_equal(loaded_stores(sqlite_engine), first_df)
+
+
+def test_has_primary_key(sqlite_engine):
+    stores = stores_df([['BL-1', 'Bristol', 10]])
+    assert not DatabaseConnector.has_primary_key('dim_store_details', sqlite_engine)
+
+    DatabaseConnector.upload_to_db(stores, 'dim_store_details', sqlite_engine)
+    assert not DatabaseConnector.has_primary_key('dim_store_details', sqlite_engine)
+
+    DatabaseConnector.create_table(stores, 'dim_store_details', sqlite_engine, primary_key='store_code')
+    assert DatabaseConnector.has_primary_key('dim_store_details', sqlite_engine)
+
+
+def test_pool_stats_count_waits_and_timeouts(tmp_path):
+    engine2 = DatabaseConnector.create_pooled_engine(f"sqlite:///{tmp_path / 'sales_data.db'}", pool_size=1, max_overflow=0, pool_timeout=0.5)
+    with engine2.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine2.connect()  # The only connection is checked out
+
+    connection = engine2.connect()
+    release = threading.Timer(0.2, connection.close)
+    release.start()
+    with engine2.connect():  # Waits for the connection to be returned
+        pass
+    release.join()
+
+    pool_stats = DatabaseConnector.dispose_engines({'engine2': engine2})['engine2']
+    assert pool_stats['checkouts'] == pool_stats['checkins'] == 3
+    assert pool_stats['timeouts'] == 1
+    assert pool_stats['max_checked_out'] == 1
+    assert pool_stats['checked_out'] == 0
+    assert 0.15 < pool_stats['max_wait_time'] <= pool_stats['total_wait_time']
+
+
+def test_copy_from_stdin_writes_null_apart_from_empty_strings(sqlite_engine):
+    recording_connection = RecordingConnection()
+    stores = pd.DataFrame({'store_code': ['BL-1', 'LD-2', 'MN-3'], 'locality': ['', None, 'Manchester'],
+                           'staff_numbers': pd.array([10, None, 30], dtype='Int16'), 'latitude': [51.5, float('nan'), 53.5]})
+
+    stores.to_sql('dim_store_details', sqlite_engine, index=False,
+                  method=lambda table, conn, keys, data_iter: DatabaseConnector.copy_from_stdin(table, recording_connection, keys, data_iter))
+
+    [(sql, csv_text)] = recording_connection.copies
+    assert sql == """COPY "dim_store_details" ("store_code", "locality", "staff_numbers", "latitude") FROM STDIN WITH (FORMAT csv, NULL '\\N')"""
+    assert csv_text.splitlines() == ['BL-1,,10,51.5', 'LD-2,\\N,\\N,\\N', 'MN-3,Manchester,30,53.5']
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize('bulk', [True, False])
+def test_upload_to_db_keeps_null_apart_from_empty_strings(postgres_engine, bulk):
+    stores = pd.DataFrame({'store_code': ['BL-1', 'LD-2', 'MN-3'], 'locality': ['', None, 'Manchester'], 'staff_numbers': [10, None, 30]})
+
+    DatabaseConnector.upload_to_db(stores, 'test_copy_null', postgres_engine, bulk=bulk)
+    try:
+        loaded_df = pd.read_sql_query('SELECT * FROM test_copy_null ORDER BY store_code', postgres_engine)
+    finally:
+        with postgres_engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE test_copy_null')
+
+    assert loaded_df['locality'].tolist() == ['', None, 'Manchester']
+    assert loaded_df['staff_numbers'].isna().tolist() == [False, True, False]
+
+
+def test_create_table_with_keys_and_planned_types(sqlite_engine):
+    stores = stores_df([['BL-1', 'Bristol', 10]])
+    DatabaseConnector.create_table(stores, 'dim_store_details', sqlite_engine, dtype={'store_code': String(255), 'staff_numbers': SmallInteger()},
+                                   primary_key='store_code')
+    orders = pd.DataFrame({'index': [0], 'store_code': ['BL-1'], 'product_quantity': [3]})
+    DatabaseConnector.create_table(orders, 'orders_table', sqlite_engine, foreign_keys={'fk_orders_store': ('store_code', 'dim_store_details')})
+
+    inspector = inspect(sqlite_engine)
+    column_types = {column['name']: str(column['type']) for column in inspector.get_columns('dim_store_details')}
+    assert column_types == {'store_code': 'VARCHAR(255)', 'locality': 'TEXT', 'staff_numbers': 'SMALLINT'}  # Unplanned columns as to_sql types them
+    assert inspector.get_pk_constraint('dim_store_details')['constrained_columns'] == ['store_code']
+    [foreign_key] = inspector.get_foreign_keys('orders_table')
+    assert (foreign_key['name'], foreign_key['constrained_columns'], foreign_key['referred_table']) == ('fk_orders_store', ['store_code'], 'dim_store_details')
+    assert pd.read_sql_table('orders_table', sqlite_engine).empty  # Created without rows
+
+
+def test_create_table_keeps_or_replaces_an_existing_table(sqlite_engine):
+    stores = stores_df([['BL-1', 'Bristol', 10]])
+    DatabaseConnector.create_table(stores, 'dim_store_details', sqlite_engine, primary_key='store_code')
+    DatabaseConnector.upload_to_db(stores, 'dim_store_details', sqlite_engine, if_exists='append')
+
+    DatabaseConnector.create_table(stores, 'dim_store_details', sqlite_engine, if_exists='append')
+    pd.testing.assert_frame_equal(loaded_stores(sqlite_engine), stores)  # Kept with its rows and key
+    assert DatabaseConnector.has_primary_key('dim_store_details', sqlite_engine)
+
+    DatabaseConnector.create_table(stores, 'dim_store_details', sqlite_engine)
+    assert loaded_stores(sqlite_engine).empty
+    assert not DatabaseConnector.has_primary_key('dim_store_details', sqlite_engine)
+
+
+def test_replacing_a_referenced_table_keeps_the_foreign_keys_on_sqlite(sqlite_engine):
+    stores = stores_df([['BL-1', 'Bristol', 10]])
+    DatabaseConnector.create_table(stores, 'dim_store_details', sqlite_engine, primary_key='store_code')
+    orders = pd.DataFrame({'index': [0], 'store_code': ['BL-1']})
+    DatabaseConnector.create_table(orders, 'orders_table', sqlite_engine, foreign_keys={'fk_orders_store': ('store_code', 'dim_store_details')})
+
+    DatabaseConnector.create_table(stores, 'dim_store_details', sqlite_engine, primary_key='store_code')
+
+    assert [foreign_key['name'] for foreign_key in inspect(sqlite_engine).get_foreign_keys('orders_table')] == ['fk_orders_store']
+    assert DatabaseConnector.add_foreign_keys('orders_table', {'fk_orders_store': ('store_code', 'dim_store_details')}, sqlite_engine) == []
+
+
+@pytest.mark.postgres
+def test_dimension_is_reloaded_after_orders_table_exists(postgres_engine):
+    foreign_keys = {'fk_orders_store': ('store_code', 'dim_store_details')}
+    stores = stores_df([['BL-1', 'Bristol', 10], ['WEB-1', 'N/A', 5]])
+    orders = pd.DataFrame({'index': [0, 1], 'store_code': ['BL-1', 'WEB-1']})
+    try:
+        DatabaseConnector.create_table(stores, 'dim_store_details', postgres_engine, primary_key='store_code')
+        DatabaseConnector.upload_to_db(stores, 'dim_store_details', postgres_engine, if_exists='append')
+        DatabaseConnector.create_table(orders, 'orders_table', postgres_engine, foreign_keys=foreign_keys)
+        DatabaseConnector.upload_to_db(orders, 'orders_table', postgres_engine, if_exists='append')
+
+        DatabaseConnector.create_table(stores, 'dim_store_details', postgres_engine, primary_key='store_code')  # Referenced by orders_table
+        assert inspect(postgres_engine).get_foreign_keys('orders_table') == []
+        DatabaseConnector.upload_to_db(stores, 'dim_store_details', postgres_engine, if_exists='append')
+        assert DatabaseConnector.add_foreign_keys('orders_table', foreign_keys, postgres_engine) == ['fk_orders_store']
+        assert DatabaseConnector.add_foreign_keys('orders_table', foreign_keys, postgres_engine) == []
+
+        [foreign_key] = inspect(postgres_engine).get_foreign_keys('orders_table')
+        assert (foreign_key['name'], foreign_key['referred_table']) == ('fk_orders_store', 'dim_store_details')
+        pd.testing.assert_frame_equal(loaded_stores(postgres_engine), stores)
+    finally:
+        with postgres_engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE IF EXISTS orders_table, dim_store_details')
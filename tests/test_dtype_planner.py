@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+from sqlalchemy.types import SmallInteger, String, Uuid
+
+from _06_multinational_retail_data_centralisation.dtype_planner import DtypePlanner
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.mark.parametrize('values, expected_dtype', [
+    (['GB', 'DE', 'GB', 'US', 'GB', 'DE'], 'category'),  # 3 distinct values in 6, below the threshold
+    (['GB', 'DE', 'US', 'FR', 'GB', 'IT'], 'string'),  # 5 distinct values in 6
+    ([], 'string'),
+])
+def test_plan_column_makes_categoricals_below_the_threshold(values, expected_dtype):
+    planned_column = DtypePlanner.plan_column(pd.Series(values, dtype=object, name='country_code'), 'varchar', category_threshold=0.6)
+
+    assert planned_column.dtype == expected_dtype
+    assert planned_column.astype(object).tolist() == values
+
+
+def test_plan_column_keeps_categoricals_and_turns_numbers_into_text():
+    categories = pd.Series(['a', 'b', 'c'], dtype='category')
+    assert DtypePlanner.plan_column(categories, 'varchar') is categories
+
+    card_numbers = DtypePlanner.plan_column(pd.Series([4252720361802860, 30060773296197]), 'varchar')
+    assert card_numbers.tolist() == ['4252720361802860', '30060773296197']
+
+
+def test_plan_column_converts_counts_to_int16():
+    staff_numbers = DtypePlanner.plan_column(pd.Series(['34', 'N/A', None, '-32768', 32767.0]), 'smallint')
+
+    assert staff_numbers.dtype == 'Int16'
+    assert staff_numbers.tolist() == [34, pd.NA, pd.NA, -32768, 32767]
+
+
+@pytest.mark.parametrize('value', [32768, -32769, 2.5])
+def test_plan_column_rejects_values_that_are_not_smallint(value):
+    with pytest.raises(ValueError, match="'staff_numbers' holds values that are not smallint"):
+        DtypePlanner.plan_column(pd.Series([1, value], name='staff_numbers'), 'smallint')
+
+
+def test_plan_column_rejects_unknown_types():
+    with pytest.raises(ValueError, match="Unknown column type 'money'"):
+        DtypePlanner.plan_column(pd.Series([1.5]), 'money')
+
+
+def test_plan_table_converts_star_schema_columns_only():
+    stores_df = pd.DataFrame({'store_code': ['BL-1', 'LD-2'], 'staff_numbers': [10, 20], 'address': ['1 High St', '2 Low Rd'],
+                              'opening_date': ['2010-01-05', 'not a date']})
+
+    planned_df, column_types = DtypePlanner.plan_table(stores_df, 'dim_store_details')
+
+    assert stores_df['staff_numbers'].dtype == 'int64'  # The cleaned table is not changed
+    pd.testing.assert_series_equal(planned_df['address'], stores_df['address'])  # Not part of the star-schema
+    assert planned_df.dtypes.astype(str).to_dict() == {'store_code': 'string', 'staff_numbers': 'Int16', 'address': 'object',
+                                                       'opening_date': 'datetime64[ns]'}
+    assert planned_df['opening_date'].isna().tolist() == [False, True]
+    assert set(column_types) == {'store_code', 'staff_numbers', 'opening_date'}
+    assert isinstance(column_types['store_code'], String) and isinstance(column_types['staff_numbers'], SmallInteger)
+    assert isinstance(DtypePlanner.plan_table(pd.DataFrame({'user_uuid': ['x']}), 'dim_users')[1]['user_uuid'], Uuid)
@@ -0,0 +1,135 @@
+import pandas as pd
+import pytest
+
+from _06_multinational_retail_data_centralisation.data_cleaning import DataCleaning
+from _06_multinational_retail_data_centralisation.dtype_planner import DtypePlanner
+from _06_multinational_retail_data_centralisation.synthetic_data import SyntheticDataGenerator
+from _06_multinational_retail_data_centralisation.table_staging import TableStaging
+from tests.conftest import raw_csv_folder_path, repo_root
+
+pytest.importorskip('duckdb')
+from _06_multinational_retail_data_centralisation.embedded_analytics import EmbeddedAnalytics
+
+queries_sql_path = f"{repo_root}/_05_SQL/_02_queries.sql"
+
+
+@pytest.fixture(scope='module')
+def cleaned_tables():
+    """
+    Cleaned products, stores, date events and 3000 orders, with one date event per order as in the real tables.
+    """
+    generator = SyntheticDataGenerator(raw_csv_folder_path=raw_csv_folder_path)
+    orders_df = generator.orders_table(3000)
+    date_details_df = generator.date_details(3000)
+    date_details_df['date_uuid'] = orders_df['date_uuid'].to_numpy()
+    return {'products_details_data_cleaned': DataCleaning.convert_product_weights(DataCleaning.clean_products_data(
+                generator.read_raw_table('products_details', index_col=0))),
+            'store_details_data_cleaned': DataCleaning.called_clean_store_data(generator.read_raw_table('store_details')),
+            'date_details_data_cleaned': DataCleaning.clean_date_data(date_details_df),
+            'orders_table_data_cleaned': DataCleaning.clean_orders_data(orders_df)}
+
+
+def stage_tables(folder_path, cleaned_tables, staging_format, orders_deltas=()):
+    """
+    Stages the cleaned tables as main.py does, keeping the first 1000 orders in the full orders table and staging the orders
+    between each pair of orders_deltas boundaries as an incremental load.
+    """
+    orders_df = cleaned_tables['orders_table_data_cleaned']
+    full_orders_end = orders_deltas[0] if orders_deltas else len(orders_df)
+    for staged_name, cleaned_df in cleaned_tables.items():
+        TableStaging.save_table(cleaned_df.iloc[:full_orders_end] if staged_name == 'orders_table_data_cleaned' else cleaned_df,
+                                str(folder_path), staged_name, staging_format)
+    for first_row, last_row in zip(orders_deltas, list(orders_deltas[1:]) + [len(orders_df)]):
+        high_water_mark = orders_df['index'].iloc[first_row - 1]
+        TableStaging.save_table(orders_df.iloc[first_row:last_row], str(folder_path), f"orders_table_delta_{high_water_mark}_data_cleaned",
+                                staging_format)
+
+
+def expected_answers(cleaned_tables):
+    """
+    The answers of Tasks 1, 3 and 4 computed with pandas over the star-schema tables.
+    """
+    stores_df = DataCleaning.match_star_schema(cleaned_tables['store_details_data_cleaned'], 'dim_store_details')
+    products_df = DataCleaning.match_star_schema(cleaned_tables['products_details_data_cleaned'], 'dim_products')
+    orders_df = cleaned_tables['orders_table_data_cleaned']
+    dates_df = cleaned_tables['date_details_data_cleaned']
+
+    shops_df = stores_df[stores_df['store_type'] != 'Web Portal']
+    task_1 = shops_df.groupby('country_code').size().rename('total_no_stores').rename_axis('country').reset_index()
+
+    sales_df = orders_df.merge(products_df, on='product_code').merge(dates_df, on='date_uuid')
+    sales_df['sales'] = sales_df['product_quantity'] * sales_df['product_price_(gbp)']
+    task_3 = sales_df.groupby('month')['sales'].sum().round(2).rename('total_sales').reset_index()
+
+    store_orders_df = orders_df.merge(stores_df, on='store_code')
+    store_orders_df['location'] = store_orders_df['store_type'].map(lambda store_type: 'Web' if store_type == 'Web Portal' else 'Offline')
+    task_4 = store_orders_df.groupby('location').agg(number_of_sales=('store_type', 'size'),
+                                                     product_quantity_count=('product_quantity', 'sum')).reset_index()
+    return {'Task 1': task_1, 'Task 3': task_3, 'Task 4': task_4}
+
+
+def assert_answers_match(results, expected):
+    for query_name, expected_df in expected.items():
+        query_name = next(name for name in results if name.startswith(f"{query_name}."))
+        result_df = results[query_name]['result'][expected_df.columns]
+        if query_name.startswith('Task 3'):  # Only the six best months are kept
+            expected_df = expected_df.nlargest(6, 'total_sales')
+        sort_columns = list(expected_df.columns)
+        pd.testing.assert_frame_equal(result_df.astype(float, errors='ignore').sort_values(sort_columns, ignore_index=True),
+                                      expected_df.astype(float, errors='ignore').sort_values(sort_columns, ignore_index=True),
+                                      check_dtype=False)
+
+
+@pytest.mark.parametrize('staging_format', ['parquet', 'feather', 'csv'])
+def test_workload_matches_pandas(tmp_path, cleaned_tables, staging_format):
+    stage_tables(tmp_path, cleaned_tables, staging_format)
+
+    results = EmbeddedAnalytics.run_workload(EmbeddedAnalytics.connect(str(tmp_path), threads=2), queries_sql_path)
+
+    assert len(results) == 10
+    assert_answers_match(results, expected_answers(cleaned_tables))
+    assert 'error' in results[next(name for name in results if name.startswith('Task 9'))]  # PostgreSQL's to_timestamp with a format
+
+
+@pytest.mark.parametrize('staging_format', ['parquet', 'feather', 'csv'])
+def test_incremental_loads_are_added_to_the_orders(tmp_path, cleaned_tables, staging_format, capsys):
+    stage_tables(tmp_path, cleaned_tables, staging_format, orders_deltas=(1000, 1800, 2500))
+
+    connection = EmbeddedAnalytics.connect(str(tmp_path), threads=2)
+
+    assert connection.execute('SELECT count(*) FROM orders_table').fetchone()[0] == 3000
+    assert 'Warning' not in capsys.readouterr().out
+    assert_answers_match(EmbeddedAnalytics.run_workload(connection, queries_sql_path), expected_answers(cleaned_tables))
+
+
+def test_full_load_after_incremental_loads_is_not_counted_twice(tmp_path, cleaned_tables):
+    stage_tables(tmp_path, cleaned_tables, 'parquet', orders_deltas=(1000, 2000))
+    TableStaging.save_table(cleaned_tables['orders_table_data_cleaned'], str(tmp_path), 'orders_table_data_cleaned', 'parquet')  # Reloaded whole
+
+    connection = EmbeddedAnalytics.connect(str(tmp_path), threads=2)
+
+    assert connection.execute('SELECT count(*) FROM orders_table').fetchone()[0] == 3000
+
+
+def test_missing_incremental_load_is_reported(tmp_path, cleaned_tables, capsys):
+    stage_tables(tmp_path, cleaned_tables, 'parquet', orders_deltas=(1000, 1800, 2500))
+    orders_df = cleaned_tables['orders_table_data_cleaned']
+    lost_delta = f"orders_table_delta_{orders_df['index'].iloc[999]}_data_cleaned"
+    (tmp_path / f"{lost_delta}.parquet").unlink()
+
+    connection = EmbeddedAnalytics.connect(str(tmp_path), threads=2)
+
+    assert f"the staged orders end at {orders_df['index'].iloc[999]}" in capsys.readouterr().out
+    assert connection.execute('SELECT count(*) FROM orders_table').fetchone()[0] == 3000 - 800
+
+
+def test_scan_sql_applies_the_star_schema_types(tmp_path, cleaned_tables):
+    import duckdb
+    staged_filename = TableStaging.save_table(cleaned_tables['orders_table_data_cleaned'], str(tmp_path), 'orders_table_data_cleaned', 'csv')
+    connection = duckdb.connect()
+
+    described_columns = connection.execute(f"DESCRIBE {EmbeddedAnalytics.scan_sql(connection, staged_filename, 'orders_table')}").fetchall()
+    column_types = {row[0]: row[1] for row in described_columns}
+
+    for column_name, column_type in DtypePlanner.table_schemas['orders_table'].items():
+        assert column_types[column_name] == EmbeddedAnalytics.duckdb_types[column_type]
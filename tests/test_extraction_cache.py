@@ -0,0 +1,162 @@
+import os
+import pandas as pd
+import pytest
+import time
+
+from _06_multinational_retail_data_centralisation.data_extraction import DataExtractor
+from _06_multinational_retail_data_centralisation.extraction_cache import ExtractionCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExtractionCache(cache_folder_path=str(tmp_path / 'cache'), max_size_bytes=10 * 1024 ** 2)
+
+
+def counting_extractor(df):
+    calls = []
+    def extract_data():
+        calls.append(1)
+        return df.copy()
+    return extract_data, calls
+
+
+def test_fetch_extracts_on_a_miss_and_reads_the_cache_on_a_hit(cache):
+    df = pd.DataFrame({'store_code': ['WEB-1388012W', 'BL-8387506C'], 'staff_numbers': [325, 34]})
+    extract_data, calls = counting_extractor(df)
+
+    pd.testing.assert_frame_equal(cache.fetch('stores', {'ETag': '"1"'}, extract_data), df)
+    pd.testing.assert_frame_equal(cache.fetch('stores', {'ETag': '"1"'}, extract_data), df)
+    assert len(calls) == 1
+
+    cache.fetch('stores', {'ETag': '"2"'}, extract_data)  # A new version of the source is extracted again
+    assert len(calls) == 2
+
+
+def test_fetch_without_a_fingerprint_always_extracts(cache):
+    extract_data, calls = counting_extractor(pd.DataFrame({'a': [1]}))
+    cache.fetch('source', None, extract_data)
+    cache.fetch('source', None, extract_data)
+    assert len(calls) == 2
+    assert cache.index == {}
+
+
+def test_entries_older_than_their_max_age_are_extracted_again(cache, monkeypatch):
+    extract_data, calls = counting_extractor(pd.DataFrame({'a': [1]}))
+    now = 1000.0
+    monkeypatch.setattr('time.time', lambda: now)
+    cache.fetch('api', {'number_of_stores': 451}, extract_data, max_age_seconds=60)
+
+    now += 30
+    cache.fetch('api', {'number_of_stores': 451}, extract_data, max_age_seconds=60)
+    assert len(calls) == 1
+
+    now += 60
+    cache.fetch('api', {'number_of_stores': 451}, extract_data, max_age_seconds=60)
+    assert len(calls) == 2
+
+
+def test_the_index_survives_a_new_cache_instance(cache):
+    df = pd.DataFrame({'a': range(5)})
+    cache.put('table', {'sha256': 'abc'}, df)
+    pd.testing.assert_frame_equal(ExtractionCache(cache.cache_folder_path).get('table', {'sha256': 'abc'}), df)
+
+
+def test_an_interrupted_stream_is_not_cached(cache):
+    def chunks():
+        yield pd.DataFrame({'a': [1, 2]})
+        raise ConnectionError("Connection lost")
+
+    with pytest.raises(ConnectionError):
+        for _ in cache.put_chunks('table', {'sha256': 'abc'}, chunks()):
+            pass
+    assert cache.get_chunks('table', {'sha256': 'abc'}) is None
+
+
+def test_least_recently_used_entries_are_evicted(cache, monkeypatch):
+    df = pd.DataFrame({'a': range(1000)})
+    now = 1000.0
+    monkeypatch.setattr('time.time', lambda: now)
+    for source in ['first', 'second']:
+        now += 1
+        cache.put(source, {'v': 1}, df)
+    now += 1
+    cache.get('first', {'v': 1})  # 'second' is now the least recently used
+
+    cache.max_size_bytes = cache.index[ExtractionCache.make_key('first', {'v': 1})]['size'] * 2
+    now += 1
+    cache.put('third', {'v': 1}, df)
+    assert cache.get('second', {'v': 1}) is None
+    assert cache.get('first', {'v': 1}) is not None
+
+
+def test_chunks_being_read_survive_eviction_and_replacement(cache):
+    table_chunks = [pd.DataFrame({'a': range(first_row, first_row + 100)}) for first_row in range(0, 300, 100)]
+    for _ in cache.put_chunks('orders', {'v': 1}, table_chunks):
+        pass
+    entry_folder_path = cache.entry_folder_path(ExtractionCache.make_key('orders', {'v': 1}), cache.index[ExtractionCache.make_key('orders', {'v': 1})])
+
+    cached_chunks = cache.get_chunks('orders', {'v': 1})
+    pd.testing.assert_frame_equal(next(cached_chunks), table_chunks[0])
+    cache.put('orders', {'v': 1}, pd.DataFrame({'a': [-1]}))  # Replaced by another stage...
+    cache.max_size_bytes = 0
+    cache.evict()  # ...then evicted
+    assert cache.index == {}
+
+    pd.testing.assert_frame_equal(pd.concat(cached_chunks), pd.concat(table_chunks[1:]))
+    assert not os.path.exists(entry_folder_path)  # Deleted once read
+    assert cache.readers == {} and cache.removed_folders == set()
+
+
+def test_closing_unread_chunks_unpins_the_entry(cache):
+    cache.put('orders', {'v': 1}, pd.DataFrame({'a': [1]}))
+    key = ExtractionCache.make_key('orders', {'v': 1})
+    entry_folder_path = cache.entry_folder_path(key, cache.index[key])
+
+    cached_chunks = cache.get_chunks('orders', {'v': 1})
+    with cache.lock:
+        cache.remove_entry(key)
+    assert os.path.exists(entry_folder_path)
+    cached_chunks.close()
+    assert not os.path.exists(entry_folder_path)
+
+
+def test_folders_not_in_the_index_are_removed(cache):
+    cache.put('orders', {'v': 1}, pd.DataFrame({'a': [1]}))
+    os.makedirs(os.path.join(cache.cache_folder_path, 'interrupted'))
+
+    reopened_cache = ExtractionCache(cache.cache_folder_path)
+    assert sorted(os.listdir(cache.cache_folder_path)) == sorted(['index.json', cache.index[ExtractionCache.make_key('orders', {'v': 1})]['folder']])
+    pd.testing.assert_frame_equal(reopened_cache.get('orders', {'v': 1}), pd.DataFrame({'a': [1]}))
+
+
+def test_rds_tables_are_not_cached_without_table_statistics(cache, sqlite_engine):
+    pd.DataFrame({'index': [0, 1], 'first_name': ['Sigfried', 'Guy']}).to_sql('legacy_users', sqlite_engine, index=False)
+    assert DataExtractor.rds_table_fingerprint('legacy_users', sqlite_engine) is None
+
+    DataExtractor.read_rds_table('legacy_users', sqlite_engine, cache=cache)
+    list(DataExtractor.read_rds_table('legacy_users', sqlite_engine, chunksize=1, cache=cache))
+    assert cache.index == {}
+
+
+@pytest.mark.postgres
+def test_rds_table_fingerprint_changes_with_every_write(postgres_engine):
+    def changed_fingerprint(previous_fingerprint):
+        for _ in range(50):  # The statistics are flushed about once a second
+            fingerprint = DataExtractor.rds_table_fingerprint('test_legacy_users', postgres_engine, 'index')
+            if fingerprint != previous_fingerprint:
+                return fingerprint
+            time.sleep(0.1)
+        raise AssertionError('The fingerprint did not change')
+
+    pd.DataFrame({'index': [0, 1], 'first_name': ['Sigfried', 'Guy']}).to_sql('test_legacy_users', postgres_engine, index=False, if_exists='replace')
+    try:
+        fingerprint = changed_fingerprint(None)
+        assert fingerprint['high_water_mark'] == 1
+        for statement in ["INSERT INTO test_legacy_users VALUES (2, 'Ada')", """UPDATE test_legacy_users SET first_name = 'Guido' WHERE "index" = 1""",
+                          """DELETE FROM test_legacy_users WHERE "index" = 0""", "TRUNCATE test_legacy_users"]:
+            with postgres_engine.begin() as connection:
+                connection.exec_driver_sql(statement)
+            fingerprint = changed_fingerprint(fingerprint)
+    finally:
+        with postgres_engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE test_legacy_users')
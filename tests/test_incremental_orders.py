@@ -0,0 +1,40 @@
+import os
+import pandas as pd
+import pytest
+
+import main
+from _06_multinational_retail_data_centralisation.database_utils import DatabaseConnector
+from _06_multinational_retail_data_centralisation.table_staging import TableStaging
+
+
+def loaded_orders(engine2):
+    return pd.read_sql_table('orders_table', engine2).sort_values('index', ignore_index=True)
+
+
+@pytest.mark.parametrize('rds_chunksize', [None, 40])
+def test_incremental_orders_load_twice(orders_pipeline, sqlite_engine, monkeypatch, rds_chunksize):
+    monkeypatch.setattr(main, 'rds_chunksize', rds_chunksize)
+
+    main.five_etl_orders_details()  # Full load: 'orders_table' is not in sales_data yet
+    assert DatabaseConnector.read_high_water_mark('orders_table', 'index', sqlite_engine) == 99
+
+    orders_pipeline(100, 250)
+    main.five_etl_orders_details()  # First incremental load
+    assert DatabaseConnector.read_high_water_mark('orders_table', 'index', sqlite_engine) == 249
+
+    orders_pipeline(250, 300)
+    main.five_etl_orders_details()  # Second incremental load
+    orders_df = loaded_orders(sqlite_engine)
+    assert orders_df['index'].tolist() == list(range(300))
+    assert not {'first_name', 'last_name', '1'} & set(orders_df.columns)
+
+    main.five_etl_orders_details()  # Nothing new
+    assert len(loaded_orders(sqlite_engine)) == 300
+    for delta_table in ['orders_table_delta_99_data_cleaned', 'orders_table_delta_249_data_cleaned']:  # Each incremental load is kept
+        assert os.path.exists(TableStaging.table_path(main.cleaned_csv_folder_path, delta_table, main.staging_format))
+
+
+def test_read_high_water_mark_of_a_missing_or_empty_table(sqlite_engine):
+    assert DatabaseConnector.read_high_water_mark('orders_table', 'index', sqlite_engine) is None
+    pd.DataFrame({'index': pd.Series([], dtype='int64')}).to_sql('orders_table', sqlite_engine, index=False)
+    assert DatabaseConnector.read_high_water_mark('orders_table', 'index', sqlite_engine) is None
@@ -0,0 +1,116 @@
+import pytest
+from sqlalchemy import event, inspect
+
+from _06_multinational_retail_data_centralisation.index_advisor import IndexAdvisor
+from tests.conftest import repo_root
+
+queries_sql_path = f"{repo_root}/_05_SQL/_02_queries.sql"
+
+star_schema_ddl = [
+    'CREATE TABLE dim_products (product_code VARCHAR(255) PRIMARY KEY, "product_price_(gbp)" FLOAT)',
+    'CREATE TABLE dim_store_details (store_code VARCHAR(255) PRIMARY KEY, store_type VARCHAR(255), country_code VARCHAR(255),'
+    ' locality VARCHAR(255), staff_numbers SMALLINT)',
+    'CREATE TABLE dim_date_times (date_uuid VARCHAR(255) PRIMARY KEY, year VARCHAR(255), month VARCHAR(255), day VARCHAR(255),'
+    ' timestamp VARCHAR(255))',
+    'CREATE TABLE orders_table ("index" BIGINT, date_uuid VARCHAR(255), user_uuid VARCHAR(255), card_number VARCHAR(255),'
+    ' store_code VARCHAR(255), product_code VARCHAR(255), product_quantity SMALLINT)',
+]
+
+star_schema_rows = [
+    "INSERT INTO dim_products VALUES ('p1', 1.5), ('p2', 10.0)",
+    "INSERT INTO dim_store_details VALUES ('s1', 'Local', 'DE', 'Berlin', 10), ('s2', 'Web Portal', 'GB', 'N/A', 5)",
+    "INSERT INTO dim_date_times VALUES ('d1', '2022', '1', '3', '10:00:00'), ('d2', '2022', '2', '4', '11:00:00')",
+    "INSERT INTO orders_table VALUES (0, 'd1', 'u1', '4971858637664481', 's1', 'p1', 2), (1, 'd2', 'u2', '30060773296197', 's2', 'p2', 1)",
+]
+
+
+def create_star_schema(engine2):
+    with engine2.begin() as connection:
+        for statement in star_schema_ddl + star_schema_rows:
+            connection.exec_driver_sql(statement)
+
+
+def test_missing_indexes_are_built_once(sqlite_engine):
+    create_star_schema(sqlite_engine)
+
+    missing = IndexAdvisor.missing_indexes(sqlite_engine)
+
+    assert [(table_name, key_columns) for table_name, key_columns, _ in missing] == [
+        ('orders_table', ['date_uuid']), ('orders_table', ['user_uuid']), ('orders_table', ['store_code']),
+        ('orders_table', ['product_code']), ('orders_table', ['card_number']), ('orders_table', ['index']),
+        ('dim_store_details', ['country_code', 'store_type']), ('dim_date_times', ['year', 'month'])]  # dim_products has its key
+    build_times = IndexAdvisor.build_indexes(sqlite_engine, max_workers=2)
+    assert set(build_times) == {IndexAdvisor.index_name(table_name, key_columns) for table_name, key_columns, _ in missing}
+    assert 'ix_orders_table_date_uuid' in {index_info['name'] for index_info in inspect(sqlite_engine).get_indexes('orders_table')}
+
+    assert IndexAdvisor.missing_indexes(sqlite_engine) == []
+    assert IndexAdvisor.build_indexes(sqlite_engine) == {}
+
+
+def test_existing_indexes_with_the_same_keys_are_kept(sqlite_engine):
+    create_star_schema(sqlite_engine)
+    with sqlite_engine.begin() as connection:
+        connection.exec_driver_sql('CREATE INDEX orders_by_store ON orders_table (store_code)')
+        connection.exec_driver_sql('CREATE INDEX dates_by_month ON dim_date_times (month, year)')  # Other key order: still missing
+
+    missing_keys = [(table_name, key_columns) for table_name, key_columns, _ in IndexAdvisor.missing_indexes(sqlite_engine)]
+
+    assert ('orders_table', ['store_code']) not in missing_keys
+    assert ('dim_products', ['product_code']) not in missing_keys  # The primary key
+    assert ('dim_date_times', ['year', 'month']) in missing_keys
+
+
+def test_missing_tables_and_columns_are_skipped(sqlite_engine):
+    with sqlite_engine.begin() as connection:
+        connection.exec_driver_sql('CREATE TABLE dim_products (product_code VARCHAR(255))')  # Without the included price
+
+    assert IndexAdvisor.missing_indexes(sqlite_engine) == []
+
+
+def test_read_workload_names_the_tasks():
+    workload = IndexAdvisor.read_workload(queries_sql_path)
+
+    assert [query_name.split('.')[0].split(':')[0] for query_name in workload] == [
+        'Task 1', 'Task 2', 'Task 3', 'Task 4', 'Task 5', 'Task 6b', 'Task 6a', 'Task 7', 'Task 8', 'Task 9']
+    assert all(query.upper().startswith(('SELECT', 'WITH')) and '--' not in query.splitlines()[0] for query in workload.values())
+
+
+def test_explain_workload_reports_errors_per_query(sqlite_engine):
+    create_star_schema(sqlite_engine)
+    built_indexes = set(IndexAdvisor.build_indexes(sqlite_engine))
+    workload = {**IndexAdvisor.read_workload(queries_sql_path), 'Missing table': 'SELECT * FROM dim_users'}
+
+    explained = IndexAdvisor.explain_workload(workload, sqlite_engine)
+
+    assert set(explained) == set(workload)
+    errors = {query_name.split('.')[0].split(':')[0] for query_name, result in explained.items() if 'error' in result}
+    assert errors == {'Task 3', 'Task 5', 'Task 6b', 'Task 6a', 'Task 8', 'Task 9', 'Missing table'}  # PostgreSQL's ::numeric cast
+    for query_name, result in explained.items():
+        if 'error' not in result:
+            assert result['time_ms'] >= 0 and set(result['indexes']) <= built_indexes | {'sqlite_autoindex_dim_store_details_1'}
+
+
+@pytest.mark.postgres
+def test_postgres_indexes_are_covering_and_built_concurrently(postgres_engine):
+    with postgres_engine.begin() as connection:
+        connection.exec_driver_sql('DROP TABLE IF EXISTS orders_table, dim_products, dim_store_details, dim_date_times')
+    create_star_schema(postgres_engine)
+    statements = []
+    event.listen(postgres_engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    try:
+        IndexAdvisor.build_indexes(postgres_engine)
+        with postgres_engine.connect() as connection:
+            index_definitions = dict(connection.exec_driver_sql(
+                "SELECT indexname, indexdef FROM pg_indexes WHERE starts_with(indexname, 'ix_')").fetchall())
+        explained = IndexAdvisor.explain_workload(IndexAdvisor.read_workload(queries_sql_path), postgres_engine)
+    finally:
+        with postgres_engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE IF EXISTS orders_table, dim_products, dim_store_details, dim_date_times')
+
+    assert any(statement.startswith('CREATE INDEX CONCURRENTLY') for statement in statements)
+    assert 'INCLUDE ("product_price_(gbp)")' in index_definitions['ix_dim_products_product_code']  # Not suppressed by the primary key
+    assert 'INCLUDE (product_quantity)' in index_definitions['ix_orders_table_product_code']
+    assert any(statement.startswith('ANALYZE') for statement in statements)
+    task_3 = next(result for query_name, result in explained.items() if query_name.startswith('Task 3'))
+    assert task_3['time_ms'] > 0 and isinstance(task_3['indexes'], list)  # Parsed from EXPLAIN (ANALYZE, FORMAT JSON)
+    assert any('EXPLAIN (ANALYZE, FORMAT JSON)' in statement for statement in statements)
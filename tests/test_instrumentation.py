@@ -0,0 +1,79 @@
+import json
+import pandas as pd
+import pytest
+
+from _06_multinational_retail_data_centralisation.instrumentation import PipelineMetrics
+
+
+class Cleaner:
+    """
+    Stands in for DataCleaning and DataExtractor, with a method returning a DataFrame, one returning chunks and one failing.
+    """
+    def drop_nulls(self, df):
+        return df.dropna()
+
+    def stream_chunks(self, df, chunksize: int):
+        for first_row in range(0, len(df), chunksize):
+            yield df.iloc[first_row:first_row + chunksize]
+
+    def fail(self, df):
+        raise ValueError('bad table')
+
+
+@pytest.fixture
+def stores_df():
+    return pd.DataFrame({'store_code': ['BL-1', 'LD-2', None, 'YK-4', 'MN-5'], 'staff_numbers': [10, 20, 30, 40, 50]})
+
+
+def test_steps_are_recorded_under_their_stage(tmp_path, stores_df):
+    metrics = PipelineMetrics(metrics_path=str(tmp_path / 'pipeline_metrics.json'))
+    cleaner = metrics.instrument_object(Cleaner())
+
+    with metrics.stage('3. ETL of Store Details'):
+        cleaner.drop_nulls(stores_df)
+    cleaner.drop_nulls(stores_df.iloc[:2])
+
+    [stage_step, step] = metrics.step_records
+    assert stage_step['stage'] == '3. ETL of Store Details' and step['stage'] is None
+    assert (stage_step['step'], stage_step['status'], stage_step['rows_in'], stage_step['rows_out']) == ('Cleaner.drop_nulls', 'succeeded', 5, 4)
+    assert stage_step['bytes_in'] == stores_df.memory_usage().sum()
+    assert [stage_record['stage'] for stage_record in metrics.stage_records] == ['3. ETL of Store Details']
+
+    metrics.save(extra={'pool_stats': {}})
+    with open(tmp_path / 'pipeline_metrics.json') as metrics_file:
+        saved_metrics = json.load(metrics_file)
+    assert len(saved_metrics['steps']) == 2 and 'pool_stats' in saved_metrics
+    assert metrics.step_records == [] and metrics.stage_records == []
+
+
+def test_generator_steps_are_recorded_once_exhausted(stores_df):
+    metrics = PipelineMetrics(metrics_path=None)
+    cleaner = metrics.instrument_object(Cleaner())
+
+    chunks = cleaner.stream_chunks(stores_df, chunksize=2)
+    assert metrics.step_records == []  # Nothing is read until the chunks are consumed
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+    [step] = metrics.step_records
+    assert (step['rows_in'], step['rows_out']) == (5, 5)
+    assert step['bytes_out'] == sum(stores_df.iloc[first_row:first_row + 2].memory_usage().sum() for first_row in [0, 2, 4])
+
+
+def test_failed_steps_are_recorded_and_raised(stores_df):
+    metrics = PipelineMetrics(metrics_path=None)
+    cleaner = metrics.instrument_object(Cleaner())
+
+    with pytest.raises(ValueError, match='bad table'):
+        cleaner.fail(stores_df)
+
+    [step] = metrics.step_records
+    assert (step['status'], step['rows_out'], step['error']) == ('failed', None, "ValueError('bad table')")
+
+
+def test_deep_memory_usage_counts_strings(stores_df):
+    shallow_rows, shallow_bytes = PipelineMetrics(metrics_path=None).describe(stores_df)
+    deep_rows, deep_bytes = PipelineMetrics(metrics_path=None, deep_memory_usage=True).describe((stores_df, 'store_details'))
+
+    assert shallow_rows == deep_rows == 5
+    assert deep_bytes > shallow_bytes
+    assert PipelineMetrics(metrics_path=None, measure_bytes=False).describe(stores_df) == (5, None)
@@ -0,0 +1,85 @@
+import io
+import pandas as pd
+import pytest
+
+from _06_multinational_retail_data_centralisation.data_cleaning import DataCleaning
+from _06_multinational_retail_data_centralisation import json_streaming
+from _06_multinational_retail_data_centralisation.json_streaming import JsonStreamReader
+from _06_multinational_retail_data_centralisation.synthetic_data import SyntheticDataGenerator
+from tests.conftest import raw_csv_folder_path
+
+time_period_filter = ('time_period', DataCleaning.time_period_mask)
+
+
+@pytest.fixture(scope='module')
+def date_details_df():
+    return SyntheticDataGenerator(raw_csv_folder_path=raw_csv_folder_path).date_details(5000)
+
+
+def read_json(json_path, **read_json_kwargs):
+    return pd.read_json(json_path, dtype=False, convert_dates=False, **read_json_kwargs)  # JsonStreamReader keeps the values as they are in the document
+
+
+@pytest.mark.parametrize('row_filter', [None, time_period_filter])
+def test_read_json_table_matches_read_json(tmp_path, date_details_df, row_filter):
+    json_path = str(tmp_path / 'date_details.json')
+    date_details_df.to_json(json_path)
+    expected_df = read_json(json_path)
+    if row_filter is not None:
+        expected_df = expected_df[DataCleaning.time_period_mask(expected_df['time_period'])]
+        assert len(expected_df) < len(date_details_df)  # The generated table has invalid rows
+
+    pd.testing.assert_frame_equal(JsonStreamReader.read_json_table(json_path, row_filter=row_filter), expected_df)
+
+
+@pytest.mark.parametrize('row_filter', [None, time_period_filter])
+def test_read_json_table_matches_read_json_lines(tmp_path, date_details_df, row_filter):
+    json_path = str(tmp_path / 'date_details.ndjson')
+    date_details_df.to_json(json_path, orient='records', lines=True)
+    expected_df = read_json(json_path, lines=True)
+    if row_filter is not None:
+        expected_df = expected_df[DataCleaning.time_period_mask(expected_df['time_period'])]
+
+    pd.testing.assert_frame_equal(JsonStreamReader.read_json_table(json_path, row_filter=row_filter, batch_size=700), expected_df)
+
+
+def test_read_columns_across_blocks_with_reordered_keys():
+    document = ('{"time_period": {"0": "Evening", "1": "Morn\\"ing", "2": "NULL", "10": "Midday"},'
+                ' "day": {"10": "4", "2": "NULL", "1": "{2}", "0": "1"}}')
+    expected_df = read_json(io.StringIO(document))
+
+    for buffer_size in [1, 7, 1024]:  # Objects and strings split across reads
+        pd.testing.assert_frame_equal(JsonStreamReader.read_columns(io.BytesIO(document.encode()), buffer_size=buffer_size), expected_df)
+    pd.testing.assert_frame_equal(JsonStreamReader.read_columns(io.BytesIO(document.encode()), time_period_filter, buffer_size=7),
+                                  expected_df.loc[[0, 10]])
+
+
+@pytest.mark.parametrize('row_filter', [None, time_period_filter])
+def test_read_columns_aligns_columns_with_the_same_first_and_last_keys(row_filter):
+    document = ('{"day": {"0": "1", "1": "2", "2": "3", "3": "4"},'
+                ' "time_period": {"0": "Evening", "2": "Morning", "1": "NULL", "3": "Midday"},'
+                ' "month": {"0": "5", "2": "7", "1": "6", "3": {"nested": [8]}},'
+                ' "year": {"0": "2001", "3": "2004"}}')  # The middle rows swapped, then rows missing
+    expected_df = read_json(io.StringIO(document))
+    if row_filter is not None:
+        expected_df = expected_df.loc[[0, 2, 3]]
+
+    pd.testing.assert_frame_equal(JsonStreamReader.read_columns(io.BytesIO(document.encode()), row_filter), expected_df)
+
+
+def test_read_json_table_reads_whole_documents_without_ijson(tmp_path, monkeypatch, date_details_df):
+    json_path = str(tmp_path / 'date_details.json')
+    date_details_df.to_json(json_path)
+    expected_df = JsonStreamReader.read_json_table(json_path, row_filter=time_period_filter)
+
+    monkeypatch.setattr(json_streaming, 'ijson', None)
+    pd.testing.assert_frame_equal(JsonStreamReader.read_json_table(json_path, row_filter=time_period_filter), expected_df)
+
+
+def test_streamed_date_events_clean_like_read_json(tmp_path, date_details_df):
+    json_path = str(tmp_path / 'date_details.json')
+    date_details_df.to_json(json_path)
+    expected_df = DataCleaning.clean_date_data(pd.read_json(json_path))  # Converting the dtypes, as the pipeline does without stream_date_events
+
+    streamed_df = JsonStreamReader.read_json_table(json_path, row_filter=time_period_filter)
+    pd.testing.assert_frame_equal(DataCleaning.clean_date_data(streamed_df), expected_df)
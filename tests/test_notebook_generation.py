@@ -0,0 +1,43 @@
+import os
+import pandas as pd
+import pytest
+
+from _06_multinational_retail_data_centralisation.notebook_generation import NotebookGenerator
+from _06_multinational_retail_data_centralisation.table_staging import TableStaging
+
+nbformat = pytest.importorskip('nbformat')
+
+
+def add_stores_notebook(notebooks, notebook_path, staged_filename, stores_df):
+    notebooks.add_table_notebook(notebook_path,
+                                 NotebookGenerator.table_cell_code('store_details', TableStaging.read_statement(staged_filename), staged_filename),
+                                 NotebookGenerator.dataframe_schema(stores_df))
+
+
+def test_generate_notebooks_writes_only_changed_notebooks(tmp_path):
+    notebook_path = str(tmp_path / 'notebooks' / 'store_details.ipynb')
+    stores_df = pd.DataFrame({'store_code': ['BL-1'], 'staff_numbers': [10]})
+    notebooks = NotebookGenerator()
+
+    add_stores_notebook(notebooks, notebook_path, 'store_details.parquet', stores_df)
+    assert not os.path.exists(notebook_path)  # Nothing is written while the pipeline runs
+    notebooks.generate_notebooks()
+    notebook = nbformat.read(notebook_path, as_version=4)
+    assert "store_details_df = pd.read_parquet(r'store_details.parquet')" in notebook.cells[0].source
+    written_time = os.path.getmtime(notebook_path)
+
+    add_stores_notebook(notebooks, notebook_path, 'store_details.parquet', stores_df.assign(staff_numbers=[20]))
+    notebooks.generate_notebooks()
+    assert os.path.getmtime(notebook_path) == written_time  # Same schema and location, so not rewritten
+
+    os.utime(notebook_path, (0, 0))
+    add_stores_notebook(notebooks, notebook_path, 'store_details.parquet', stores_df.astype({'staff_numbers': 'float64'}))
+    notebooks.generate_notebooks()
+    assert os.path.getmtime(notebook_path) != 0  # A changed dtype rewrites it
+
+    os.utime(notebook_path, (0, 0))
+    add_stores_notebook(notebooks, notebook_path, 'store_details.csv', stores_df.astype({'staff_numbers': 'float64'}))
+    notebooks.generate_notebooks()
+    assert os.path.getmtime(notebook_path) != 0  # So does a changed location
+    assert "pd.read_csv(r'store_details.csv')" in nbformat.read(notebook_path, as_version=4).cells[0].source
+    assert notebooks.pending_notebooks == []
@@ -0,0 +1,68 @@
+import os
+import pandas as pd
+import pytest
+import tabula
+
+from _06_multinational_retail_data_centralisation.data_extraction import DataExtractor
+from _06_multinational_retail_data_centralisation.extraction_cache import ExtractionCache
+
+pypdf = pytest.importorskip('pypdf')
+
+
+def blank_pdf(pdf_path, number_of_pages: int):
+    pdf_writer = pypdf.PdfWriter()
+    for _ in range(number_of_pages):
+        pdf_writer.add_blank_page(width=100, height=100)
+    pdf_writer.write(pdf_path)
+    return str(pdf_path)
+
+
+def test_pdf_page_count_of_incrementally_updated_pdf(tmp_path):
+    pdf_path = blank_pdf(tmp_path / 'card_details.pdf', 3)
+    pdf_writer = pypdf.PdfWriter(pdf_path, incremental=True)
+    pdf_writer.pages[0].rotate(90)  # The update saves a second copy of the first page object
+    pdf_writer.add_blank_page(width=100, height=100)
+    pdf_writer.write(tmp_path / 'card_details_updated.pdf')
+
+    assert DataExtractor.pdf_page_count(pdf_path) == 3
+    assert DataExtractor.pdf_page_count(str(tmp_path / 'card_details_updated.pdf')) == 4
+
+
+@pytest.fixture
+def fake_tabula(monkeypatch):
+    """
+    tabula.read_pdf returning one table per page, holding the page number, and recording the pages of each read.
+    """
+    reads = []
+
+    def read_pdf(pdf_path, pages):
+        pages = list(range(1, DataExtractor.pdf_page_count(pdf_path) + 1)) if pages == 'all' else pages
+        reads.append(pages)
+        return [pd.DataFrame({'card_number': [f'{page}000'], 'page': [page]}) for page in pages]
+
+    monkeypatch.setattr(tabula, 'read_pdf', read_pdf)
+    return reads
+
+
+def test_stream_pdf_pages_yields_each_range_in_page_order(tmp_path, fake_tabula):
+    pdf_path = blank_pdf(tmp_path / 'card_details.pdf', 25)
+
+    page_ranges = list(DataExtractor.stream_pdf_pages(pdf_path, max_workers=3, pages_per_task=10))
+
+    assert [page_range_df['page'].tolist() for page_range_df in page_ranges] == [list(range(1, 11)), list(range(11, 21)), list(range(21, 26))]
+    assert sorted(map(len, fake_tabula)) == [5, 10, 10]
+
+
+def test_retrieve_pdf_data_streams_ranges_to_csv_and_cache(tmp_path, fake_tabula):
+    pdf_path = blank_pdf(tmp_path / 'card_details.pdf', 15)
+    cache = ExtractionCache(cache_folder_path=str(tmp_path / 'cache'))
+
+    for _ in range(2):  # The second run is served from the cache
+        page_ranges, table_name, raw_staged_filename = DataExtractor.retrieve_pdf_data(pdf_path, str(tmp_path / 'raw'), str(tmp_path / 'notebooks'),
+                                                                                     cache=cache, max_workers=2, stream=True)
+        assert [len(page_range_df) for page_range_df in page_ranges] == [10, 5]
+        assert table_name == 'card_details'
+        pd.testing.assert_frame_equal(pd.read_csv(raw_staged_filename), pd.DataFrame({'card_number': [page * 1000 for page in range(1, 16)], 'page': list(range(1, 16))}))
+
+    assert len(fake_tabula) == 2  # The PDF was only read once
+    assert os.path.dirname(raw_staged_filename) == str(tmp_path / 'raw')
@@ -0,0 +1,72 @@
+import pytest
+import threading
+
+from _06_multinational_retail_data_centralisation.pipeline_scheduler import PipelineScheduler
+
+
+def recording_stage(events: list, stage_name: str, barrier: threading.Barrier = None):
+    """
+    A stage appending its start and end to events, optionally waiting at a barrier in between.
+    """
+    def stage_function():
+        events.append(('start', stage_name))
+        if barrier is not None:
+            barrier.wait(timeout=5)  # Only passes if the other stages at the barrier run at the same time
+        events.append(('end', stage_name))
+    return stage_function
+
+
+def failing_stage():
+    raise RuntimeError('extraction failed')
+
+
+def test_run_starts_stages_after_their_dependencies():
+    events = []
+    barrier = threading.Barrier(2)
+    pipeline = PipelineScheduler()
+    pipeline.add_stage('users', recording_stage(events, 'users', barrier))
+    pipeline.add_stage('orders', recording_stage(events, 'orders', barrier))
+    pipeline.add_stage('star_schema', recording_stage(events, 'star_schema'), depends_on=['users', 'orders'])
+    pipeline.add_stage('aggregates', recording_stage(events, 'aggregates'), depends_on=['star_schema'])
+
+    stage_results = pipeline.run(max_workers=4)
+
+    assert {result['status'] for result in stage_results.values()} == {'succeeded'}
+    assert events.index(('start', 'star_schema')) > max(events.index(('end', 'users')), events.index(('end', 'orders')))
+    assert events.index(('start', 'aggregates')) > events.index(('end', 'star_schema'))
+
+
+def test_run_skips_the_dependents_of_a_failed_stage():
+    events = []
+    pipeline = PipelineScheduler()
+    pipeline.add_stage('users', recording_stage(events, 'users'))
+    pipeline.add_stage('orders', failing_stage)
+    pipeline.add_stage('star_schema', recording_stage(events, 'star_schema'), depends_on=['users', 'orders'])
+    pipeline.add_stage('aggregates', recording_stage(events, 'aggregates'), depends_on=['star_schema'])
+    pipeline.add_stage('products', recording_stage(events, 'products'), depends_on=['users'])
+
+    stage_results = pipeline.run(max_workers=2)
+
+    assert {stage_name: result['status'] for stage_name, result in stage_results.items()} == {
+        'users': 'succeeded', 'orders': 'failed', 'star_schema': 'skipped', 'aggregates': 'skipped', 'products': 'succeeded'}
+    assert isinstance(stage_results['orders']['error'], RuntimeError)
+    assert ('start', 'star_schema') not in events and ('start', 'aggregates') not in events
+
+
+def test_add_stage_rejects_unknown_dependencies():
+    pipeline = PipelineScheduler()
+    with pytest.raises(ValueError, match='have not been added'):
+        pipeline.add_stage('star_schema', failing_stage, depends_on=['orders'])
+
+
+def test_select_stages_drops_dependencies_on_unselected_stages():
+    events = []
+    pipeline = PipelineScheduler()
+    pipeline.add_stage('orders', failing_stage)
+    pipeline.add_stage('star_schema', recording_stage(events, 'star_schema'), depends_on=['orders'])
+
+    stage_results = pipeline.select_stages(['star_schema']).run(max_workers=1)
+
+    assert stage_results == {'star_schema': {'status': 'succeeded', 'wall_time': stage_results['star_schema']['wall_time'], 'error': None}}
+    with pytest.raises(ValueError, match='Unknown stages'):
+        pipeline.select_stages(['dates'])
@@ -0,0 +1,68 @@
+import gzip
+import io
+import pandas as pd
+import pytest
+
+from _06_multinational_retail_data_centralisation.data_extraction import DataExtractor
+from _06_multinational_retail_data_centralisation.s3_range_reader import S3RangeReader
+from _06_multinational_retail_data_centralisation.synthetic_data import SyntheticDataGenerator
+from tests.conftest import raw_csv_folder_path
+
+moto = pytest.importorskip('moto')
+from botocore.exceptions import ClientError
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    """
+    A mocked S3 bucket 'data-handling-public' holding a generated products table as 'products.csv' and 'products.csv.gz'.
+    Yields the S3 client and the CSV bytes of the table.
+    """
+    for variable_name, value in [('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'), ('AWS_DEFAULT_REGION', 'us-east-1')]:
+        monkeypatch.setenv(variable_name, value)
+    monkeypatch.setattr(DataExtractor, 's3_client_instance', None)  # Create the client inside the mock
+    csv_bytes = SyntheticDataGenerator(raw_csv_folder_path=raw_csv_folder_path).products_details(2000).to_csv().encode('utf-8')
+    with moto.mock_aws():
+        s3 = DataExtractor.s3_client()
+        s3.create_bucket(Bucket='data-handling-public')
+        s3.put_object(Bucket='data-handling-public', Key='products.csv', Body=csv_bytes)
+        s3.put_object(Bucket='data-handling-public', Key='products.csv.gz', Body=gzip.compress(csv_bytes))
+        yield s3, csv_bytes
+
+
+@pytest.mark.parametrize('object_key', ['products.csv', 'products.csv.gz'])
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_read_s3_object_matches_read_csv(s3_bucket, object_key, max_workers):
+    _, csv_bytes = s3_bucket
+    expected_df = pd.read_csv(io.BytesIO(csv_bytes), index_col=0)
+
+    products_df = DataExtractor.read_s3_object(f's3://data-handling-public/{object_key}', max_workers=max_workers, part_size=4096, index_col=0)
+    pd.testing.assert_frame_equal(products_df, expected_df)
+
+    product_chunks = DataExtractor.read_s3_object(f's3://data-handling-public/{object_key}', chunksize=300, max_workers=max_workers, part_size=4096, index_col=0)
+    pd.testing.assert_frame_equal(pd.concat(product_chunks), pd.concat(pd.read_csv(io.BytesIO(csv_bytes), index_col=0, chunksize=300)))  # Each chunk infers its own dtypes
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_read_s3_object_fails_when_overwritten(s3_bucket, max_workers):
+    s3, csv_bytes = s3_bucket
+    s3_object = s3.head_object(Bucket='data-handling-public', Key='products.csv')
+    s3.put_object(Bucket='data-handling-public', Key='products.csv', Body=csv_bytes.replace(b'\n', b'\r\n'))
+
+    with pytest.raises(ClientError, match='PreconditionFailed'):
+        DataExtractor.read_s3_object('s3://data-handling-public/products.csv', max_workers=max_workers, part_size=4096, s3_object=s3_object)
+
+
+def test_range_reader_fails_when_overwritten_during_download(s3_bucket):
+    s3, csv_bytes = s3_bucket
+    s3_object = s3.head_object(Bucket='data-handling-public', Key='products.csv')
+    range_reader = S3RangeReader(s3, 'data-handling-public', 'products.csv', s3_object['ContentLength'], part_size=4096, max_workers=1,
+                                 etag=s3_object['ETag'])
+    assert range_reader.read(4096) == csv_bytes[:4096]  # The second part is requested once the first is handed on
+
+    range_reader.pending_parts[0].result()  # Let the part requested before the overwrite finish
+    s3.put_object(Bucket='data-handling-public', Key='products.csv', Body=csv_bytes.replace(b'\n', b'\r\n'))
+    range_reader.read(4096)
+    with pytest.raises(ClientError, match='PreconditionFailed'):
+        range_reader.read(4096)
+    range_reader.close()
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+import main
+from _06_multinational_retail_data_centralisation.data_cleaning import DataCleaning
+from _06_multinational_retail_data_centralisation.dtype_planner import DtypePlanner
+from _06_multinational_retail_data_centralisation.sales_aggregates import SalesAggregates
+from _06_multinational_retail_data_centralisation.synthetic_data import SyntheticDataGenerator
+from tests.conftest import raw_csv_folder_path
+
+
+@pytest.fixture
+def sales_database(sqlite_engine, monkeypatch):
+    """
+    A SQLite sales_data database with the dimension tables loaded by main.load_dimension and the first 2000 of 3000 generated orders.
+    Yields a function appending orders to 'orders_table' and the cleaned products and stores.
+    """
+    generator = SyntheticDataGenerator(raw_csv_folder_path=raw_csv_folder_path)
+    orders_df = generator.orders_table(3000)
+    date_details_df = generator.date_details(3000)
+    date_details_df['date_uuid'] = orders_df['date_uuid'].to_numpy()  # One date event per order, as in the real tables
+    cleaned_orders_df = DataCleaning.clean_orders_data(orders_df)
+    cleaned_products_df = DataCleaning.convert_product_weights(DataCleaning.clean_products_data(generator.read_raw_table('products_details', index_col=0)))
+    cleaned_stores_df = DataCleaning.called_clean_store_data(generator.read_raw_table('store_details'))
+
+    monkeypatch.setattr(main, 'get_engines', lambda: (None, sqlite_engine))
+    main.load_dimension(cleaned_products_df, 'dim_products')
+    main.load_dimension(cleaned_stores_df, 'dim_store_details')
+    main.load_dimension(DataCleaning.clean_date_data(date_details_df), 'dim_date_times')
+
+    def add_orders(first_row: int, last_row: int):
+        planned_df, column_types = DtypePlanner.plan_table(cleaned_orders_df.iloc[first_row:last_row], 'orders_table')
+        planned_df.to_sql('orders_table', sqlite_engine, if_exists='append', index=False, dtype=column_types)
+
+    add_orders(0, 2000)
+    yield add_orders, cleaned_products_df, cleaned_stores_df
+
+
+def assert_aggregates_match_joins(engine2):
+    for function_name in SalesAggregates.questions.values():
+        pd.testing.assert_frame_equal(getattr(SalesAggregates, function_name)(engine2, use_aggregates=True),
+                                      getattr(SalesAggregates, function_name)(engine2, use_aggregates=False), check_dtype=False)
+
+
+def test_incremental_refresh_matches_joins(sqlite_engine, sales_database):
+    add_orders, _, _ = sales_database
+    assert SalesAggregates.refresh(sqlite_engine) == 2000
+    assert_aggregates_match_joins(sqlite_engine)
+
+    add_orders(2000, 3000)
+    assert SalesAggregates.refresh(sqlite_engine) == 1000  # Only the new orders are aggregated
+    assert_aggregates_match_joins(sqlite_engine)
+    assert SalesAggregates.refresh(sqlite_engine) == 0
+
+
+def test_changed_dimensions_rebuild_the_aggregates(sqlite_engine, sales_database):
+    add_orders, cleaned_products_df, cleaned_stores_df = sales_database
+    SalesAggregates.refresh(sqlite_engine)
+
+    main.load_dimension(cleaned_products_df, 'dim_products')  # Unchanged rows keep the aggregates
+    main.load_dimension(cleaned_stores_df, 'dim_store_details')
+    assert SalesAggregates.refresh(sqlite_engine) == 0
+
+    changed_products_df = cleaned_products_df.copy()
+    changed_products_df['product_price'] = '£1.00'
+    main.load_dimension(changed_products_df, 'dim_products')
+    add_orders(2000, 3000)
+    assert SalesAggregates.refresh(sqlite_engine) == 3000  # Rebuilt from every order
+    assert_aggregates_match_joins(sqlite_engine)
+
+    changed_stores_df = cleaned_stores_df.copy()
+    changed_stores_df['store_type'] = 'Local'
+    main.load_dimension(changed_stores_df, 'dim_store_details')
+    assert SalesAggregates.refresh(sqlite_engine) == 3000
+    assert_aggregates_match_joins(sqlite_engine)
@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+
+import main
+
+
+def test_schema_first_load_needs_typed_upload(monkeypatch):
+    monkeypatch.setattr(main, 'schema_first_load', True)
+    monkeypatch.setattr(main, 'typed_upload', False)
+    monkeypatch.setattr(main, 'get_engines', lambda: pytest.fail('no engine is needed to reject the settings'))
+
+    with pytest.raises(ValueError, match='schema_first_load needs typed_upload'):
+        main.main(['--list'])
+    with pytest.raises(ValueError, match='schema_first_load needs typed_upload'):
+        main.upload_table(pd.DataFrame({'user_uuid': ['u1']}), 'dim_users')
+
+
+def test_settings_are_accepted_together_or_without_schema_first_load(monkeypatch, capsys):
+    for schema_first_load, typed_upload in [(True, True), (False, False), (False, True)]:
+        monkeypatch.setattr(main, 'schema_first_load', schema_first_load)
+        monkeypatch.setattr(main, 'typed_upload', typed_upload)
+        main.main(['--list'])
+
+    assert capsys.readouterr().out.count('7. Star-schema') == 3
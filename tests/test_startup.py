@@ -0,0 +1,32 @@
+import json
+import subprocess
+import sys
+
+import main
+from _06_multinational_retail_data_centralisation.startup_benchmark import StartupBenchmark
+from tests.conftest import repo_root
+
+
+def test_importing_main_reads_nothing_and_defers_the_stage_modules(tmp_path):
+    check_import = ("import json, sys; sys.path.insert(0, sys.argv[1]); import main; "
+                    "print(json.dumps({'engines': len(main.engines), 'caches': len(main.extraction_caches), 'modules': list(sys.modules)}))")
+    completed = subprocess.run([sys.executable, '-c', check_import, repo_root], cwd=tmp_path, capture_output=True, text=True, check=True)
+    imported = json.loads(completed.stdout.splitlines()[-1])
+
+    assert imported['engines'] == 0 and imported['caches'] == 0
+    assert not set(StartupBenchmark.deferred_modules) & set(imported['modules'])
+    assert list(tmp_path.iterdir()) == []  # No extraction cache folder or metrics file
+
+
+def test_extraction_cache_is_created_once_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'extraction_caches', {})
+    monkeypatch.setattr(main, 'extraction_cache_options', {**main.extraction_cache_options, 'cache_folder_path': str(tmp_path / 'cache')})
+
+    monkeypatch.setattr(main, 'use_extraction_cache', False)
+    assert main.get_extraction_cache() is None
+    assert not (tmp_path / 'cache').exists()
+
+    monkeypatch.setattr(main, 'use_extraction_cache', True)
+    extraction_cache = main.get_extraction_cache()
+    assert extraction_cache is not None and main.get_extraction_cache() is extraction_cache
+    assert (tmp_path / 'cache').exists()
@@ -0,0 +1,65 @@
+import json
+import pandas as pd
+import pytest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from _06_multinational_retail_data_centralisation.data_extraction import DataExtractor
+
+pytest.importorskip('requests')
+
+
+@pytest.fixture
+def store_api():
+    """
+    A stub of the stores API on localhost. GET /store_details/<n> returns store n; the first request for each store in
+    'failures' is answered with that status code instead, and store 'missing' always answers 404.
+    Yields the endpoint pattern and the list of requested paths.
+    """
+    failures = {1: 429, 3: 503, 4: 500}
+    missing = 6
+    requested_paths = []
+
+    class StoreHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested_paths.append(self.path)
+            store_number = int(self.path.rsplit('/', 1)[-1])
+            status_code = failures.pop(store_number, None) or (404 if store_number == missing else 200)
+            body = json.dumps({'index': store_number, 'store_code': f"ST-{store_number}"} if status_code == 200 else {'message': 'error'}).encode('utf-8')
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StoreHandler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/store_details/{{store_number}}", requested_paths
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_retrieve_stores_data_retries_and_keeps_store_order(tmp_path, store_api, max_workers):
+    endpoint, requested_paths = store_api
+
+    stores_df, table_name, staged_filename = DataExtractor.retrieve_stores_data(endpoint, {}, 10, str(tmp_path), str(tmp_path),
+                                                                                max_workers=max_workers, backoff_factor=0)
+
+    assert table_name == 'store_details'
+    assert stores_df['index'].tolist() == [0, 1, 2, 3, 4, 5, 7, 8, 9]  # Retried stores kept in place, the missing store left out
+    assert len(requested_paths) == 10 + 3  # One retry for each 429/5xx answer, none for the 404
+    pd.testing.assert_frame_equal(pd.read_csv(staged_filename), stores_df)
+
+
+def test_retrieve_a_store_gives_up_after_max_retries(store_api):
+    endpoint, requested_paths = store_api
+
+    with DataExtractor.create_session(max_retries=0) as session:
+        assert DataExtractor.retrieve_a_store(session, endpoint, {}, 1) is None  # 429 returned without a retry
+        assert DataExtractor.retrieve_a_store(session, endpoint, {}, 1) == {'index': 1, 'store_code': 'ST-1'}
+    assert len(requested_paths) == 2
@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+
+from _06_multinational_retail_data_centralisation.data_cleaning import DataCleaning
+from _06_multinational_retail_data_centralisation.synthetic_data import SyntheticDataGenerator
+from tests.conftest import raw_csv_folder_path
+
+iso_date = r'^\d{4}-\d{2}-\d{2}$'
+
+
+@pytest.fixture(scope='module')
+def generator():
+    return SyntheticDataGenerator(raw_csv_folder_path=raw_csv_folder_path)
+
+
+def not_iso_dates(column):
+    return column.dropna().astype(str)[~column.dropna().astype(str).str.match(iso_date)]
+
+
+def test_legacy_users_keep_the_dirty_patterns(generator):
+    users_df = generator.legacy_users(10000)
+
+    assert (users_df['country_code'] == 'GGB').any()
+    assert (users_df['join_date'] == 'NULL').any()
+    assert not_iso_dates(users_df['join_date']).str.match(r'^\d{4} \w+ \d{2}$').any()  # e.g. '2008 December 05'
+    assert users_df['user_uuid'].is_unique
+
+    cleaned_df = DataCleaning.clean_user_data(users_df)
+    assert 0 < len(cleaned_df) < len(users_df)
+    assert 'GGB' not in set(cleaned_df['country_code'])
+    assert not_iso_dates(cleaned_df['join_date']).empty
+
+
+def test_card_details_keep_the_dirty_patterns(generator):
+    cards_df = generator.card_details(10000)
+
+    assert cards_df['card_number'].astype(str).str.contains('?', regex=False).any()
+    assert not not_iso_dates(cards_df['date_payment_confirmed']).empty
+
+    cleaned_df = DataCleaning.clean_card_data(cards_df)
+    assert 0 < len(cleaned_df) < len(cards_df)
+    assert not cleaned_df['card_number'].astype(str).str.contains('?', regex=False).any()
+    assert not_iso_dates(cleaned_df['date_payment_confirmed']).empty
+
+
+def test_store_details_keep_the_dirty_patterns(generator):
+    stores_df = generator.store_details(5000)
+
+    assert {'eeEurope', 'eeAmerica'} <= set(stores_df['continent'])
+    assert not stores_df['staff_numbers'].astype(str).str.isdigit().all()  # e.g. '3n9'
+    assert not_iso_dates(stores_df['opening_date']).str.match(r'^\w+ \d{4} \d{2}$').any()  # e.g. 'March 2015 02'
+
+    cleaned_df = DataCleaning.called_clean_store_data(stores_df)
+    assert 0 < len(cleaned_df) < len(stores_df)
+    assert not {'eeEurope', 'eeAmerica'} & set(cleaned_df['continent'])
+    assert not_iso_dates(cleaned_df['opening_date']).empty
+
+
+def test_products_details_keep_the_dirty_patterns(generator):
+    products_df = generator.products_details(5000)
+
+    assert products_df['weight'].astype(str).str.contains(' x ').any()  # e.g. '12 x 100g'
+    assert {'kg', 'ml'} <= set(products_df['weight'].astype(str).str[-2:])
+    assert products_df['uuid'].is_unique
+
+    cleaned_df = DataCleaning.convert_product_weights(DataCleaning.clean_products_data(products_df))
+    assert 0 < len(cleaned_df) < len(products_df)
+    assert pd.api.types.is_float_dtype(cleaned_df['weight_(kg)'])
+    assert not_iso_dates(cleaned_df['date_added']).empty
+
+
+def test_orders_table_keeps_the_dirty_columns(generator):
+    orders_df = generator.orders_table(3000)
+
+    assert {'level_0', 'first_name', 'last_name', '1'} <= set(orders_df.columns)
+    assert orders_df['date_uuid'].is_unique
+
+    cleaned_df = DataCleaning.clean_orders_data(orders_df)
+    assert len(cleaned_df) == len(orders_df)
+    assert not {'first_name', 'last_name', '1'} & set(cleaned_df.columns)
+
+
+def test_date_details_keep_the_dirty_rows(generator):
+    dates_df = generator.date_details(10000)
+
+    dirty_rows = ~dates_df['time_period'].isin(['Evening', 'Morning', 'Midday', 'Late_Hours'])
+    assert (dates_df['time_period'] == 'NULL').any()
+    assert dates_df.loc[dirty_rows & (dates_df['time_period'] != 'NULL'), 'time_period'].str.fullmatch(r'[A-Z0-9]{10}').all()
+
+    cleaned_df = DataCleaning.clean_date_data(dates_df)
+    assert len(cleaned_df) == (~dirty_rows).sum()
+
+
+def test_tables_are_reproducible_for_a_seed():
+    pd.testing.assert_frame_equal(SyntheticDataGenerator(raw_csv_folder_path, seed=3).store_details(200),
+                                  SyntheticDataGenerator(raw_csv_folder_path, seed=3).store_details(200))
+    assert not SyntheticDataGenerator(raw_csv_folder_path, seed=4).store_details(200).equals(
+        SyntheticDataGenerator(raw_csv_folder_path, seed=3).store_details(200))
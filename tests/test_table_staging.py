@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from _06_multinational_retail_data_centralisation.table_staging import TableStaging
+
+pytest.importorskip('pyarrow')
+
+
+def table_chunks(chunk_sizes):
+    """
+    Consecutive chunks of a table, indexed as DataExtractor.stream_rds_table indexes them. The 'note' column is empty in the first chunk.
+    """
+    rows_read = 0
+    for chunk_size in chunk_sizes:
+        rows = np.arange(rows_read, rows_read + chunk_size)
+        yield pd.DataFrame({'product_quantity': rows % 7,
+                            'price': rows * 0.5,
+                            'date_added': pd.Timestamp('2024-01-01') + pd.to_timedelta(rows, unit='D'),
+                            'note': [None] * chunk_size if rows_read == 0 else [f"note {row}" for row in rows]},
+                           index=rows)
+        rows_read += chunk_size
+
+
+@pytest.mark.parametrize('staging_format', ['parquet', 'feather', 'csv'])
+@pytest.mark.parametrize('index', [False, True])
+def test_save_chunks_matches_save_table(tmp_path, staging_format, index):
+    chunk_sizes = [3, 5, 4]
+    passed_chunks = list(TableStaging.save_chunks(table_chunks(chunk_sizes), str(tmp_path / 'chunks'), 'orders_table', staging_format,
+                                                  index=index, export_csv=True))
+    table_df = pd.concat(table_chunks(chunk_sizes))
+    pd.testing.assert_frame_equal(pd.concat(passed_chunks), table_df)  # The chunks are passed on unchanged
+
+    csv_filename = TableStaging.table_path(str(tmp_path / 'chunks'), 'orders_table', 'csv')
+    with open(csv_filename) as csv_file:
+        assert csv_file.read() == table_df.to_csv(index=index)
+    if staging_format != 'csv':
+        staged_df = TableStaging.read_table(TableStaging.table_path(str(tmp_path / 'chunks'), 'orders_table', staging_format))
+        pd.testing.assert_frame_equal(staged_df, table_df if index else table_df.reset_index(drop=True))
+
+
+@pytest.mark.parametrize('staging_format', ['parquet', 'feather'])
+def test_save_chunks_widens_categories_and_mixed_columns(tmp_path, staging_format):
+    first_chunk = pd.DataFrame({'store_type': pd.Categorical(['Local', 'Web Portal']), 'card_number': ['4971858637664481', 'NULL']})
+    second_chunk = pd.DataFrame({'store_type': pd.Categorical([f"store {number}" for number in range(300)]),  # Beyond an 8-bit index
+                                 'card_number': ['30060773296197', 3.5, np.nan] * 100},  # Strings mixed with floats and NaN
+                                index=range(2, 302))
+
+    list(TableStaging.save_chunks([first_chunk, second_chunk], str(tmp_path), 'orders_table', staging_format))
+
+    staged_df = TableStaging.read_table(TableStaging.table_path(str(tmp_path), 'orders_table', staging_format))
+    assert staged_df['store_type'].dtype == 'category'
+    assert staged_df['store_type'].tolist() == ['Local', 'Web Portal'] + [f"store {number}" for number in range(300)]
+    assert staged_df['card_number'].tolist()[:5] == ['4971858637664481', 'NULL', '30060773296197', '3.5', None]
+
+
+def test_chunked_load_stages_the_same_tables(orders_pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'orders_incremental_load', False)  # Reload the whole table on each run
+    staged_tables = {}
+    for rds_chunksize in [None, 40]:
+        monkeypatch.setattr(main, 'rds_chunksize', rds_chunksize)
+        monkeypatch.setattr(main, 'raw_csv_folder_path', str(tmp_path / f"raw_{rds_chunksize}"))
+        monkeypatch.setattr(main, 'cleaned_csv_folder_path', str(tmp_path / f"cleaned_{rds_chunksize}"))
+        main.five_etl_orders_details()
+        staged_tables[rds_chunksize] = {table_name: TableStaging.read_table(TableStaging.table_path(folder_path, table_name, main.staging_format))
+                                        for folder_path, table_name in [(main.raw_csv_folder_path, 'orders_table'),
+                                                                        (main.cleaned_csv_folder_path, 'orders_table_data_cleaned')]}
+
+    for table_name in ['orders_table', 'orders_table_data_cleaned']:
+        pd.testing.assert_frame_equal(staged_tables[40][table_name], staged_tables[None][table_name])
+
+
+@pytest.mark.parametrize('staging_format', ['parquet', 'feather'])
+@pytest.mark.parametrize('index', [False, True])
+def test_save_table_round_trips(tmp_path, staging_format, index):
+    orders_df = pd.concat(table_chunks([3, 5])).iloc[::-1]  # An index that is not a range
+    orders_df['store_type'] = pd.Categorical(['Local', 'Web Portal'] * 4)
+    orders_df['card_number'] = pd.Series(['4971858637664481', 30060773296197, 'NULL', None] * 2, index=orders_df.index)  # Mixed types
+
+    staged_filename = TableStaging.save_table(orders_df, str(tmp_path), 'orders_table', staging_format, index=index)
+
+    expected_df = orders_df.astype({'card_number': 'string'})  # Mixed columns are staged as strings
+    pd.testing.assert_frame_equal(TableStaging.read_table(staged_filename), expected_df if index else expected_df.reset_index(drop=True))
+
+
+def test_csv_staging_saves_the_index_as_the_first_column(tmp_path):
+    orders_df = pd.concat(table_chunks([3])).iloc[::-1]
+    staged_filename = TableStaging.save_table(orders_df, str(tmp_path), 'orders_table', 'csv', index=True)
+
+    assert TableStaging.read_table(staged_filename).columns[0] == 'Unnamed: 0'
+    assert pd.read_csv(staged_filename, index_col=0).index.tolist() == [2, 1, 0]
+    assert TableStaging.read_statement(staged_filename, index_col=True) == f"pd.read_csv(r'{staged_filename}', index_col=0)"
+
+
+def test_unknown_staging_formats_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unknown staging format 'xlsx'"):
+        TableStaging.save_table(pd.DataFrame({'a': [1]}), str(tmp_path), 'orders_table', 'xlsx')